@@ -0,0 +1,259 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Set
+import resources.lib.logging as logging
+import resources.lib.task_management as task_management
+import resources.lib.tasks as tasks
+from resources.lib.library import MediaSource
+from resources.lib.scheduling import Scheduler
+from resources.lib.task_costs import TaskCostEstimator
+from resources.lib.write_tracking import WriteTracker
+
+
+class ChangeSet:
+    """
+    Compact set of changes for a single media source. Keeps directories that
+    need to be scanned, because files were created or moved into them, and
+    directories that need to be cleaned, because files were deleted or moved
+    out of them. None stands for the whole library.
+
+    Adding a change is a single set insert. Directories get deduplicated by the
+    sets and nested directories get collapsed into their top-most parent only
+    when the change set is turned into tasks.
+    """
+
+    def __init__(self):
+        self.updatePaths: Set[str] = set()
+        self.cleanPaths: Set[str] = set()
+
+    def toTasks(self, mediaSource: MediaSource, costEstimator: TaskCostEstimator = None) -> List:
+        """
+        Turns the changes into tasks. If a cost estimator is provided, it chooses
+        whether the directories are processed one by one, through their common
+        parent directory or as the whole library, whichever is expected to take
+        less time.
+        """
+
+        result = []
+        for taskType, paths in ((tasks.UpdateLibrary, self.updatePaths), (tasks.CleanLibrary, self.cleanPaths)):
+            if len(paths) == 0:
+                continue
+            collapsedPaths = _collapsePaths(paths)
+            if costEstimator is not None:
+                collapsedPaths = costEstimator.planScope(taskType, mediaSource, collapsedPaths)
+            result.append(taskType(mediaSource, collapsedPaths))
+
+        return result
+
+
+class ChangeBatcher:
+    """
+    Collects changes coming from file system events into a change set per media
+    source and hands them over to the task manager as consolidated tasks, once
+    BATCH_WAIT seconds have passed since the first change of a batch.
+
+    The batch timer is started by the first change and never restarted, so a
+    storm of events costs only set inserts until the batch gets flushed. The
+    timer runs on the scheduler thread, so no threads get created for batches.
+
+    Scans of directories with files that are still being written are held back,
+    so Kodi doesn't scan half-written files. Those are handed over once all the
+    files in the directory are written completely.
+
+    A batch is also held open while changes are still being probed for, like
+    added directories being walked for media files, so those changes get into
+    the batch of the event they came from, instead of a batch of their own.
+    """
+
+    BATCH_WAIT = 1
+
+    def __init__(
+        self, taskManager: task_management.TaskManager, scheduler: Scheduler, costEstimator: TaskCostEstimator = None
+    ):
+        self.logger = logging.getLogger(self)
+        self.taskManager = taskManager
+        self.scheduler = scheduler
+        self.costEstimator = costEstimator
+        self.changeSets: Dict[MediaSource, ChangeSet] = {}
+        self.changeSetsLock = threading.Lock()
+        self.batchTimer = None
+        # Number of probes that might still add changes to the batch
+        self.pendingProbes = 0
+        # Set when the batch was due while probes were still pending
+        self.flushDeferred = False
+        self.writeTracker = WriteTracker(scheduler, self._onWritesCompleted)
+
+    def addUpdate(self, mediaSource: MediaSource, path: str = None):
+        with self.changeSetsLock:
+            self._getChangeSet(mediaSource).updatePaths.add(path)
+
+    def addClean(self, mediaSource: MediaSource, path: str = None):
+        with self.changeSetsLock:
+            self._getChangeSet(mediaSource).cleanPaths.add(path)
+
+    def beginProbe(self):
+        """
+        Holds the batch open until endProbe gets called, starting the batch
+        timer if this is the first change of the batch.
+        """
+
+        with self.changeSetsLock:
+            self.pendingProbes += 1
+            if self.batchTimer is None and not self.flushDeferred:
+                self.batchTimer = self.scheduler.schedule(self.BATCH_WAIT, self.flush)
+
+    def endProbe(self):
+        """
+        Should be called once the probe has added its changes, if it had any.
+        Flushes the batch right away if it was due while the probe was pending.
+        """
+
+        with self.changeSetsLock:
+            self.pendingProbes -= 1
+            if self.pendingProbes > 0 or not self.flushDeferred:
+                return
+            self.flushDeferred = False
+            self.batchTimer = self.scheduler.schedule(0, self.flush)
+
+    def trackWrite(self, path: str):
+        """
+        Holds back scans of the directory the file is located in, until the file
+        is written completely.
+        """
+
+        self.writeTracker.track(path)
+
+    def completeWrite(self, path: str):
+        self.writeTracker.complete(path)
+
+    def flush(self, force: bool = False):
+        """
+        Turns all collected change sets into tasks and adds them to the task
+        manager. Library updates are added before library cleans. Scans of
+        directories with files that are still being written are kept for
+        later, unless forced. The batch is kept open while probes are pending,
+        unless forced.
+        """
+
+        with self.changeSetsLock:
+            self._cancelBatchTimer()
+            if not force and self.pendingProbes > 0:
+                self.logger.debug("Holding the batch open for %i pending probes." % self.pendingProbes)
+                self.flushDeferred = True
+                return
+            self.flushDeferred = False
+            changeSets, self.changeSets = self.changeSets, {}
+            if not force:
+                self._holdBackPendingWrites(changeSets)
+
+        for mediaSource, changeSet in changeSets.items():
+            self.logger.debug(
+                'Flushing changes for "%s": %i directories to scan, %i directories to clean.'
+                % (mediaSource.path, len(changeSet.updatePaths), len(changeSet.cleanPaths))
+            )
+            for task in changeSet.toTasks(mediaSource, self.costEstimator):
+                self.taskManager.add(task)
+
+    def hasChanges(self) -> bool:
+        with self.changeSetsLock:
+            return len(self.changeSets) > 0
+
+    def clear(self, mediaSources: Iterable[MediaSource] = None):
+        """
+        Drops collected changes of the media sources, or all of them by default.
+        """
+
+        if mediaSources is not None:
+            with self.changeSetsLock:
+                for mediaSource in mediaSources:
+                    self.changeSets.pop(mediaSource, None)
+            self.logger.debug("Changes of removed media sources cleared.")
+            return
+
+        with self.changeSetsLock:
+            self._cancelBatchTimer()
+            self.flushDeferred = False
+            self.changeSets.clear()
+        self.writeTracker.clear()
+        self.logger.debug("All changes cleared.")
+
+    def _holdBackPendingWrites(self, changeSets: Dict[MediaSource, ChangeSet]):
+        """
+        Moves directories with files that are still being written from the
+        update paths of the change sets back to the batcher, without starting
+        the batch timer. Should be called with the change sets lock acquired.
+        """
+
+        for mediaSource, changeSet in changeSets.items():
+            heldBackPaths = {
+                p for p in changeSet.updatePaths if p is not None and self.writeTracker.hasPendingWrites(p)
+            }
+            if len(heldBackPaths) == 0:
+                continue
+
+            self.logger.debug(
+                'Holding back scans of %i directories in "%s", as %i files are still being written.'
+                % (len(heldBackPaths), mediaSource.path, self.writeTracker.count())
+            )
+            changeSet.updatePaths -= heldBackPaths
+            self.changeSets.setdefault(mediaSource, ChangeSet()).updatePaths.update(heldBackPaths)
+
+    def _onWritesCompleted(self):
+        # Starts the batch timer, so the scans held back get checked again
+        with self.changeSetsLock:
+            if len(self.changeSets) > 0 and self.batchTimer is None and not self.flushDeferred:
+                self.batchTimer = self.scheduler.schedule(self.BATCH_WAIT, self.flush)
+
+    def _cancelBatchTimer(self):
+        """
+        Should be called with the change sets lock acquired.
+        """
+
+        if self.batchTimer is not None:
+            self.scheduler.cancel(self.batchTimer)
+            self.batchTimer = None
+
+    def _getChangeSet(self, mediaSource: MediaSource) -> ChangeSet:
+        """
+        Returns change set for the media source, creating it if needed. Starts
+        the batch timer if this is the first change of the batch. Should be
+        called with the change sets lock acquired.
+        """
+
+        changeSet = self.changeSets.get(mediaSource)
+        if changeSet is None:
+            changeSet = self.changeSets[mediaSource] = ChangeSet()
+
+        # A deferred batch gets flushed once the pending probes end
+        if self.batchTimer is None and not self.flushDeferred:
+            self.batchTimer = self.scheduler.schedule(self.BATCH_WAIT, self.flush)
+
+        return changeSet
+
+
+def _collapsePaths(paths: Set[str]) -> List[str]:
+    """
+    Removes directories that are located inside other directories from the
+    set. For example, for "/tv/Show" and "/tv/Show/Season 1" only "/tv/Show"
+    is kept. Returns an empty list if the set contains None, meaning the
+    whole library.
+    """
+
+    if None in paths:
+        return []
+
+    # Parent directories are always shorter than their subdirectories, so they
+    # get kept first and subdirectories can be checked against them.
+    result = set()
+    for path in sorted(paths, key=len):
+        if not any(parentPath in result for parentPath in _getParentPaths(path)):
+            result.add(path)
+
+    return sorted(result)
+
+
+def _getParentPaths(path: str):
+    parentPath = os.path.dirname(path)
+    while parentPath != path:
+        yield parentPath
+        path, parentPath = parentPath, os.path.dirname(parentPath)
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+import xbmc
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+import resources.lib.logging as logging
+
+
+class Request(NamedTuple):
+    method: str
+    params: Optional[dict] = None
+
+
+class Response(NamedTuple):
+    method: str
+    # Result of a successful call. Its type depends on the method, for example
+    # "OK" string for "VideoLibrary.Scan" or a dictionary for "Files.GetSources".
+    result: Any
+    # Error object of a failed call, with "code" and "message" fields
+    error: Optional[dict]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.result is not None
+
+
+class LatencyStats(NamedTuple):
+    calls: int
+    totalTime: float  # Seconds
+    maxTime: float  # Seconds
+
+    @property
+    def averageTime(self) -> float:
+        return self.totalTime / self.calls if self.calls > 0 else 0
+
+
+class LatencyRecorder:
+    """
+    Keeps round trip times of JSONRPC methods. Clients share a single recorder
+    by default, so the stats cover all the calls the add-on makes.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self)
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, LatencyStats] = {}
+
+    def add(self, methods: List[str], elapsedTime: float):
+        # Methods called in a batch share the time of its round trip
+        with self.lock:
+            for method in dict.fromkeys(methods):
+                stats = self.latencies.get(method, LatencyStats(0, 0, 0))
+                self.latencies[method] = LatencyStats(
+                    stats.calls + 1, stats.totalTime + elapsedTime, max(stats.maxTime, elapsedTime)
+                )
+
+    def getLatencies(self) -> Dict[str, LatencyStats]:
+        with self.lock:
+            return dict(self.latencies)
+
+    def log(self):
+        """
+        Logs a summary of the stats per method, the slowest methods in total
+        first.
+        """
+
+        latencies = self.getLatencies()
+        for method, stats in sorted(latencies.items(), key=lambda i: i[1].totalTime, reverse=True):
+            self.logger.info(
+                '"%s" JSONRPC method: %i calls, %.1f ms on average, %.1f ms at most, %.1f s in total.'
+                % (method, stats.calls, stats.averageTime * 1000, stats.maxTime * 1000, stats.totalTime)
+            )
+
+
+# Shared by all clients, unless a client is given its own recorder
+latencyRecorder = LatencyRecorder()
+
+
+class JsonRpcError(Exception):
+    def __init__(self, response: Response) -> None:
+        message = 'JSONRPC method "%s" failed. Error: "%s".' % (response.method, response.error)
+        super().__init__(message)
+        self.response = response
+
+
+class JsonRpcClient:
+    """
+    Calls Kodi JSONRPC API methods. Several methods can be called in a single
+    round trip to Kodi, as a JSONRPC batch, and list methods can be called page
+    by page. Time of each round trip is measured and kept per method by the
+    latency recorder.
+    """
+
+    def __init__(self, recorder: LatencyRecorder = None):
+        self.logger = logging.getLogger(self)
+        self.latencyRecorder = recorder if recorder is not None else latencyRecorder
+
+    def call(self, method: str, params: dict = None) -> Response:
+        return self.callBatch([Request(method, params)])[0]
+
+    def callBatch(self, requests: List[Request]) -> List[Response]:
+        """
+        Calls the methods in a single round trip to Kodi and returns their
+        responses in the order of the requests. A single request is sent
+        as it is, not as a batch.
+        """
+
+        if len(requests) == 0:
+            return []
+
+        queries = [
+            {"jsonrpc": "2.0", "method": r.method, "params": r.params or {}, "id": i + 1}
+            for i, r in enumerate(requests)
+        ]
+        startTime = time.monotonic()
+        rawResponse = xbmc.executeJSONRPC(json.dumps(queries[0] if len(queries) == 1 else queries))
+        self._addLatency([r.method for r in requests], time.monotonic() - startTime)
+
+        decodedResponse = json.loads(rawResponse)
+        if len(requests) == 1:
+            # Errors that are not bound to a request, like a parse error, come without an ID
+            responses = {1: decodedResponse[0] if isinstance(decodedResponse, list) else decodedResponse}
+        elif isinstance(decodedResponse, list):
+            responses = {r.get("id"): r for r in decodedResponse}
+        else:
+            # The whole batch failed, so the error is the response of every request
+            responses = {i + 1: decodedResponse for i in range(len(requests))}
+
+        return [_getResponse(r.method, responses.get(i + 1, {})) for i, r in enumerate(requests)]
+
+    def getPages(self, method: str, params: dict, field: str, pageSize: int) -> Iterator[List[dict]]:
+        """
+        Calls the list method page by page, with "limits" parameter, and yields
+        items of each page, taken from the field of the result. Next page is
+        fetched only when the previous one has been handled. Raises JsonRpcError
+        if fetching a page fails.
+        """
+
+        start = 0
+        while True:
+            response = self.call(method, {**params, "limits": {"start": start, "end": start + pageSize}})
+            if not response.ok:
+                raise JsonRpcError(response)
+
+            items = response.result.get(field, [])
+            yield items
+
+            start += len(items)
+            if len(items) == 0 or start >= response.result.get("limits", {}).get("total", 0):
+                return
+
+    def _addLatency(self, methods: List[str], elapsedTime: float):
+        self.latencyRecorder.add(methods, elapsedTime)
+        self.logger.debug(
+            'Called "%s" JSONRPC method%s in %.1f ms.'
+            % ('", "'.join(methods), "s" if len(methods) > 1 else "", elapsedTime * 1000)
+        )
+
+
+def _getResponse(method: str, response: dict) -> Response:
+    error = response.get("error")
+    result = response.get("result")
+    if error is None and result is None:
+        error = {"code": None, "message": "No response."}
+
+    return Response(method, result, error)
@@ -1,9 +1,10 @@
 from enum import Enum
-import json
 import xbmc
-from typing import List, NamedTuple
+from typing import Dict, FrozenSet, List, NamedTuple
 from urllib.parse import unquote
+from resources.lib.jsonrpc import JsonRpcClient, Request, Response
 from resources.lib.settings import Settings
+from resources.lib.util.file_system import getFileExt
 import resources.lib.logging as logging
 
 
@@ -23,27 +24,84 @@ class InvalidMediaTypeException(Exception):
         super().__init__(message)
 
 
+class MediaClassifier:
+    """
+    Tells whether a file is a supported media file, based on its extension.
+
+    Supported file extensions are fetched from Kodi with "xbmc.getSupportedMedia"
+    only once, when the classifier gets created, and then kept in a set per media
+    type. File extensions are matched case-insensitively, the same way Kodi does.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self)
+        self.extensions: Dict[MediaType, FrozenSet[str]] = {
+            MediaType.video: self._fetchSupportedExtensions("video"),
+            MediaType.music: self._fetchSupportedExtensions("music"),
+        }
+
+    def isSupported(self, path: str, mediaType: MediaType) -> bool:
+        extensions = self.extensions.get(mediaType)
+        if extensions is None:
+            raise InvalidMediaTypeException(mediaType)
+
+        return getFileExt(path).lower() in extensions
+
+    def _fetchSupportedExtensions(self, type: str) -> FrozenSet[str]:
+        response = xbmc.getSupportedMedia(type)
+        extensions = frozenset(ext.lower() for ext in response.split("|") if ext != "")
+        self.logger.debug('Fetched %i supported "%s" file extensions.' % (len(extensions), type))
+
+        return extensions
+
+
 class Library:
     def __init__(self, settings: Settings):
         self.logger = logging.getLogger(self)
         self.settings = settings
+        self.rpcClient = JsonRpcClient()
+        self.mediaClassifier = None
+
+    def getMediaClassifier(self) -> MediaClassifier:
+        """
+        Returns cached media classifier. It's created on the first call and then
+        re-created only after resetMediaClassifier call, which happens when the
+        add-on settings change.
+        """
+
+        if self.mediaClassifier is None:
+            self.mediaClassifier = MediaClassifier()
+
+        return self.mediaClassifier
+
+    def resetMediaClassifier(self):
+        self.mediaClassifier = None
 
     def getMediaSources(self) -> List[MediaSource]:
-        videoPaths = self._getMediaSourcePathsFor("video") if self.settings.isRefreshVideoEnabled() else []
-        musicPaths = self._getMediaSourcePathsFor("music") if self.settings.isRefreshMusicEnabled() else []
+        mediaTypes = []
+        if self.settings.isRefreshVideoEnabled():
+            mediaTypes.append(MediaType.video)
+        if self.settings.isRefreshMusicEnabled():
+            mediaTypes.append(MediaType.music)
+
+        # Sources of all media types are fetched in a single round trip
+        responses = self.rpcClient.callBatch([Request("Files.GetSources", {"media": t.name}) for t in mediaTypes])
 
-        return [MediaSource(p, MediaType.video) for p in videoPaths] + [
-            MediaSource(p, MediaType.music) for p in musicPaths
+        return [
+            MediaSource(p, mediaType)
+            for mediaType, response in zip(mediaTypes, responses)
+            for p in self._getMediaSourcePaths(mediaType, response)
         ]
 
-    def _getMediaSourcePathsFor(self, type: str):
-        query = (
-            b'{"jsonrpc": "2.0", "method": "Files.GetSources", "params": { "media": "%b" }, "id": 1}' % type.encode()
+    def _getMediaSourcePaths(self, mediaType: MediaType, response: Response) -> List[str]:
+        self.logger.debug(
+            'Fetched "%s" sources using JSONRPC API. Result: "%s", error: "%s".'
+            % (mediaType.name, response.result, response.error)
         )
-        response = json.loads(xbmc.executeJSONRPC(query.decode()))
-        self.logger.debug('Fetched "%s" sources using JSONRPC API. Response: "%s".' % (type, response))
+        if not response.ok:
+            return []
 
-        sourcePaths = [s["file"] for s in response.get("result", {}).get("sources", [])]
+        sourcePaths = [s["file"] for s in response.result.get("sources", [])]
         paths = self._splitMultipaths(sourcePaths)
 
         return paths
@@ -0,0 +1,306 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import resources.lib.logging as logging
+from resources.lib.jsonrpc import JsonRpcClient, JsonRpcError, Request
+from resources.lib.library import MediaType
+from resources.lib.monitoring import Event, Monitor
+from resources.lib.util.file_system import getPathHash
+
+
+class _ItemType(NamedTuple):
+    mediaType: MediaType
+    # JSONRPC method to fetch all items of the type with, and response field the items are in
+    listMethod: str
+    listField: str
+    # Same as above, but for a single item
+    detailsMethod: str
+    detailsField: str
+
+
+class LibraryIndex:
+    """
+    Keeps hashes of the paths of all files in the Kodi library, so the watcher
+    can skip scans for files Kodi already knows and cleans for files it never
+    knew. Only hashes are kept, 64 bits each, so the index stays small even for
+    libraries with hundreds of thousands of items. Items are fetched from Kodi
+    in pages for the same reason.
+
+    The index of a media type is loaded once, in the background, and then kept
+    up to date from Kodi notifications about added, changed and removed library
+    items. Only the items from the notifications get fetched, so the index keeps
+    being used while the library is scanned or cleaned. Until the index is
+    loaded it's unknown whether a file is in the library, so no scans or cleans
+    get skipped.
+    """
+
+    # Number of library items fetched with a single JSONRPC request
+    PAGE_SIZE = 1000
+    # Number of single items fetched in a single round trip, as a JSONRPC batch
+    DETAILS_BATCH_SIZE = 100
+    # Error code Kodi returns when fetching a single item that doesn't exist
+    INVALID_PARAMS_ERROR = -32602
+
+    # Key is the item type, as in library notifications
+    ITEM_TYPES = {
+        "movie": _ItemType(
+            MediaType.video, "VideoLibrary.GetMovies", "movies", "VideoLibrary.GetMovieDetails", "moviedetails"
+        ),
+        "episode": _ItemType(
+            MediaType.video, "VideoLibrary.GetEpisodes", "episodes", "VideoLibrary.GetEpisodeDetails", "episodedetails"
+        ),
+        "musicvideo": _ItemType(
+            MediaType.video,
+            "VideoLibrary.GetMusicVideos",
+            "musicvideos",
+            "VideoLibrary.GetMusicVideoDetails",
+            "musicvideodetails",
+        ),
+        "song": _ItemType(
+            MediaType.music, "AudioLibrary.GetSongs", "songs", "AudioLibrary.GetSongDetails", "songdetails"
+        ),
+    }
+
+    # Library names Kodi passes to the notifications
+    LIBRARIES = {
+        "video": [MediaType.video],
+        "music": [MediaType.music],
+    }
+
+    def __init__(self, monitor: Monitor):
+        self.logger = logging.getLogger(self)
+        self.monitor = monitor
+        self.rpcClient = JsonRpcClient()
+        self.lock = threading.Lock()
+        # Index per media type, None until loaded
+        self.indexes: Dict[MediaType, Optional["_Index"]] = {t.mediaType: None for t in self.ITEM_TYPES.values()}
+        # Media types waiting for a load to start
+        self.pendingLoads: Set[MediaType] = set()
+        # Key is the item type and ID of an item Kodi notified about, value is True if it was removed
+        self.pendingChanges: Dict[Tuple[str, int], bool] = {}
+        # Loads and changes are applied one at a time, in the order they came
+        self.executor = ThreadPoolExecutor(1)
+        self.stopRequested = False
+
+    def __enter__(self):
+        self.monitor.subscribe(Event.onItemUpdated, self._onItemUpdated)
+        self.monitor.subscribe(Event.onItemRemoved, self._onItemRemoved)
+        for mediaType in self.indexes:
+            self.refresh(mediaType)
+
+        return self
+
+    def __exit__(self, *args):
+        self.monitor.unsubscribe(Event.onItemUpdated, self._onItemUpdated)
+        self.monitor.unsubscribe(Event.onItemRemoved, self._onItemRemoved)
+        # Makes a load that's in progress stop after the current page
+        self.stopRequested = True
+        self.executor.shutdown()
+
+    def contains(self, mediaType: MediaType, path: str) -> Optional[bool]:
+        """
+        Tells whether the file is in the library. Returns None if it's unknown,
+        because the index hasn't been loaded yet.
+        """
+
+        pathHash = getPathHash(path)
+        with self.lock:
+            index = self.indexes.get(mediaType)
+            if index is None:
+                return None
+
+            return index.contains(pathHash)
+
+    def hasItemsInDirectory(self, mediaType: MediaType, path: str) -> Optional[bool]:
+        """
+        Tells whether the library has any items located in the directory or its
+        subdirectories. Kodi gets asked for that, as the index has no directory
+        structure. Returns None if it's unknown, because the request failed.
+        """
+
+        # Trailing separator, so "/tv/Show" doesn't match items in "/tv/Show 2"
+        directoryPath = os.path.join(path, "")
+        params = {
+            "filter": {"field": "path", "operator": "startswith", "value": directoryPath},
+            "limits": {"start": 0, "end": 1},
+        }
+        # All item kinds of the media type are checked in a single round trip
+        requests = [Request(t.listMethod, params) for t in self.ITEM_TYPES.values() if t.mediaType == mediaType]
+        responses = self.rpcClient.callBatch(requests)
+        if any(r.ok and r.result.get("limits", {}).get("total", 0) > 0 for r in responses):
+            return True
+
+        for response in responses:
+            if not response.ok:
+                self.logger.warn(
+                    'Failed to fetch library items with "%s". Error: "%s".' % (response.method, response.error)
+                )
+                return None
+
+        return False
+
+    def refresh(self, mediaType: MediaType):
+        """
+        Loads the index of the media type in the background. The index that is
+        already loaded keeps being used until the new one is ready. Does nothing
+        if a load is already waiting to start, as it will get the latest items.
+        """
+
+        with self.lock:
+            if mediaType in self.pendingLoads:
+                return
+            self.pendingLoads.add(mediaType)
+        self.executor.submit(self._load, mediaType)
+
+    def _onItemUpdated(self, library: Optional[str], itemType: str, itemId: int):
+        self._addChange(library, itemType, itemId, False)
+
+    def _onItemRemoved(self, library: Optional[str], itemType: str, itemId: int):
+        self._addChange(library, itemType, itemId, True)
+
+    def _addChange(self, library: Optional[str], itemType: str, itemId: int, removed: bool):
+        if itemType not in self.ITEM_TYPES:
+            # Removing a TV show, an album and such removes their items as well,
+            # which Kodi might not notify about one by one.
+            if removed:
+                for mediaType in self.LIBRARIES.get(library, list(self.indexes)):
+                    self.refresh(mediaType)
+            return
+
+        with self.lock:
+            # Changes coming before the previous ones got applied go together with those
+            applyScheduled = len(self.pendingChanges) > 0
+            self.pendingChanges[(itemType, itemId)] = removed
+        if not applyScheduled:
+            self.executor.submit(self._applyChanges)
+
+    @logging.notifyOnError
+    def _applyChanges(self):
+        with self.lock:
+            changes, self.pendingChanges = self.pendingChanges, {}
+
+        itemPaths = self._fetchItemPaths([key for key, removed in changes.items() if not removed])
+        reloads = set()
+        with self.lock:
+            for key, removed in changes.items():
+                mediaType = self.ITEM_TYPES[key[0]].mediaType
+                index = self.indexes[mediaType]
+                if index is None:
+                    # Not loaded yet, the load gets the latest items
+                    continue
+                paths = itemPaths.get(key, []) if not removed else []
+                if paths is None:
+                    reloads.add(mediaType)
+                elif len(paths) == 0:
+                    index.remove(key)
+                else:
+                    index.set(key, tuple(getPathHash(p) for p in paths))
+
+        self.logger.debug("Applied %i library item changes." % len(changes))
+        for mediaType in reloads:
+            self.logger.warn('Failed to fetch changed library items. Reloading "%s" index.' % mediaType.name)
+            self.refresh(mediaType)
+
+    def _fetchItemPaths(self, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Optional[List[str]]]:
+        """
+        Fetches file paths of the items. Items that don't exist anymore get no
+        paths, and items that couldn't be fetched get None.
+        """
+
+        result = {}
+        for i in range(0, len(keys), self.DETAILS_BATCH_SIZE):
+            batch = keys[i : i + self.DETAILS_BATCH_SIZE]
+            requests = [
+                Request(self.ITEM_TYPES[t].detailsMethod, {t + "id": itemId, "properties": ["file"]})
+                for t, itemId in batch
+            ]
+            for (itemType, itemId), response in zip(batch, self.rpcClient.callBatch(requests)):
+                if response.ok:
+                    paths = _splitStack(response.result[self.ITEM_TYPES[itemType].detailsField]["file"])
+                elif (response.error or {}).get("code") == self.INVALID_PARAMS_ERROR:
+                    paths = []
+                else:
+                    paths = None
+                result[(itemType, itemId)] = paths
+
+        return result
+
+    @logging.notifyOnError
+    def _load(self, mediaType: MediaType):
+        with self.lock:
+            self.pendingLoads.discard(mediaType)
+
+        index = _Index()
+        for itemType, typeInfo in self.ITEM_TYPES.items():
+            if typeInfo.mediaType == mediaType and not self._loadItems(itemType, index):
+                return
+
+        with self.lock:
+            self.indexes[mediaType] = index
+        self.logger.debug('Loaded "%s" index with %i items.' % (mediaType.name, len(index.items)))
+
+    def _loadItems(self, itemType: str, index: "_Index") -> bool:
+        """
+        Fetches all library items of the type page by page and adds hashes of
+        their file paths to the index. Returns False if fetching failed.
+        """
+
+        typeInfo = self.ITEM_TYPES[itemType]
+        try:
+            for items in self.rpcClient.getPages(
+                typeInfo.listMethod, {"properties": ["file"]}, typeInfo.listField, self.PAGE_SIZE
+            ):
+                if self.stopRequested:
+                    return False
+                for item in items:
+                    pathHashes = tuple(getPathHash(p) for p in _splitStack(item["file"]))
+                    index.set((itemType, item[itemType + "id"]), pathHashes)
+        except JsonRpcError as e:
+            self.logger.warn("Failed to fetch library items. %s" % e)
+            return False
+
+        return True
+
+
+class _Index:
+    """
+    Path hashes of library items of a media type. Hashes are kept by the item
+    type and ID, so removed items can be dropped, and counted, as several items
+    can share a file, like episodes of a multi-episode file.
+    """
+
+    __slots__ = ("items", "hashCounts")
+
+    def __init__(self):
+        self.items: Dict[Tuple[str, int], Tuple[int, ...]] = {}
+        self.hashCounts: Dict[int, int] = {}
+
+    def contains(self, pathHash: int) -> bool:
+        return pathHash in self.hashCounts
+
+    def set(self, key: Tuple[str, int], pathHashes: Tuple[int, ...]):
+        self.remove(key)
+        self.items[key] = pathHashes
+        for pathHash in pathHashes:
+            self.hashCounts[pathHash] = self.hashCounts.get(pathHash, 0) + 1
+
+    def remove(self, key: Tuple[str, int]):
+        for pathHash in self.items.pop(key, ()):
+            count = self.hashCounts[pathHash] - 1
+            if count > 0:
+                self.hashCounts[pathHash] = count
+            else:
+                del self.hashCounts[pathHash]
+
+
+def _splitStack(path: str):
+    """
+    Splits paths of stacked items, like "stack:///a/cd1.mkv , /a/cd2.mkv",
+    into paths of their files. Commas in file names are doubled in those.
+    """
+
+    if not path.startswith("stack://"):
+        return [path]
+
+    return [p.replace(",,", ",") for p in path[len("stack://") :].split(" , ")]
@@ -1,3 +1,4 @@
+import traceback
 import xbmc
 import xbmcgui
 import xbmcaddon
@@ -22,6 +23,14 @@ class Logger:
     def error(self, message):
         xbmc.log("%s/%s: %s" % (_addonId, self.category, message), xbmc.LOGERROR)
 
+    def exception(self, message):
+        """
+        Logs the message as an error, together with the traceback of the
+        exception being handled.
+        """
+
+        self.error("%s\n%s" % (message, traceback.format_exc()))
+
 
 def getLogger(obj):
     if type(obj) is str:
@@ -1,4 +1,6 @@
+import json
 from enum import Enum
+from typing import Dict, List, Optional
 import xbmc
 import resources.lib.logging as logging
 
@@ -8,53 +10,120 @@ class Event(Enum):
     onScanFinished = 2
     onCleanStarted = 3
     onCleanFinished = 4
+    onItemUpdated = 5  # Library item added or changed
+    onItemRemoved = 6  # Library item removed
 
 
 class Monitor(xbmc.Monitor):
+    # Kodi notifications about library items, with the events and the library
+    # names those are raised with.
+    NOTIFICATIONS = {
+        "VideoLibrary.OnUpdate": (Event.onItemUpdated, "video"),
+        "VideoLibrary.OnRemove": (Event.onItemRemoved, "video"),
+        "AudioLibrary.OnUpdate": (Event.onItemUpdated, "music"),
+        "AudioLibrary.OnRemove": (Event.onItemRemoved, "music"),
+    }
+
     def __init__(self) -> None:
         super().__init__()
         self.logger = logging.getLogger(self)
 
-        # Key is the event type, value is an array for callback functions
-        self.eventCallbacks = {
+        # Key is the event type, value is a dictionary with the library name as
+        # the key, None for callbacks of any library, and callback functions as
+        # the value.
+        self.eventCallbacks: Dict[Event, Dict[Optional[str], List]] = {
+            Event.onScanStarted: {},
+            Event.onScanFinished: {},
+            Event.onCleanStarted: {},
+            Event.onCleanFinished: {},
+            Event.onItemUpdated: {},
+            Event.onItemRemoved: {},
+        }
+        # Same as above, but for subscribers
+        self.eventSubscribers = {
             Event.onScanStarted: [],
             Event.onScanFinished: [],
             Event.onCleanStarted: [],
             Event.onCleanFinished: [],
+            Event.onItemUpdated: [],
+            Event.onItemRemoved: [],
         }
 
-    def attach(self, event: Event, callback):
-        callbacks = self.eventCallbacks[event]
+    def attach(self, event: Event, callback, library: str = None):
+        """
+        Attaches the callback to the event of the library, "video" or "music",
+        so events of the other library don't reach it. Callbacks attached with
+        no library get events of any library.
+        """
+
+        callbacks = self.eventCallbacks[event].setdefault(library, [])
         callbacks.append(callback)
         if len(callbacks) > 1:
-            self.logger.warn(f"Multiple event handlers detected for '{event}'.")
+            self.logger.warn(f"Multiple event handlers detected for '{event}' of '{library}' library.")
 
-    def detach(self, event: Event, callback):
-        callbacks = self.eventCallbacks[event]
+    def detach(self, event: Event, callback, library: str = None):
+        callbacks = self.eventCallbacks[event][library]
         callbacks.remove(callback)
         if len(callbacks) > 0:
-            self.logger.warn(f"Multiple event handlers detected for '{event}'.")
+            self.logger.warn(f"Multiple event handlers detected for '{event}' of '{library}' library.")
+
+    def subscribe(self, event: Event, callback):
+        """
+        Subscribes the callback to the event for as long as it's needed. Unlike
+        attached callbacks, which are meant to be used by one task handler at a
+        time, any number of subscribers is expected. Subscribers get the name of
+        the library, "video" or "music", as an argument, or None if Kodi doesn't
+        provide it. Subscribers of item events also get the type of the item,
+        like "movie" or "song", and its ID.
+        """
+
+        self.eventSubscribers[event].append(callback)
+
+    def unsubscribe(self, event: Event, callback):
+        self.eventSubscribers[event].remove(callback)
 
     @logging.notifyOnError
-    def onScanStarted(self, *args) -> None:
-        self.logger.debug("Scan started.")
-        for cb in self.eventCallbacks[Event.onScanStarted]:
-            cb()
+    def onScanStarted(self, library: str = None) -> None:
+        self.logger.debug('Scan started for "%s" library.' % library)
+        self._notify(Event.onScanStarted, library)
 
     @logging.notifyOnError
-    def onScanFinished(self, *args) -> None:
-        self.logger.debug("Scan finished.")
-        for cb in self.eventCallbacks[Event.onScanFinished]:
-            cb()
+    def onScanFinished(self, library: str = None) -> None:
+        self.logger.debug('Scan finished for "%s" library.' % library)
+        self._notify(Event.onScanFinished, library)
 
     @logging.notifyOnError
-    def onCleanStarted(self, *args) -> None:
-        self.logger.debug("Clean started.")
-        for cb in self.eventCallbacks[Event.onCleanStarted]:
-            cb()
+    def onCleanStarted(self, library: str = None) -> None:
+        self.logger.debug('Clean started for "%s" library.' % library)
+        self._notify(Event.onCleanStarted, library)
+
+    @logging.notifyOnError
+    def onCleanFinished(self, library: str = None) -> None:
+        self.logger.debug('Clean finished for "%s" library.' % library)
+        self._notify(Event.onCleanFinished, library)
 
     @logging.notifyOnError
-    def onCleanFinished(self, *args) -> None:
-        self.logger.debug("Clean finished.")
-        for cb in self.eventCallbacks[Event.onCleanFinished]:
+    def onNotification(self, sender: str, method: str, data: str) -> None:
+        notification = self.NOTIFICATIONS.get(method)
+        if notification is None:
+            return
+
+        event, library = notification
+        item = json.loads(data)
+        # Video library updates come with the item wrapped, together with other details
+        item = item.get("item", item)
+        self.logger.debug('%s for "%s" %s.' % (method, item.get("type"), item.get("id")))
+        self._notify(event, library, item.get("type"), item.get("id"))
+
+    def _notify(self, event: Event, library: Optional[str], *args):
+        callbacksByLibrary = self.eventCallbacks[event]
+        if library is None:
+            # Library is not known, so callbacks of any library might be waiting for the event
+            callbacks = [cb for libraryCallbacks in callbacksByLibrary.values() for cb in libraryCallbacks]
+        else:
+            callbacks = callbacksByLibrary.get(library, []) + callbacksByLibrary.get(None, [])
+        for cb in callbacks:
             cb()
+
+        for cb in list(self.eventSubscribers[event]):
+            cb(library, *args)
@@ -0,0 +1,61 @@
+from enum import Enum
+import resources.lib.tasks as tasks
+from resources.lib.player import AvType, PlaybackStatus, PlayerState
+
+
+class Activity(Enum):
+    idle = 1
+    playingAudio = 2
+    playingVideo = 3
+    pausedAudio = 4
+    pausedVideo = 5
+
+
+class TaskKind(Enum):
+    scopedScan = 1  # Scan of certain directories
+    libraryScan = 2  # Scan of the whole library
+    clean = 3
+
+
+class PlaybackPolicy:
+    """
+    Decides whether a library task can be executed during the current activity
+    of the player, so library work doesn't get in the way of playback.
+
+    Scans are light enough to run while music is playing, and scans of certain
+    directories can run while playback is paused. Paused playback allows at
+    least what the same playback allows when it's not paused. Video playback
+    is never interrupted. Cleans remove items from the library, which could be
+    the ones being played, so those always wait for playback to stop.
+    """
+
+    # Key is the kind of task, value is the player activities it's allowed during
+    RULES = {
+        TaskKind.scopedScan: {Activity.idle, Activity.playingAudio, Activity.pausedAudio, Activity.pausedVideo},
+        TaskKind.libraryScan: {Activity.idle, Activity.playingAudio, Activity.pausedAudio},
+        TaskKind.clean: {Activity.idle},
+    }
+
+    def allows(self, task, playerState: PlayerState) -> bool:
+        return _getActivity(playerState) in self.RULES[_getTaskKind(task)]
+
+
+def _getActivity(playerState: PlayerState) -> Activity:
+    if playerState.status == PlaybackStatus.stopped:
+        return Activity.idle
+
+    # Media of unknown type is treated as video, as that's the one not to interrupt
+    isAudio = playerState.avType == AvType.audio
+    if playerState.status == PlaybackStatus.paused:
+        return Activity.pausedAudio if isAudio else Activity.pausedVideo
+
+    return Activity.playingAudio if isAudio else Activity.playingVideo
+
+
+def _getTaskKind(task) -> TaskKind:
+    if type(task) is tasks.CleanLibrary:
+        return TaskKind.clean
+    if len(task.paths) == 0:
+        return TaskKind.libraryScan
+
+    return TaskKind.scopedScan
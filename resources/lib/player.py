@@ -1,20 +1,51 @@
+import threading
 import xbmc
 import resources.lib.logging as logging
 from enum import Enum
+from typing import NamedTuple, Optional
 
 
 class Event(Enum):
-    onPlayBackFinished = 1  # Handles both "stopped" and "ended" events
+    # Handles started, paused, resumed, stopped and ended events, as well as
+    # changes of the type of the played media
+    onPlayBackStateChanged = 1
+
+
+class PlaybackStatus(Enum):
+    stopped = 1
+    playing = 2
+    paused = 3
+
+
+class AvType(Enum):
+    audio = 1
+    video = 2
+
+
+class PlayerState(NamedTuple):
+    status: PlaybackStatus
+    # Type of the played media, None if nothing is played or if Kodi doesn't know it yet
+    avType: Optional[AvType]
 
 
 class Player(xbmc.Player):
+    """
+    Keeps the state of the player in memory, updated from Kodi callbacks, so
+    checking it doesn't take a Kodi API call. Callbacks attached to the player
+    get called every time the state changes.
+    """
+
     def __init__(self) -> None:
         super().__init__()
         self.logger = logging.getLogger(self)
+        # Callbacks come from a Kodi thread, while the state is read by others
+        self.stateLock = threading.Lock()
+        # Something might already be playing when the add-on starts
+        self.state = self._getCurrentState()
 
         # Key is the event type, value is an array for callback functions
         self.eventCallbacks = {
-            Event.onPlayBackFinished: [],
+            Event.onPlayBackStateChanged: [],
         }
 
     def attach(self, event: Event, callback):
@@ -29,14 +60,78 @@ class Player(xbmc.Player):
         if len(callbacks) > 0:
             self.logger.warn(f"Multiple event handlers detected for '{event}'.")
 
+    def getState(self) -> PlayerState:
+        with self.stateLock:
+            return self.state
+
+    @logging.notifyOnError
+    def onPlayBackStarted(self) -> None:
+        self.logger.debug("Playback started.")
+        # Type of the media is not always known yet, it's set once AV starts
+        self._setState(PlayerState(PlaybackStatus.playing, None))
+
+    @logging.notifyOnError
+    def onAVStarted(self) -> None:
+        self.logger.debug("AV started.")
+        self._setState(PlayerState(PlaybackStatus.playing, self._getAvType()))
+
+    @logging.notifyOnError
+    def onAVChange(self) -> None:
+        self.logger.debug("AV changed.")
+        avType = self._getAvType()
+        with self.stateLock:
+            status = self.state.status
+        self._setState(PlayerState(status, avType))
+
+    @logging.notifyOnError
+    def onPlayBackPaused(self) -> None:
+        self.logger.debug("Playback paused.")
+        with self.stateLock:
+            avType = self.state.avType
+        self._setState(PlayerState(PlaybackStatus.paused, avType))
+
+    @logging.notifyOnError
+    def onPlayBackResumed(self) -> None:
+        self.logger.debug("Playback resumed.")
+        with self.stateLock:
+            avType = self.state.avType
+        self._setState(PlayerState(PlaybackStatus.playing, avType))
+
     @logging.notifyOnError
     def onPlayBackStopped(self) -> None:
         self.logger.debug("Playback stopped.")
-        for cb in self.eventCallbacks[Event.onPlayBackFinished]:
-            cb()
+        self._setState(PlayerState(PlaybackStatus.stopped, None))
 
     @logging.notifyOnError
     def onPlayBackEnded(self) -> None:
         self.logger.debug("Playback ended.")
-        for cb in self.eventCallbacks[Event.onPlayBackFinished]:
+        self._setState(PlayerState(PlaybackStatus.stopped, None))
+
+    @logging.notifyOnError
+    def onPlayBackError(self) -> None:
+        self.logger.debug("Playback failed.")
+        self._setState(PlayerState(PlaybackStatus.stopped, None))
+
+    def _setState(self, state: PlayerState):
+        with self.stateLock:
+            if state == self.state:
+                return
+            self.state = state
+
+        # Called without the lock, so callbacks can read the state
+        for cb in self.eventCallbacks[Event.onPlayBackStateChanged]:
             cb()
+
+    def _getCurrentState(self) -> PlayerState:
+        if not self.isPlaying():
+            return PlayerState(PlaybackStatus.stopped, None)
+
+        return PlayerState(PlaybackStatus.playing, self._getAvType())
+
+    def _getAvType(self) -> Optional[AvType]:
+        if self.isPlayingVideo():
+            return AvType.video
+        if self.isPlayingAudio():
+            return AvType.audio
+
+        return None
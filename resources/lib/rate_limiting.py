@@ -0,0 +1,65 @@
+import time
+
+
+class TokenBucket:
+    """
+    Allows up to capacity actions per period. The bucket starts full, every
+    action takes a token out of it, and tokens are put back at a steady rate of
+    capacity per period, so bursts are allowed only up to the capacity. Capacity
+    of 0 stands for no limit.
+
+    Not thread safe, callers are expected to hold their own lock.
+    """
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.period = period  # Seconds
+        self.tokens = float(capacity)
+        self.refillTime = time.monotonic()
+
+    def setCapacity(self, capacity: int):
+        """
+        Changes the capacity, keeping the tokens that are left, up to the new
+        capacity. The bucket is full after switching from no limit to a limit.
+        """
+
+        if capacity == self.capacity:
+            return
+
+        self._refill()
+        self.tokens = min(self.tokens, capacity) if self.capacity > 0 else float(capacity)
+        self.capacity = capacity
+
+    def getWaitTime(self) -> float:
+        """
+        Returns seconds until a token is available, or 0 if one is available
+        right away.
+        """
+
+        if self.capacity == 0:
+            return 0
+
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) * self.period / self.capacity
+
+    def take(self) -> bool:
+        """
+        Takes a token out of the bucket. Returns False, without taking anything,
+        if there are no tokens available.
+        """
+
+        if self.getWaitTime() > 0:
+            return False
+
+        if self.capacity > 0:
+            self.tokens -= 1
+
+        return True
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.refillTime) * self.capacity / self.period)
+        self.refillTime = now
@@ -0,0 +1,183 @@
+import functools
+import heapq
+import itertools
+import threading
+import time
+import resources.lib.logging as logging
+
+
+class Timer:
+    """
+    A handle for a callback scheduled with Scheduler. Can be used to cancel
+    the callback.
+    """
+
+    def __init__(self, dueTime: float, callback):
+        self.dueTime = dueTime
+        self.callback = callback
+        self.cancelled = False
+
+
+class Scheduler(threading.Thread):
+    """
+    Runs scheduled callbacks on a single, long-lived thread. Scheduled timers
+    are kept in a heap ordered by their due time, so scheduling and cancelling
+    a timer doesn't create any new threads.
+
+    Callbacks are executed one at a time, so they should be quick and never
+    block the thread. A callback that raises an exception gets logged, and the
+    rest of the timers keep running.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.logger = logging.getLogger(self)
+        self.timers = []
+        self.timersLock = threading.Condition()
+        # Makes timers with the same due time to run in the order they were scheduled
+        self.sequence = itertools.count()
+        self.stopRequested = False
+
+    def __enter__(self):
+        self.start()
+
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stop(self):
+        """
+        Stops the scheduler thread and waits for it to end. Timers that are not
+        yet due get dropped.
+        """
+
+        with self.timersLock:
+            self.stopRequested = True
+            self.timers.clear()
+            self.timersLock.notify()
+
+        # Should be false only if the thread hasn't been started
+        if self.is_alive():
+            self.join()
+
+    def schedule(self, delay: float, callback) -> Timer:
+        timer = Timer(time.monotonic() + delay, callback)
+        with self.timersLock:
+            heapq.heappush(self.timers, (timer.dueTime, next(self.sequence), timer))
+            # Notify the lock to re-check the waiting time, as the new timer
+            # can be due earlier than the ones that are already scheduled.
+            self.timersLock.notify()
+
+        return timer
+
+    def cancel(self, timer: Timer):
+        """
+        Cancels the timer. The timer stays in the heap until it's due and gets
+        skipped then, which is cheaper than removing it from the heap right away.
+        """
+
+        with self.timersLock:
+            timer.cancelled = True
+
+    def run(self):
+        while True:
+            with self.timersLock:
+                timer = self._getDueTimer()
+                if timer is None:
+                    break
+
+            try:
+                timer.callback()
+            except Exception:
+                # The thread runs timers of other components as well, so it must keep going
+                self.logger.exception("Scheduled callback failed.")
+                logging.notifyError()
+
+    def _getDueTimer(self):
+        """
+        Waits until a timer is due and removes it from the heap. Returns None
+        if stop has been requested. Should be called with the lock acquired.
+        """
+
+        while not self.stopRequested:
+            if len(self.timers) == 0:
+                self.timersLock.wait()
+                continue
+
+            dueTime, _, timer = self.timers[0]
+            if timer.cancelled:
+                heapq.heappop(self.timers)
+                continue
+
+            waitTime = dueTime - time.monotonic()
+            if waitTime > 0:
+                self.timersLock.wait(waitTime)
+                continue
+
+            heapq.heappop(self.timers)
+            return timer
+
+        return None
+
+
+class Debouncer:
+    """
+    Calls the callback once touches stop coming for a quiet period, but not
+    later than the max delay after the first touch, so a steady trickle of
+    touches can't postpone the callback forever.
+
+    Touching doesn't re-schedule the timer when it only moves the due time
+    further. The timer re-schedules itself instead, when it fires too early.
+    """
+
+    def __init__(self, scheduler: Scheduler, callback):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.timer = None
+        # Increments every time the timer gets scheduled. Lets the timer callback
+        # know that it has been replaced by another timer in the meantime.
+        self.timerGeneration = 0
+        self.firstTouchTime = None
+        self.dueTime = None
+
+    def touch(self, quietPeriod: float, maxDelay: float):
+        with self.lock:
+            now = time.monotonic()
+            if self.firstTouchTime is None:
+                self.firstTouchTime = now
+            self.dueTime = min(now + quietPeriod, self.firstTouchTime + maxDelay)
+
+            if self.timer is not None and self.timer.dueTime <= self.dueTime:
+                return
+            if self.timer is not None:
+                self.scheduler.cancel(self.timer)
+            self._scheduleTimer(now)
+
+    def cancel(self):
+        with self.lock:
+            if self.timer is not None:
+                self.scheduler.cancel(self.timer)
+            self.timer = None
+            self.firstTouchTime = None
+            self.dueTime = None
+
+    def _scheduleTimer(self, now: float):
+        self.timerGeneration += 1
+        callback = functools.partial(self._onTimer, self.timerGeneration)
+        self.timer = self.scheduler.schedule(self.dueTime - now, callback)
+
+    def _onTimer(self, timerGeneration: int):
+        with self.lock:
+            if self.timer is None or timerGeneration != self.timerGeneration:
+                return
+            now = time.monotonic()
+            if now < self.dueTime:
+                self._scheduleTimer(now)
+                return
+            self.timer = None
+            self.firstTouchTime = None
+            self.dueTime = None
+
+        self.callback()
@@ -17,6 +17,24 @@ class Settings(xbmc.Monitor):
     def isRefreshMusicEnabled(self):
         return self.settings.getBool("refresh_music")
 
+    def getDebounceWait(self):
+        return self.settings.getInt("debounce_wait")
+
+    def getMaxDebounceWait(self):
+        return self.settings.getInt("max_debounce_wait")
+
+    def getPollingInterval(self):
+        return self.settings.getInt("polling_interval")
+
+    def getSourcesCheckInterval(self):
+        return self.settings.getInt("sources_check_interval")
+
+    def getMaxScansPerHour(self):
+        return self.settings.getInt("max_scans_per_hour")
+
+    def getMaxCleansPerHour(self):
+        return self.settings.getInt("max_cleans_per_hour")
+
     @logging.notifyOnError
     def onSettingsChanged(self):
         self.logger.debug("Settings changed.")
@@ -0,0 +1,375 @@
+import array
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+import resources.lib.logging as logging
+from resources.lib.library import MediaSource
+from resources.lib.tree_diff import DirectoryState, FileState, TreeSnapshot
+from resources.lib.util.file_system import getPathHash
+
+# Gets changed every time the file format changes. Snapshots stored in another
+# format are ignored, same as if there were no snapshots at all.
+MAGIC = b"LRSNAP02"
+
+# Magic, byte order, directory count, file count, names size
+_HEADER = struct.Struct("<8sB3xIIQ")
+_HEADER_SIZE = 32
+
+# Records are stored column by column, as arrays of numbers, so each column
+# can be used straight from the mapped file, without any deserializing.
+_DIR_COLUMNS = [
+    ("hash", "Q"),  # Path hash
+    ("inode", "Q"),
+    ("mtime", "q"),  # Nanoseconds
+    ("parent", "I"),  # Parent directory id
+    ("name", "I"),  # Name offset in the names table
+    ("firstFile", "I"),  # Files of a directory go one after another
+    ("fileCount", "I"),
+    ("firstChild", "I"),  # Subdirectories of a directory go one after another
+    ("childCount", "I"),
+]
+_DIR_INDEX_COLUMNS = [
+    ("hash", "Q"),  # Directory path hashes, sorted
+    ("id", "I"),  # Directory id for every hash
+]
+_FILE_COLUMNS = [
+    ("hash", "Q"),  # Path hash. Files of a directory are sorted by it.
+    ("inode", "Q"),
+    ("size", "Q"),
+    ("mtime", "q"),  # Nanoseconds
+    ("parent", "I"),  # Parent directory id
+    ("name", "I"),  # Name offset in the names table
+]
+
+_NO_PARENT = 0xFFFFFFFF
+
+
+class SnapshotStore:
+    """
+    Keeps snapshots of media source directory trees on disk, one file per
+    media source, so changes made while Kodi was not running can be found
+    by comparing the stored snapshot with the directory tree at startup.
+
+    Snapshots are loaded as MappedSnapshot, which reads the file on demand.
+    """
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(self)
+        self.path = path
+
+    def load(self, mediaSource: MediaSource) -> Optional[TreeSnapshot]:
+        """
+        Returns the stored snapshot for the media source, or None if there is
+        no snapshot or it can't be read.
+        """
+
+        filePath = self._getFilePath(mediaSource)
+        self._applyPendingSave(filePath)
+
+        try:
+            return MappedSnapshot(filePath)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self.logger.warn('Snapshot file "%s" is corrupted or has unknown format. Ignoring it.' % filePath)
+            return None
+
+    def save(self, mediaSource: MediaSource, snapshot: TreeSnapshot):
+        """
+        Stores the snapshot for the media source. The file is written under a
+        temporary name first and then renamed, so a crash while writing it
+        can't leave a half-written snapshot behind.
+        """
+
+        filePath = self._getFilePath(mediaSource)
+        tempFilePath = filePath + ".tmp"
+        os.makedirs(self.path, exist_ok=True)
+        writeSnapshot(tempFilePath, mediaSource.path, snapshot)
+
+        try:
+            os.replace(tempFilePath, filePath)
+        except PermissionError:
+            # Windows doesn't allow to replace a file that is still mapped. Happens
+            # when the snapshot being saved still uses the snapshot loaded from the
+            # file. Gets renamed to the proper name when the snapshot is loaded.
+            os.replace(tempFilePath, filePath + ".new")
+
+    def _applyPendingSave(self, filePath: str):
+        try:
+            os.replace(filePath + ".new", filePath)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            self.logger.warn('Failed to rename snapshot file "%s".' % (filePath + ".new"))
+
+    def _getFilePath(self, mediaSource: MediaSource) -> str:
+        key = "%s:%s" % (mediaSource.type.name, mediaSource.path)
+        return os.path.join(self.path, "%s.snapshot" % hashlib.sha1(key.encode()).hexdigest())
+
+
+class MappedSnapshot(Mapping):
+    """
+    Read-only snapshot backed by a memory-mapped snapshot file. Works as a
+    TreeSnapshot, mapping directory paths to directory states. A directory
+    state is read from the file only when the directory is looked up, and its
+    files only when they are looked up, so loading the snapshot and diffing a
+    tree, where most directories haven't changed, costs only a fraction of
+    the file size in memory.
+
+    Directory paths are interned. Each directory keeps only its name and the
+    id of its parent, and full paths are built once they're needed.
+    """
+
+    def __init__(self, filePath: str):
+        with open(filePath, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmap) < _HEADER_SIZE:
+            raise ValueError("Snapshot file is too small.")
+        magic, littleEndian, self.dirCount, self.fileCount, namesSize = _HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or bool(littleEndian) != (sys.byteorder == "little"):
+            raise ValueError("Unknown snapshot file format.")
+
+        view = memoryview(self.mmap)
+        offset = _HEADER_SIZE
+        self.dirs, offset = _mapColumns(view, offset, _DIR_COLUMNS, self.dirCount)
+        self.dirIndex, offset = _mapColumns(view, offset, _DIR_INDEX_COLUMNS, self.dirCount)
+        self.files, offset = _mapColumns(view, offset, _FILE_COLUMNS, self.fileCount)
+        if offset + namesSize != len(self.mmap):
+            raise ValueError("Snapshot file size doesn't match its header.")
+        self.namesOffset = offset
+        # Directory id to directory path, filled in as paths get built
+        self.dirPaths: Dict[int, str] = {}
+
+    def __getitem__(self, path: str) -> DirectoryState:
+        dirId = self._findDirectory(path)
+        if dirId is None:
+            raise KeyError(path)
+
+        return self._getDirectoryState(dirId, path)
+
+    def __iter__(self) -> Iterator[str]:
+        for dirId in range(self.dirCount):
+            yield self._getDirectoryPath(dirId)
+
+    def __len__(self) -> int:
+        return self.dirCount
+
+    def _findDirectory(self, path: str) -> Optional[int]:
+        pathHash = getPathHash(path)
+        hashes = self.dirIndex["hash"]
+        index = bisect.bisect_left(hashes, pathHash)
+        while index < self.dirCount and hashes[index] == pathHash:
+            dirId = self.dirIndex["id"][index]
+            if self._getDirectoryPath(dirId) == path:
+                return dirId
+            index += 1
+
+        return None
+
+    def _getDirectoryState(self, dirId: int, path: str) -> DirectoryState:
+        dirs = self.dirs
+        firstChild = dirs["firstChild"][dirId]
+        childNames = tuple(
+            self._getName(dirs["name"][childId])
+            for childId in range(firstChild, firstChild + dirs["childCount"][dirId])
+        )
+        files = MappedFiles(self, path, dirs["firstFile"][dirId], dirs["fileCount"][dirId])
+
+        return DirectoryState(dirs["inode"][dirId], dirs["mtime"][dirId], files, childNames)
+
+    def _getDirectoryPath(self, dirId: int) -> str:
+        path = self.dirPaths.get(dirId)
+        if path is not None:
+            return path
+
+        name = self._getName(self.dirs["name"][dirId])
+        parentId = self.dirs["parent"][dirId]
+        # Root directory keeps its full path as its name
+        path = name if parentId == _NO_PARENT else os.path.join(self._getDirectoryPath(parentId), name)
+        self.dirPaths[dirId] = path
+        return path
+
+    def _getName(self, nameOffset: int) -> str:
+        start = self.namesOffset + nameOffset
+        end = self.mmap.find(b"\0", start)
+        return self.mmap[start:end].decode("utf-8", "surrogateescape")
+
+
+class MappedFiles(Mapping):
+    """
+    Files of a directory in MappedSnapshot, mapping file names to file states.
+    Files are looked up by binary search over their path hashes.
+    """
+
+    def __init__(self, snapshot: MappedSnapshot, dirPath: str, firstFile: int, fileCount: int):
+        self.snapshot = snapshot
+        self.dirPath = dirPath
+        self.firstFile = firstFile
+        self.fileCount = fileCount
+
+    def __getitem__(self, name: str) -> FileState:
+        files = self.snapshot.files
+        pathHash = getPathHash(os.path.join(self.dirPath, name))
+        end = self.firstFile + self.fileCount
+        index = bisect.bisect_left(files["hash"], pathHash, self.firstFile, end)
+        while index < end and files["hash"][index] == pathHash:
+            if self.snapshot._getName(files["name"][index]) == name:
+                return self._getFileState(index)
+            index += 1
+
+        raise KeyError(name)
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self.firstFile, self.firstFile + self.fileCount):
+            yield self.snapshot._getName(self.snapshot.files["name"][index])
+
+    def __len__(self) -> int:
+        return self.fileCount
+
+    def items(self):
+        # Reads names and states in one go, instead of looking up each name
+        for index in range(self.firstFile, self.firstFile + self.fileCount):
+            yield self.snapshot._getName(self.snapshot.files["name"][index]), self._getFileState(index)
+
+    def _getFileState(self, index: int) -> FileState:
+        files = self.snapshot.files
+        return FileState(files["inode"][index], files["size"][index], files["mtime"][index])
+
+
+def writeSnapshot(filePath: str, rootPath: str, snapshot: TreeSnapshot):
+    """
+    Writes the snapshot into a file in the format MappedSnapshot reads. Only
+    directories that can be reached from the root directory are written.
+    Directories are written level by level, so subdirectories of a directory
+    go one after another.
+    """
+
+    dirs = {name: array.array(typeCode) for name, typeCode in _DIR_COLUMNS}
+    files = {name: array.array(typeCode) for name, typeCode in _FILE_COLUMNS}
+    names = _NamesTable()
+
+    dirPaths = [rootPath]
+    dirStates = [snapshot[rootPath]]
+    parentIds = [_NO_PARENT]
+    dirNames = [rootPath]
+    dirId = 0
+    while dirId < len(dirPaths):
+        path, state = dirPaths[dirId], dirStates[dirId]
+
+        firstChild = len(dirPaths)
+        for name in state.dirs:
+            childPath = os.path.join(path, name)
+            childState = snapshot.get(childPath)
+            if childState is None:
+                continue
+            dirPaths.append(childPath)
+            dirStates.append(childState)
+            parentIds.append(dirId)
+            dirNames.append(name)
+
+        fileRecords = sorted(
+            (getPathHash(os.path.join(path, name)), name, fileState) for name, fileState in state.files.items()
+        )
+        _appendRow(
+            dirs,
+            hash=getPathHash(path),
+            inode=state.inode,
+            mtime=state.mtime,
+            parent=parentIds[dirId],
+            name=names.add(dirNames[dirId]),
+            firstFile=len(files["hash"]),
+            fileCount=len(fileRecords),
+            firstChild=firstChild,
+            childCount=len(dirPaths) - firstChild,
+        )
+        for pathHash, name, fileState in fileRecords:
+            _appendRow(
+                files,
+                hash=pathHash,
+                inode=fileState.inode,
+                size=fileState.size,
+                mtime=fileState.mtime,
+                parent=dirId,
+                name=names.add(name),
+            )
+
+        dirId += 1
+
+    dirIndex = sorted(zip(dirs["hash"], range(len(dirPaths))))
+    dirIndexColumns = {
+        "hash": array.array("Q", (pathHash for pathHash, _ in dirIndex)),
+        "id": array.array("I", (dirId for _, dirId in dirIndex)),
+    }
+
+    with open(filePath, "wb") as file:
+        header = _HEADER.pack(MAGIC, sys.byteorder == "little", len(dirPaths), len(files["hash"]), names.size)
+        file.write(header.ljust(_HEADER_SIZE, b"\0"))
+        for columns, columnTypes in [
+            (dirs, _DIR_COLUMNS),
+            (dirIndexColumns, _DIR_INDEX_COLUMNS),
+            (files, _FILE_COLUMNS),
+        ]:
+            for name, _ in columnTypes:
+                data = columns[name].tobytes()
+                file.write(data)
+                file.write(b"\0" * _getPadding(len(data)))
+        names.write(file)
+
+
+class _NamesTable:
+    """
+    Table of null-terminated names. Every name is stored only once, so names
+    repeated all over the tree, like "Season 1", don't take extra space.
+    """
+
+    def __init__(self):
+        self.offsets: Dict[str, int] = {}
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, name: str) -> int:
+        offset = self.offsets.get(name)
+        if offset is None:
+            data = name.encode("utf-8", "surrogateescape") + b"\0"
+            offset = self.offsets[name] = self.size
+            self.chunks.append(data)
+            self.size += len(data)
+
+        return offset
+
+    def write(self, file):
+        for chunk in self.chunks:
+            file.write(chunk)
+
+
+def _appendRow(columns: Dict[str, array.array], **values):
+    for name, value in values.items():
+        columns[name].append(value)
+
+
+def _mapColumns(view: memoryview, offset: int, columnTypes, count: int) -> Tuple[Dict[str, memoryview], int]:
+    """
+    Maps columns of the given types, starting from the offset, to memory views
+    of numbers. Returns the columns and the offset where the columns end.
+    """
+
+    columns = {}
+    for name, typeCode in columnTypes:
+        size = struct.calcsize(typeCode) * count
+        if offset + size > len(view):
+            raise ValueError("Snapshot file is truncated.")
+        columns[name] = view[offset : offset + size].cast(typeCode)
+        offset += size + _getPadding(size)
+
+    return columns, offset
+
+
+def _getPadding(size: int) -> int:
+    # Columns start at 8-byte boundaries, so numbers in them are aligned
+    return -size % 8
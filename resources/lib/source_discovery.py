@@ -0,0 +1,66 @@
+import threading
+from typing import List, Optional
+import resources.lib.logging as logging
+from resources.lib.library import Library, MediaSource
+from resources.lib.player import Player
+
+
+class SourceDiscovery:
+    """
+    Finds media sources that were added or removed in Kodi while the add-on is
+    running, so those get watched without a restart. Kodi doesn't notify about
+    such changes, so media sources are fetched periodically, with the check
+    method. Only a hash of the fetched media sources is kept between checks,
+    and the callback is called with all media sources only if it changed.
+
+    Checks are skipped while something is playing, so fetching media sources
+    doesn't compete with the playback.
+    """
+
+    def __init__(self, library: Library, player: Player, callback):
+        self.logger = logging.getLogger(self)
+        self.library = library
+        self.player = player
+        self.callback = callback
+        # Checks run on the main thread, while settings changes come from another one
+        self.lock = threading.Lock()
+        self.sourcesHash: Optional[int] = None
+
+    def getMediaSources(self) -> List[MediaSource]:
+        """
+        Fetches media sources and remembers them, so only changes made after
+        this call are reported by the checks.
+        """
+
+        with self.lock:
+            mediaSources = self.library.getMediaSources()
+            self.sourcesHash = _getHash(mediaSources)
+
+            return mediaSources
+
+    def check(self, force: bool = False):
+        """
+        Fetches media sources and calls the callback with them if they changed
+        since the last time. If force is True, the callback is called anyway,
+        even if something is playing.
+        """
+
+        if not force and self.player.isPlaying():
+            self.logger.debug("Playback is active. Skipping media sources check.")
+            return
+
+        with self.lock:
+            mediaSources = self.library.getMediaSources()
+            sourcesHash = _getHash(mediaSources)
+            if not force and sourcesHash == self.sourcesHash:
+                return
+
+            if not force:
+                self.logger.info("Media sources changed in Kodi.")
+            self.sourcesHash = sourcesHash
+            self.callback(mediaSources)
+
+
+def _getHash(mediaSources: List[MediaSource]) -> int:
+    # Order of media sources doesn't matter, only which ones there are
+    return hash(frozenset(mediaSources))
@@ -0,0 +1,156 @@
+import os
+import threading
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+import resources.lib.logging as logging
+from resources.lib.library import MediaSource
+
+
+class Outcome(Enum):
+    finished = 1
+    notStarted = 2  # Kodi didn't start the scan or clean in time
+
+
+class TaskExecution(NamedTuple):
+    task: object
+    outcome: Outcome
+    duration: float  # Seconds, of the whole task
+    # Path and duration in seconds of each Kodi call that finished, the path is None for the whole library
+    callDurations: Tuple[Tuple[Optional[str], float], ...]
+
+    @property
+    def directoryCount(self) -> int:
+        return len(self.task.paths)
+
+
+class TaskCostEstimator:
+    """
+    Estimates how long library tasks take to execute, in seconds, from how long
+    Kodi calls of the same task type and media source took before. Kodi scans
+    and cleans a directory with all of its subdirectories, so the closer the
+    directory is to the root of the media source, the longer it takes. That's
+    why durations are kept per depth of the directory in the media source, and
+    separately for the whole library, as exponential moving averages, so recent
+    calls weigh more.
+
+    Until a call of the kind has been made, defaults are used, which make calls
+    for the whole library the most expensive ones.
+
+    The estimates are used to order queued tasks, and to choose how to scope
+    tasks when a batch of changes is turned into tasks. See planScope.
+    """
+
+    # Weight of the latest duration in the moving average
+    SMOOTHING = 0.3
+    # Default durations in seconds, of a call for a directory by its depth in the
+    # media source, with the last one used for all deeper ones, and of a call for
+    # the whole library.
+    DIRECTORY_COSTS = (120, 10, 2)
+    LIBRARY_COST = 600
+
+    def __init__(self):
+        self.logger = logging.getLogger(self)
+        self.lock = threading.Lock()
+        # Key is the task type, its media source and the depth of the directory, None
+        # for the whole library, value is the average duration of a call.
+        self.durations: Dict[Tuple[Type, MediaSource, Optional[int]], float] = {}
+
+    def estimate(self, task) -> float:
+        return self._estimate(type(task), task.mediaSource, task.paths)
+
+    def recordExecution(self, execution: TaskExecution):
+        """
+        Adds durations of the finished Kodi calls of the executed task to the
+        history.
+        """
+
+        taskType = type(execution.task)
+        mediaSource = execution.task.mediaSource
+        with self.lock:
+            for path, duration in execution.callDurations:
+                key = (taskType, mediaSource, self._getDepth(mediaSource, path))
+                average = self.durations.get(key)
+                if average is None:
+                    self.durations[key] = duration
+                else:
+                    self.durations[key] = self.SMOOTHING * duration + (1 - self.SMOOTHING) * average
+
+    def planScope(self, taskType: Type, mediaSource: MediaSource, paths: List[str]) -> List[str]:
+        """
+        Chooses the cheapest way to process the directories, all located in the
+        media source: a call per directory, a single call for their closest
+        common parent directory, or a call for the whole library, which takes an
+        empty list of directories. Returns directories the task should be for.
+        """
+
+        if len(paths) == 0:
+            return paths
+
+        options = [("directories", paths)]
+        commonPath = _getCommonPath(paths)
+        if len(paths) > 1 and commonPath is not None and self._getDepth(mediaSource, commonPath) is not None:
+            options.append(("common parent directory", [commonPath]))
+        options.append(("whole library", []))
+
+        costs = [self._estimate(taskType, mediaSource, p) for _, p in options]
+        index = costs.index(min(costs))
+        if index > 0:
+            self.logger.info(
+                'Processing %i directories of "%s" as %s: %s.'
+                % (
+                    len(paths),
+                    mediaSource.path,
+                    options[index][0],
+                    ", ".join("%s %.0f seconds" % (name, cost) for (name, _), cost in zip(options, costs)),
+                )
+            )
+
+        return options[index][1]
+
+    def _estimate(self, taskType: Type, mediaSource: MediaSource, paths) -> float:
+        with self.lock:
+            return sum(self._getCallCost(taskType, mediaSource, p) for p in paths or (None,))
+
+    def _getCallCost(self, taskType: Type, mediaSource: MediaSource, path: Optional[str]) -> float:
+        """
+        Should be called with the lock acquired.
+        """
+
+        depth = self._getDepth(mediaSource, path)
+        duration = self.durations.get((taskType, mediaSource, depth))
+        if duration is not None:
+            return duration
+        if depth is None:
+            return self.LIBRARY_COST
+
+        return self.DIRECTORY_COSTS[depth]
+
+    def _getDepth(self, mediaSource: MediaSource, path: Optional[str]) -> Optional[int]:
+        """
+        Returns the depth of the directory in the media source, up to the last of
+        DIRECTORY_COSTS, or None for the whole library and directories located
+        outside of the media source.
+        """
+
+        if path is None:
+            return None
+
+        try:
+            relativePath = os.path.relpath(path, mediaSource.path)
+        except ValueError:
+            # Paths are on different drives
+            return None
+        if relativePath == os.curdir:
+            return 0
+        if relativePath == os.pardir or relativePath.startswith(os.pardir + os.sep):
+            return None
+
+        return min(len(relativePath.split(os.sep)), len(self.DIRECTORY_COSTS) - 1)
+
+
+def _getCommonPath(paths: List[str]) -> Optional[str]:
+    try:
+        return os.path.commonpath(paths)
+    except ValueError:
+        # Paths are on different drives
+        return None
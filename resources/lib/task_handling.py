@@ -1,62 +1,98 @@
+import os
 import threading
+import time
 import xbmc
+from resources.lib.jsonrpc import JsonRpcClient
 from resources.lib.library import InvalidMediaTypeException, MediaType
 import resources.lib.logging as logging
 import resources.lib.monitoring as monitoring
+from resources.lib.task_costs import Outcome, TaskCostEstimator, TaskExecution
 import resources.lib.tasks as tasks
 
 
 class TaskHandlerFactory:
-    def __init__(self, monitor: monitoring.Monitor):
+    def __init__(self, monitor: monitoring.Monitor, costEstimator: TaskCostEstimator = None):
         self.monitor = monitor
+        self.costEstimator = costEstimator
 
     def getHandler(self, task):
         if type(task) is tasks.CleanLibrary:
-            return CleanLibraryTaskHandler(task, self.monitor)
+            return CleanLibraryTaskHandler(task, self.monitor, self.costEstimator)
         if type(task) is tasks.UpdateLibrary:
-            return UpdateLibraryTaskHandler(task, self.monitor)
+            return UpdateLibraryTaskHandler(task, self.monitor, self.costEstimator)
         raise NotImplementedError()
 
 
 class CleanLibraryTaskHandler:
     WAIT_TO_START_TIMEOUT = 5
 
-    def __init__(self, task: tasks.CleanLibrary, monitor: monitoring.Monitor) -> None:
+    def __init__(
+        self, task: tasks.CleanLibrary, monitor: monitoring.Monitor, costEstimator: TaskCostEstimator = None
+    ) -> None:
         self.logger = logging.getLogger(self)
         self.task = task
         self.monitor = monitor
+        # Gets durations of executions, so costs of later tasks can be estimated
+        self.costEstimator = costEstimator
+        self.rpcClient = JsonRpcClient()
+        # Only events of the library of the task are waited for, as the other
+        # library can be scanned or cleaned at the same time.
+        self.library = _getMediaTypeString(task.mediaSource.type)
         self.startEvent = threading.Event()
         self.finishEvent = threading.Event()
 
-    def execute(self):
+    def execute(self) -> bool:
         """
         Triggers Kodi command to clean the library. Waits for the clean
         to start first and then waits for it to finish. Blocks the thread
-        while waiting.
+        while waiting. Returns True once it's finished, or False if it
+        didn't start in time.
         """
 
         self.logger.info("Starting library clean...")
 
-        self.monitor.attach(monitoring.Event.onCleanStarted, self._onStarted)
-        self.monitor.attach(monitoring.Event.onCleanFinished, self._onFinished)
+        startTime = time.monotonic()
+        outcome = Outcome.finished
+        callDurations = []
+        self.monitor.attach(monitoring.Event.onCleanStarted, self._onStarted, self.library)
+        self.monitor.attach(monitoring.Event.onCleanFinished, self._onFinished, self.library)
         try:
-            self._executeKodiCommand()
-
-            self.logger.debug("Waiting for Kodi library clean to start.")
-            started = self.startEvent.wait(self.WAIT_TO_START_TIMEOUT)
-            if not started:
-                self.logger.warn("Waiting for Kodi library clean to start has timed out.")
-                return
-
-            # No timeout here for waiting as it can take a pretty long time for the clean
-            # to finish. The event should always get raised by Kodi. It's raised when
-            # the clean succeeds, fails or if we exit Kodi during the clean.
-            self.finishEvent.wait()
+            # Kodi cleans one directory at a time, so the clean is triggered for
+            # each directory of the task, one after another.
+            for path in self.task.paths or (None,):
+                callStartTime = time.monotonic()
+                if not self._executeKodiCommandAndWait(path):
+                    outcome = Outcome.notStarted
+                    break
+                callDurations.append((path, time.monotonic() - callStartTime))
         finally:
-            self.monitor.detach(monitoring.Event.onCleanStarted, self._onStarted)
-            self.monitor.detach(monitoring.Event.onCleanFinished, self._onFinished)
+            self.monitor.detach(monitoring.Event.onCleanStarted, self._onStarted, self.library)
+            self.monitor.detach(monitoring.Event.onCleanFinished, self._onFinished, self.library)
+
+        execution = TaskExecution(self.task, outcome, time.monotonic() - startTime, tuple(callDurations))
+        _recordExecution(self.logger, self.costEstimator, execution)
+        if outcome != Outcome.finished:
+            return False
 
         self.logger.info("Finished library clean.")
+        return True
+
+    def _executeKodiCommandAndWait(self, path: str) -> bool:
+        self.startEvent.clear()
+        self.finishEvent.clear()
+        self._executeKodiCommand(path)
+
+        self.logger.debug("Waiting for Kodi library clean to start.")
+        started = self.startEvent.wait(self.WAIT_TO_START_TIMEOUT)
+        if not started:
+            self.logger.warn("Waiting for Kodi library clean to start has timed out.")
+            return False
+
+        # No timeout here for waiting as it can take a pretty long time for the clean
+        # to finish. The event should always get raised by Kodi. It's raised when
+        # the clean succeeds, fails or if we exit Kodi during the clean.
+        self.finishEvent.wait()
+        return True
 
     def _onStarted(self):
         self.startEvent.set()
@@ -64,51 +100,93 @@ class CleanLibraryTaskHandler:
     def _onFinished(self):
         self.finishEvent.set()
 
-    def _executeKodiCommand(self):
-        func = "cleanlibrary(%s)" % _getMediaTypeString(self.task.mediaSource.type)
-        xbmc.executebuiltin(func)
-        self.logger.debug('Called "%s" Kodi built-in function.' % func)
+    def _executeKodiCommand(self, path: str):
+        if path is None:
+            func = "cleanlibrary(%s)" % _getMediaTypeString(self.task.mediaSource.type)
+            xbmc.executebuiltin(func)
+            self.logger.debug('Called "%s" Kodi built-in function.' % func)
+            return
+
+        # Only video library supports cleaning of a directory. The built-in function
+        # doesn't take a directory parameter, so JSONRPC API is used instead.
+        if self.task.mediaSource.type != MediaType.video:
+            raise InvalidMediaTypeException(self.task.mediaSource.type)
+
+        method = "VideoLibrary.Clean"
+        self.rpcClient.call(method, {"directory": os.path.join(path, "")})
+        self.logger.debug('Called "%s" JSONRPC method for "%s".' % (method, path))
 
 
 class UpdateLibraryTaskHandler:
     WAIT_TO_START_TIMEOUT = 5
 
-    def __init__(self, task: tasks.UpdateLibrary, monitor: monitoring.Monitor) -> None:
+    def __init__(
+        self, task: tasks.UpdateLibrary, monitor: monitoring.Monitor, costEstimator: TaskCostEstimator = None
+    ) -> None:
         self.logger = logging.getLogger(self)
         self.task = task
         self.monitor = monitor
+        # Gets durations of executions, so costs of later tasks can be estimated
+        self.costEstimator = costEstimator
+        self.rpcClient = JsonRpcClient()
+        # Only events of the library of the task are waited for, as the other
+        # library can be scanned or cleaned at the same time.
+        self.library = _getMediaTypeString(task.mediaSource.type)
         self.startEvent = threading.Event()
         self.finishEvent = threading.Event()
 
-    def execute(self):
+    def execute(self) -> bool:
         """
         Triggers Kodi command to update the library. Waits for the update
         to start first and then waits for it to finish. Blocks the thread
-        while waiting.
+        while waiting. Returns True once it's finished, or False if it
+        didn't start in time.
         """
 
         self.logger.info("Starting library scan...")
 
-        self.monitor.attach(monitoring.Event.onScanStarted, self._onStarted)
-        self.monitor.attach(monitoring.Event.onScanFinished, self._onFinished)
+        startTime = time.monotonic()
+        outcome = Outcome.finished
+        callDurations = []
+        self.monitor.attach(monitoring.Event.onScanStarted, self._onStarted, self.library)
+        self.monitor.attach(monitoring.Event.onScanFinished, self._onFinished, self.library)
         try:
-            self._executeKodiCommand()
-
-            self.logger.debug("Waiting for Kodi library scan to start.")
-            started = self.startEvent.wait(self.WAIT_TO_START_TIMEOUT)
-            if not started:
-                self.logger.warn("Waiting for Kodi library scan to start has timed out.")
-                return
-
-            # No timeout here for waiting as it can take a pretty long time for the scan
-            # to finish. The event should always get raised by Kodi. It's raised when
-            # the scan succeeds, fails or if we exit Kodi during the scan.
-            self.finishEvent.wait()
+            # Kodi scans one directory at a time, so the scan is triggered for
+            # each directory of the task, one after another.
+            for path in self.task.paths or (None,):
+                callStartTime = time.monotonic()
+                if not self._executeKodiCommandAndWait(path):
+                    outcome = Outcome.notStarted
+                    break
+                callDurations.append((path, time.monotonic() - callStartTime))
         finally:
-            self.monitor.detach(monitoring.Event.onScanStarted, self._onStarted)
-            self.monitor.detach(monitoring.Event.onScanFinished, self._onFinished)
+            self.monitor.detach(monitoring.Event.onScanStarted, self._onStarted, self.library)
+            self.monitor.detach(monitoring.Event.onScanFinished, self._onFinished, self.library)
+
+        execution = TaskExecution(self.task, outcome, time.monotonic() - startTime, tuple(callDurations))
+        _recordExecution(self.logger, self.costEstimator, execution)
+        if outcome != Outcome.finished:
+            return False
 
         self.logger.info("Finished library scan.")
+        return True
+
+    def _executeKodiCommandAndWait(self, path: str) -> bool:
+        self.startEvent.clear()
+        self.finishEvent.clear()
+        self._executeKodiCommand(path)
+
+        self.logger.debug("Waiting for Kodi library scan to start.")
+        started = self.startEvent.wait(self.WAIT_TO_START_TIMEOUT)
+        if not started:
+            self.logger.warn("Waiting for Kodi library scan to start has timed out.")
+            return False
+
+        # No timeout here for waiting as it can take a pretty long time for the scan
+        # to finish. The event should always get raised by Kodi. It's raised when
+        # the scan succeeds, fails or if we exit Kodi during the scan.
+        self.finishEvent.wait()
+        return True
 
     def _onStarted(self):
         self.startEvent.set()
@@ -116,10 +194,29 @@ class UpdateLibraryTaskHandler:
     def _onFinished(self):
         self.finishEvent.set()
 
-    def _executeKodiCommand(self):
-        func = "updatelibrary(%s)" % _getMediaTypeString(self.task.mediaSource.type)
-        xbmc.executebuiltin(func)
-        self.logger.debug('Called "%s" Kodi built-in function.' % func)
+    def _executeKodiCommand(self, path: str):
+        if path is None:
+            func = "updatelibrary(%s)" % _getMediaTypeString(self.task.mediaSource.type)
+            xbmc.executebuiltin(func)
+            self.logger.debug('Called "%s" Kodi built-in function.' % func)
+            return
+
+        # Scanning only the changed directory is done with JSONRPC API, instead of passing
+        # the directory to the built-in function, as paths with commas, quotes or trailing
+        # backslashes (Windows) would need to be escaped for the built-in function parameters.
+        # Kodi stores directory paths with a trailing separator, so the one is added as well.
+        method = "%s.Scan" % _getLibraryNamespace(self.task.mediaSource.type)
+        self.rpcClient.call(method, {"directory": os.path.join(path, "")})
+        self.logger.debug('Called "%s" JSONRPC method for "%s".' % (method, path))
+
+
+def _recordExecution(logger: logging.Logger, costEstimator: TaskCostEstimator, execution: TaskExecution):
+    logger.info(
+        'Task outcome is "%s", took %.1f seconds for %i directories: %s.'
+        % (execution.outcome.name, execution.duration, execution.directoryCount, execution.task)
+    )
+    if costEstimator is not None:
+        costEstimator.recordExecution(execution)
 
 
 def _getMediaTypeString(mediaType: MediaType) -> str:
@@ -133,3 +230,16 @@ def _getMediaTypeString(mediaType: MediaType) -> str:
     if mediaType == MediaType.music:
         return "music"
     raise InvalidMediaTypeException(mediaType)
+
+
+def _getLibraryNamespace(mediaType: MediaType) -> str:
+    """
+    Returns JSONRPC API namespace of the library for media type, for
+    example "VideoLibrary" for "VideoLibrary.Scan" method.
+    """
+
+    if mediaType == MediaType.video:
+        return "VideoLibrary"
+    if mediaType == MediaType.music:
+        return "AudioLibrary"
+    raise InvalidMediaTypeException(mediaType)
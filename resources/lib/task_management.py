@@ -1,64 +1,250 @@
+import heapq
+import itertools
 import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type
 import resources.lib.logging as logging
+from resources.lib.library import MediaSource, MediaType
 from resources.lib.monitoring import Monitor
+from resources.lib.playback_policy import PlaybackPolicy
 import resources.lib.player as player
+from resources.lib.rate_limiting import TokenBucket
+from resources.lib.scheduling import Debouncer, Scheduler
+from resources.lib.settings import Settings
+from resources.lib.task_costs import TaskCostEstimator
 from resources.lib.task_handling import TaskHandlerFactory
+import resources.lib.tasks as tasks
+from resources.lib.util.path_trie import PathTrie
 
 
 class TaskManagerAbortException(BaseException):
     pass
 
 
-class TaskManager(threading.Thread):
+class TaskManager:
+    """
+    Executes library tasks once no new tasks were added for a while and the
+    playback policy allows them. Kodi scans and cleans video and music
+    libraries independently, so tasks of each media type are executed in their
+    own lane, with its own queue and thread. A long music clean doesn't hold
+    back video scans then.
+    """
+
+    # Default debounce wait times in seconds, used when no settings are provided.
+    # Tasks get executed once no new tasks were added for DEBOUNCE_WAIT seconds,
+    # but no later than MAX_DEBOUNCE_WAIT seconds after the first task was added.
     DEBOUNCE_WAIT = 1
+    MAX_DEBOUNCE_WAIT = 60
+    # Default number of library scans and cleans allowed per hour for each media
+    # type, used when no settings are provided. 0 stands for no limit.
+    MAX_SCANS_PER_HOUR = 0
+    MAX_CLEANS_PER_HOUR = 0
 
-    def __init__(self, monitor: Monitor):
-        super().__init__()
+    def __init__(self, monitor: Monitor, settings: Settings = None, costEstimator: TaskCostEstimator = None):
         self.logger = logging.getLogger(self)
+        self.settings = settings
         self.player = player.Player()
-        self.player.attach(player.Event.onPlayBackFinished, self._onPlaybackStopped)
-        self.tasks = TaskQueue()
-        self.tasksLock = threading.Condition()
-        self.taskHandlerFactory = TaskHandlerFactory(monitor)
-        self.stopRequested = False
-        self.debounceTimer = None
+        self.player.attach(player.Event.onPlayBackStateChanged, self._onPlaybackStateChanged)
+        # Shared with the change batcher, which uses it to scope tasks
+        self.costEstimator = costEstimator or TaskCostEstimator()
+        taskHandlerFactory = TaskHandlerFactory(monitor, self.costEstimator)
+        self.lanes: Dict[MediaType, TaskLane] = {
+            t: TaskLane(t, self.player, taskHandlerFactory, self.costEstimator) for t in MediaType
+        }
+        self._updateBudgets()
+        self.scheduler = Scheduler()
+        self.debouncer = Debouncer(self.scheduler, self._onDebounced)
 
     def __enter__(self):
-        self.start()
+        self.scheduler.start()
+        for lane in self.lanes.values():
+            lane.start()
 
         return self
 
     def __exit__(self, *args):
-        # Should be true only of the thread hasn't been started
-        if not self.is_alive():
+        # The scheduler thread has to be stopped even if the lane threads have
+        # already ended, due to an exception during task execution.
+        self.scheduler.stop()
+
+        # Should be true only if the threads haven't been started
+        if not any(lane.is_alive() for lane in self.lanes.values()):
             return
 
         self.logger.info("Stopping...")
-        self._stop()
-        self.join()
+        for lane in self.lanes.values():
+            lane.stop()
+        for lane in self.lanes.values():
+            lane.join()
+        for mediaType, throttledTime in self.getThrottledTimes().items():
+            if throttledTime > 0:
+                self.logger.info(
+                    '"%s" tasks waited %.0f seconds in total for their budget.' % (mediaType.name, throttledTime)
+                )
         self.logger.info("Stopped.")
 
     def clear(self):
-        with self.tasksLock:
-            self.tasks.clear()
+        for lane in self.lanes.values():
+            lane.clear()
+
+    def removeTasks(self, mediaSources: Iterable[MediaSource]):
+        """
+        Removes queued tasks of the media sources, for example, when those are
+        not watched anymore. Tasks of other media sources are kept.
+        """
+
+        mediaSources = set(mediaSources)
+        for lane in self.lanes.values():
+            lane.removeTasks(mediaSources)
+
+    def isIdle(self) -> bool:
+        """
+        Checks whether there are no tasks waiting in the queues or being executed.
+        """
+
+        return all(lane.isIdle() for lane in self.lanes.values())
+
+    def getThrottledTimes(self) -> Dict[MediaType, float]:
+        """
+        Returns seconds each lane has spent waiting for its budget of library
+        scans and cleans, since the task manager was created.
+        """
+
+        return {mediaType: lane.getThrottledTime() for mediaType, lane in self.lanes.items()}
+
+    def onSettingsChanged(self):
+        """
+        Passes changed budgets to the lanes, which apply those right away, even
+        if they are waiting for their budget.
+        """
+
+        self._updateBudgets()
 
     def add(self, task):
-        def timerCallback():
-            with self.tasksLock:
-                # Notify the lock to check the waiting condition, as new task
-                # has been added.
-                self.tasksLock.notify()
+        self.lanes[task.mediaSource.type].add(task)
+
+        # Touch the debouncer, which will notify the lanes about added tasks
+        # once no new tasks get added for a while.
+        self.debouncer.touch(self._getDebounceWait(), self._getMaxDebounceWait())
+
+    def _onDebounced(self):
+        for lane in self.lanes.values():
+            lane.notify()
+
+    def _getDebounceWait(self) -> float:
+        return self.settings.getDebounceWait() if self.settings is not None else self.DEBOUNCE_WAIT
+
+    def _getMaxDebounceWait(self) -> float:
+        return self.settings.getMaxDebounceWait() if self.settings is not None else self.MAX_DEBOUNCE_WAIT
+
+    def _updateBudgets(self):
+        # Settings are read here, once, so lanes don't read those while holding their lock
+        budgets = {
+            tasks.UpdateLibrary: (
+                self.settings.getMaxScansPerHour() if self.settings is not None else self.MAX_SCANS_PER_HOUR
+            ),
+            tasks.CleanLibrary: (
+                self.settings.getMaxCleansPerHour() if self.settings is not None else self.MAX_CLEANS_PER_HOUR
+            ),
+        }
+        for lane in self.lanes.values():
+            lane.setBudgets(budgets)
+
+    def _onPlaybackStateChanged(self):
+        # Lanes check the player state again, as tasks held back by the playback
+        # policy might be allowed now.
+        for lane in self.lanes.values():
+            lane.notify()
+
+
+class TaskLane(threading.Thread):
+    """
+    Executes tasks of a single media type, one at a time, in the order of the
+    task queue. Waits for the task manager to notify it about added tasks or
+    changed playback state. The next task waits for as long as the playback
+    policy doesn't allow it with the cached player state. Task handlers record
+    durations of executed tasks, so the queue can estimate the cost of tasks
+    added later.
+
+    Library scans and cleans are limited by a budget, a number of each allowed
+    per BUDGET_PERIOD seconds, enforced with a token bucket per task type. When
+    the budget is used up, the lane waits for it to refill, while new tasks keep
+    getting queued up. Those get merged with the held back task, so the work is
+    done in the next allowed run and nothing is dropped.
+    """
+
+    BUDGET_PERIOD = 3600
+
+    def __init__(
+        self,
+        mediaType: MediaType,
+        player: player.Player,
+        taskHandlerFactory: TaskHandlerFactory,
+        costEstimator: TaskCostEstimator = None,
+    ):
+        super().__init__()
+        self.logger = logging.getLogger(self)
+        self.mediaType = mediaType
+        self.player = player
+        self.playbackPolicy = PlaybackPolicy()
+        self.taskHandlerFactory = taskHandlerFactory
+        self.tasks = TaskQueue(costEstimator)
+        self.tasksLock = threading.Condition()
+        self.stopRequested = False
+        # Task that is being executed at the moment, if any
+        self.currentTask = None
+        # Capacity of a bucket is the number of tasks of the type allowed per budget period, 0 for no limit
+        self.budgets = {t: TokenBucket(0, self.BUDGET_PERIOD) for t in (tasks.UpdateLibrary, tasks.CleanLibrary)}
+        # Seconds to wait for the budget of the next task to refill, None if it's not used up
+        self.budgetWait: Optional[float] = None
+        self.throttledTime = 0.0
 
+    def add(self, task):
         with self.tasksLock:
-            if self.debounceTimer is not None:
-                self.debounceTimer.cancel()
             self.tasks.append(task)
             self._logTaskQueueSize()
 
-        # Start debounce timer, which will notify the condition lock about added task,
-        # if it doesn't get cancelled by addition of a new task.
-        self.debounceTimer = threading.Timer(self.DEBOUNCE_WAIT, timerCallback)
-        self.debounceTimer.start()
+    def clear(self):
+        with self.tasksLock:
+            self.tasks.clear()
+
+    def removeTasks(self, mediaSources: Set[MediaSource]):
+        with self.tasksLock:
+            self.tasks.removeFor(mediaSources)
+            self._logTaskQueueSize()
+
+    def isIdle(self) -> bool:
+        with self.tasksLock:
+            return self.tasks.size() == 0 and self.currentTask is None
+
+    def getThrottledTime(self) -> float:
+        with self.tasksLock:
+            return self.throttledTime
+
+    def setBudgets(self, budgets: Dict[Type, int]):
+        """
+        Sets the number of tasks of each type allowed per budget period, 0 for
+        no limit. Wakes the lane up, so a lane that is waiting for its budget
+        uses the new one right away.
+        """
+
+        with self.tasksLock:
+            for taskType, capacity in budgets.items():
+                self.budgets[taskType].setCapacity(capacity)
+            self.tasksLock.notify()
+
+    def notify(self):
+        with self.tasksLock:
+            # Notify the lock to check the waiting condition
+            self.tasksLock.notify()
+
+    def stop(self):
+        with self.tasksLock:
+            self.stopRequested = True
+            # Notify the lock to check the waiting condition, as stop
+            # has been initiated.
+            self.tasksLock.notify()
 
     def run(self):
         while True:
@@ -70,19 +256,20 @@ class TaskManager(threading.Thread):
             self.logger.debug("Starting task: %s." % task)
             self._logTaskQueueSize()
 
-            handler = self.taskHandlerFactory.getHandler(task)
-            handler.execute()
-
-            self.logger.debug("Finished task: %s." % task)
+            try:
+                handler = self.taskHandlerFactory.getHandler(task)
+                handler.execute()
+                self.logger.debug("Finished task: %s." % task)
+            except Exception:
+                # The lane keeps going, so a single failed task doesn't stop
+                # tasks of the media type from being executed for good.
+                self.logger.exception("Task failed: %s." % task)
+                logging.notifyError()
+            finally:
+                with self.tasksLock:
+                    self.currentTask = None
             self._logTaskQueueSize()
 
-    def _stop(self):
-        with self.tasksLock:
-            self.stopRequested = True
-            # Notify the lock to check the waiting condition, as stop
-            # has been initiated.
-            self.tasksLock.notify()
-
     def _get(self):
         """
         Removes and returns an item from the task queue. If the queue is empty,
@@ -90,67 +277,206 @@ class TaskManager(threading.Thread):
         """
 
         with self.tasksLock:
+            throttledTime = 0.0
             while self._needToWait():
-                self.tasksLock.wait()
+                waitStartTime = time.monotonic()
+                self.tasksLock.wait(self.budgetWait)
+                if self.budgetWait is not None:
+                    throttledTime += time.monotonic() - waitStartTime
+            self.throttledTime += throttledTime
 
             if self.stopRequested:
                 raise TaskManagerAbortException()
 
             task = self.tasks.pop()
+            self.budgets[type(task)].take()
+            if throttledTime > 0:
+                self.logger.info(
+                    'Resuming "%s" tasks after waiting %.0f seconds for the budget, %.0f seconds in total.'
+                    % (self.mediaType.name, throttledTime, self.throttledTime)
+                )
+                task = self._mergeQueuedTasks(task)
+            self.currentTask = task
             self._logTaskQueueSize()
             return task
 
     def _needToWait(self) -> bool:
+        self.budgetWait = None
+
         if self.stopRequested:
-            self.logger.debug("Stop requested. Not waiting anymore for new tasks.")
+            self.logger.debug('Stop requested. Not waiting anymore for new "%s" tasks.' % self.mediaType.name)
             return False
 
-        if self.player.isPlaying():
-            self.logger.info("Waiting for playback to stop.")
+        if self.tasks.size() == 0:
+            self.logger.info('Waiting for new "%s" tasks.' % self.mediaType.name)
             return True
 
-        if self.tasks.size() == 0:
-            self.logger.info("Waiting for new tasks.")
+        # Only the next task matters, as it's the one that is going to be executed
+        task = self.tasks.peek()
+        playerState = self.player.getState()
+        if not self.playbackPolicy.allows(task, playerState):
+            self.logger.info(
+                'Waiting for playback policy to allow "%s" task, while playback is %s: %s.'
+                % (self.mediaType.name, playerState.status.name, task)
+            )
+            return True
+
+        budget = self.budgets[type(task)]
+        budgetWait = budget.getWaitTime()
+        if budgetWait > 0:
+            self.logger.info(
+                'Budget of %i "%s" tasks per hour is used up. Waiting %.0f seconds to execute: %s.'
+                % (budget.capacity, self.mediaType.name, budgetWait, task)
+            )
+            self.budgetWait = budgetWait
             return True
 
         return False
 
-    def _onPlaybackStopped(self):
-        with self.tasksLock:
-            self.logger.debug("Playback stopped.")
-            # Notify the lock to check the waiting condition, as playback
-            # has be stopped.
-            self.tasksLock.notify()
+    def _mergeQueuedTasks(self, task):
+        """
+        Merges tasks of the same type and media source, that got queued up while
+        waiting for the budget, into the task. Directories of the tasks are
+        collapsed and scoped the same way as those of a batch of changes.
+        """
+
+        queuedTasks = self.tasks.popMatching(type(task), task.mediaSource)
+        if len(queuedTasks) == 0:
+            return task
+
+        mergedTasks = [task] + queuedTasks
+        paths = []
+        if all(len(t.paths) > 0 for t in mergedTasks):
+            pathTrie: PathTrie[str] = PathTrie()
+            for path in (p for t in mergedTasks for p in t.paths):
+                pathTrie.add(path, path)
+            paths = self.tasks.costEstimator.planScope(type(task), task.mediaSource, pathTrie.getRoots())
+
+        mergedTask = type(task)(task.mediaSource, paths)
+        self.logger.info("Merged %i tasks held back by the budget into: %s." % (len(mergedTasks), mergedTask))
+        return mergedTask
 
     def _logTaskQueueSize(self):
-        self.logger.debug("Task queue size: %i." % self.tasks.size())
+        self.logger.debug('"%s" task queue size: %i.' % (self.mediaType.name, self.tasks.size()))
 
 
 class TaskQueue:
     """
-    Ordered queue that doesn't allow duplicates
+    Queue of tasks that doesn't allow duplicates. Tasks are popped in the order
+    of their priority, so scans go ahead of cleans, and then of their estimated
+    cost, so tasks of a few directories go ahead of tasks of many directories or
+    the whole library. Tasks of the same priority and cost are popped in the
+    order they were appended.
+
+    A task that has been waiting for more than MAX_WAIT seconds is popped ahead
+    of the rest, so a stream of cheap tasks can't hold back expensive ones for
+    ever. Even then, a clean never goes ahead of scans appended before it, as
+    those might be scans of the new location of moved files.
+
+    Tasks are kept in a heap, so appending and popping take logarithmic time,
+    and as keys of an insertion-ordered dictionary, so checking for duplicates
+    and finding the oldest task don't depend on the queue size.
     """
 
-    def __init__(self):
+    # Seconds a task can wait before it's popped ahead of cheaper ones
+    MAX_WAIT = 600
+
+    def __init__(self, costEstimator: TaskCostEstimator = None):
         self.logger = logging.getLogger(self)
-        self.tasks = []
+        self.costEstimator = costEstimator or TaskCostEstimator()
+        # Key is the task, value is its queue entry. Ordered by the time tasks were appended.
+        self.entries: "OrderedDict[object, _QueueEntry]" = OrderedDict()
+        # Entries of popped and removed tasks are left in the heap and skipped when popped
+        self.heap: List[Tuple[int, float, int, _QueueEntry]] = []
+        self.sequence = itertools.count()
 
     def append(self, task):
-        if task in self.tasks:
+        if task in self.entries:
             self.logger.debug("Task skipped, as it's already in the queue: %s." % task)
             return
 
-        self.tasks.append(task)
-        self.logger.debug("Task added: %s." % task)
+        entry = _QueueEntry(task, next(self.sequence), time.monotonic())
+        cost = self.costEstimator.estimate(task)
+        self.entries[task] = entry
+        heapq.heappush(self.heap, (task.PRIORITY, cost, entry.sequence, entry))
+        self.logger.debug("Task added, estimated to take %.1f seconds: %s." % (cost, task))
+
+    def peek(self):
+        """
+        Returns the task that is going to be popped next, without removing it.
+        """
+
+        entry = self._getOverdue()
+        if entry is None:
+            entry = self._getNext()
+
+        return entry.task
 
     def pop(self):
-        task = self.tasks.pop(0)
-        self.logger.debug("Task popped: %s." % task)
-        return task
+        entry = self._getOverdue()
+        if entry is None:
+            entry = self._getNext()
+
+        del self.entries[entry.task]
+        entry.removed = True
+        self.logger.debug("Task popped: %s." % entry.task)
+        return entry.task
 
     def clear(self):
-        self.tasks.clear()
+        self.entries.clear()
+        self.heap.clear()
         self.logger.debug("All tasks cleared.")
 
+    def removeFor(self, mediaSources: Set[MediaSource]):
+        removedTasks = [task for task in self.entries if task.mediaSource in mediaSources]
+        for task in removedTasks:
+            self.entries.pop(task).removed = True
+        # Leaves out entries of removed tasks, so the heap doesn't keep growing
+        self.heap = [item for item in self.heap if not item[-1].removed]
+        heapq.heapify(self.heap)
+        self.logger.debug("%i tasks removed." % len(removedTasks))
+
+    def popMatching(self, taskType: Type, mediaSource: MediaSource) -> List:
+        """
+        Removes and returns all tasks of the type and media source, in the order
+        they were appended.
+        """
+
+        matchingTasks = [t for t in self.entries if type(t) is taskType and t.mediaSource == mediaSource]
+        for task in matchingTasks:
+            self.entries.pop(task).removed = True
+
+        return matchingTasks
+
     def size(self):
-        return len(self.tasks)
+        return len(self.entries)
+
+    def _getOverdue(self) -> Optional["_QueueEntry"]:
+        """
+        Returns the oldest entry, if its task has been waiting for too long.
+        As it's the oldest one, no scans were appended before it.
+        """
+
+        oldestEntry = next(iter(self.entries.values()))
+        if time.monotonic() - oldestEntry.appendTime < self.MAX_WAIT:
+            return None
+
+        self.logger.debug("Task has been waiting for too long, it goes first: %s." % oldestEntry.task)
+        return oldestEntry
+
+    def _getNext(self) -> "_QueueEntry":
+        # Entries are left in the heap when popped, and get dropped once they reach its top
+        while self.heap[0][-1].removed:
+            heapq.heappop(self.heap)
+
+        return self.heap[0][-1]
+
+
+class _QueueEntry:
+    __slots__ = ("task", "sequence", "appendTime", "removed")
+
+    def __init__(self, task, sequence: int, appendTime: float):
+        self.task = task
+        self.sequence = sequence
+        self.appendTime = appendTime
+        self.removed = False
@@ -1,23 +1,58 @@
+from typing import Iterable
 from resources.lib.library import MediaSource
 
 
-class UpdateLibrary:
-    def __init__(self, mediaSource: MediaSource):
-        self.mediaSource = mediaSource
+class _LibraryTask:
+    """
+    Base class for immutable library tasks. Tasks are equal when they are of
+    the same type, for the same media type and the same directories, so they
+    can be used as dictionary keys to keep the task queue free of duplicates.
+    """
 
-    def __str__(self) -> str:
-        return 'Library update for "%s" media type' % self.mediaSource.type.name
+    __slots__ = ("mediaSource", "paths", "_key")
+
+    def __init__(self, mediaSource: MediaSource, paths: Iterable[str] = ()):
+        object.__setattr__(self, "mediaSource", mediaSource)
+        # Directories to process. The whole library gets processed if there are none.
+        object.__setattr__(self, "paths", tuple(sorted(set(paths))))
+        # Computed once, as tasks get hashed and compared every time they are queued up
+        object.__setattr__(self, "_key", (type(self), mediaSource.type, self.paths))
+
+    def __setattr__(self, name: str, value: object):
+        raise AttributeError("Tasks are immutable, cannot set '%s' attribute." % name)
+
+    def __delattr__(self, name: str):
+        raise AttributeError("Tasks are immutable, cannot delete '%s' attribute." % name)
 
     def __eq__(self, other: object) -> bool:
-        return type(self) == type(other) and self.mediaSource.type == other.mediaSource.type
+        return isinstance(other, _LibraryTask) and self._key == other._key
 
+    def __hash__(self) -> int:
+        return hash(self._key)
 
-class CleanLibrary:
-    def __init__(self, mediaSource: MediaSource):
-        self.mediaSource = mediaSource
+
+class UpdateLibrary(_LibraryTask):
+    __slots__ = ()
+
+    # Scans go ahead of cleans, as new files are what users wait for
+    PRIORITY = 0
 
     def __str__(self) -> str:
-        return 'Library clean for "%s" media type' % self.mediaSource.type.name
+        return "Library update for %s" % _getScopeString(self.mediaSource, self.paths)
 
-    def __eq__(self, other: object) -> bool:
-        return type(self) == type(other) and self.mediaSource.type == other.mediaSource.type
+
+class CleanLibrary(_LibraryTask):
+    __slots__ = ()
+
+    PRIORITY = 1
+
+    def __str__(self) -> str:
+        return "Library clean for %s" % _getScopeString(self.mediaSource, self.paths)
+
+
+def _getScopeString(mediaSource: MediaSource, paths) -> str:
+    if len(paths) == 0:
+        return '"%s" media type' % mediaSource.type.name
+    if len(paths) == 1:
+        return '"%s" media type in "%s"' % (mediaSource.type.name, paths[0])
+    return '"%s" media type in %i directories' % (mediaSource.type.name, len(paths))
@@ -0,0 +1,437 @@
+import functools
+import os
+import stat
+import time
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, NamedTuple, Set, Tuple, Union
+import resources.lib.logging as logging
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+)
+from watchdog.observers.api import DEFAULT_EMITTER_TIMEOUT, BaseObserver, EventEmitter
+
+
+class FileState(NamedTuple):
+    inode: int
+    size: int
+    mtime: int  # Nanoseconds
+
+
+class DirectoryState(NamedTuple):
+    inode: int
+    mtime: int  # Nanoseconds
+    files: Dict[str, FileState]  # File name to file state
+    dirs: Tuple[str, ...]  # Subdirectory names
+
+
+# Directory path to directory state, for every directory of the tree
+TreeSnapshot = Dict[str, DirectoryState]
+
+
+class TreeDiff(NamedTuple):
+    filesCreated: List[str]
+    filesDeleted: List[str]
+    filesModified: List[str]
+    filesMoved: List[Tuple[str, str]]
+    dirsCreated: List[str]
+    dirsDeleted: List[str]
+    dirsMoved: List[Tuple[str, str]]
+
+
+class TreeDiffer:
+    """
+    Takes snapshots of a directory tree and finds differences between them,
+    visiting only what has changed since the previous snapshot.
+
+    A directory's mtime changes whenever a file or subdirectory is added to,
+    removed from or renamed in that directory. Every known directory is
+    stat-ed on each pass, but only directories with a changed mtime get
+    listed again and have their files stat-ed. A tree of 600k files usually
+    has only a few thousand directories, and mostly none of them change
+    between passes.
+
+    The tree is walked level by level, and stat calls for a whole level are
+    put on the executor at once. That keeps many requests in flight on
+    high-latency network mounts, where each stat is a round trip to the server.
+
+    Hidden files and directories are skipped, the same way EventHandler skips
+    them. This also keeps snapshot directories, like ".snapshot" on NAS
+    shares, out of the walk.
+
+    Only paths that don't exist anymore are reported as deleted. Other errors,
+    like an I/O error on a network mount that is briefly unreachable, leave the
+    affected directories as they are in the snapshot passed in, so those are
+    checked again on the next pass instead.
+    """
+
+    # File systems update mtime with the granularity of a clock tick, or even
+    # a second on some network file systems. A change made within the same
+    # tick right after the directory was listed wouldn't change its mtime,
+    # so directories changed recently get listed again on the next pass.
+    RACY_WINDOW = 2  # Seconds
+
+    def __init__(self, path: str, executor: Executor, fileFilter: Callable[[str], bool] = None):
+        self.path = path
+        self.executor = executor
+        # Files, for which the filter returns false, are left out of snapshots
+        # and are not stat-ed at all.
+        self.fileFilter = fileFilter
+
+    def takeSnapshot(self) -> TreeSnapshot:
+        snapshot, _ = self.diff({})
+        return snapshot
+
+    def diff(self, snapshot: TreeSnapshot) -> Tuple[TreeSnapshot, TreeDiff]:
+        """
+        Takes a new snapshot of the tree, reusing states of directories that
+        haven't changed since the snapshot passed in, and returns it together
+        with the differences between the two. Raises OSError if the root
+        directory of the tree can't be accessed, FileNotFoundError or
+        NotADirectoryError if it's gone.
+        """
+
+        racyTime = time.time_ns() - self.RACY_WINDOW * 1000000000
+        newSnapshot: TreeSnapshot = {}
+        filesCreated: Dict[str, FileState] = {}
+        filesDeleted: Dict[str, FileState] = {}
+        filesModified: List[str] = []
+        dirsCreated: Dict[str, int] = {}
+        dirsDeleted: Dict[str, int] = {}
+
+        rootStat = os.stat(self.path)
+        if not stat.S_ISDIR(rootStat.st_mode):
+            raise NotADirectoryError('"%s" is not a directory.' % self.path)
+
+        # Directories kept from the old snapshot, together with their subdirectories,
+        # as those couldn't be accessed.
+        keptDirs: Set[str] = set()
+        level = [(self.path, rootStat)]
+        while len(level) > 0:
+            changedDirs = []
+            for path, dirStat in level:
+                oldState = snapshot.get(path)
+                if oldState is not None and oldState.inode == dirStat.st_ino and oldState.mtime == dirStat.st_mtime_ns:
+                    newSnapshot[path] = oldState
+                else:
+                    changedDirs.append((path, dirStat))
+
+            for path, newState in self._readDirectories(changedDirs, snapshot, racyTime):
+                if isinstance(newState, OSError):
+                    # A directory that is gone is reported as deleted further down
+                    if not _isGone(newState):
+                        self._keepSubtree(snapshot, path, newSnapshot, keptDirs)
+                    continue
+
+                oldState = snapshot.get(path)
+                if oldState is not None and oldState.inode != newState.inode:
+                    # Directory has been replaced with another one with the same name
+                    self._collectSubtree(snapshot, path, filesDeleted, dirsDeleted)
+                    oldState = None
+                if oldState is None:
+                    dirsCreated[path] = newState.inode
+                    oldState = DirectoryState(0, 0, {}, ())
+                newSnapshot[path] = newState
+
+                for name, fileState in newState.files.items():
+                    oldFileState = oldState.files.get(name)
+                    if oldFileState is None or oldFileState.inode != fileState.inode:
+                        filesCreated[os.path.join(path, name)] = fileState
+                    elif oldFileState.size != fileState.size or oldFileState.mtime != fileState.mtime:
+                        filesModified.append(os.path.join(path, name))
+
+                for name, fileState in oldState.files.items():
+                    newFileState = newState.files.get(name)
+                    if newFileState is None or newFileState.inode != fileState.inode:
+                        filesDeleted[os.path.join(path, name)] = fileState
+
+                for name in set(oldState.dirs).difference(newState.dirs):
+                    self._collectSubtree(snapshot, os.path.join(path, name), filesDeleted, dirsDeleted)
+
+            subdirPaths = [
+                os.path.join(path, name)
+                for path, _ in level
+                if path in newSnapshot and path not in keptDirs
+                for name in newSnapshot[path].dirs
+            ]
+            level = []
+            for path, dirStat in zip(subdirPaths, self.executor.map(_statOrError, subdirPaths)):
+                if not isinstance(dirStat, OSError):
+                    # Directories replaced with something else are left out
+                    if stat.S_ISDIR(dirStat.st_mode):
+                        level.append((path, dirStat))
+                elif not _isGone(dirStat):
+                    self._keepSubtree(snapshot, path, newSnapshot, keptDirs)
+
+        # A directory from the old snapshot, that couldn't be stat-ed even though
+        # its parent hasn't changed, is gone as well. It happens when it's deleted
+        # between the parent and the directory itself being stat-ed.
+        for path in snapshot:
+            if path not in newSnapshot and path not in dirsDeleted and path != self.path:
+                self._collectSubtree(snapshot, path, filesDeleted, dirsDeleted)
+
+        filesMoved = _matchMoves(filesDeleted, filesCreated, lambda fileState: fileState.inode)
+        dirsMoved = _matchMoves(dirsDeleted, dirsCreated, lambda inode: inode)
+
+        return newSnapshot, TreeDiff(
+            sorted(filesCreated),
+            sorted(filesDeleted),
+            sorted(filesModified),
+            filesMoved,
+            sorted(dirsCreated),
+            sorted(dirsDeleted),
+            dirsMoved,
+        )
+
+    def _readDirectories(self, dirs: List[Tuple[str, os.stat_result]], snapshot: TreeSnapshot, racyTime: int):
+        """
+        Lists the directories and stats all files in them, in parallel. Returns
+        new directory states, or the error for directories that couldn't be
+        listed. Directories that have been changed recently, or with files that
+        couldn't be stat-ed, get a zero mtime, so they are read again on the next
+        pass. Until then, such files keep their state from the snapshot.
+        """
+
+        listings = list(self.executor.map(_listDirectory, [path for path, _ in dirs]))
+        if self.fileFilter is not None:
+            listings = [
+                (
+                    listing
+                    if isinstance(listing, OSError)
+                    else ([name for name in listing[0] if self.fileFilter(name)], listing[1])
+                )
+                for listing in listings
+            ]
+        filePaths = [
+            os.path.join(path, name)
+            for (path, _), listing in zip(dirs, listings)
+            if not isinstance(listing, OSError)
+            for name in listing[0]
+        ]
+        fileStats = dict(zip(filePaths, self.executor.map(_statOrError, filePaths)))
+
+        for (path, dirStat), listing in zip(dirs, listings):
+            if isinstance(listing, OSError):
+                yield path, listing
+                continue
+
+            fileNames, dirNames = listing
+            oldState = snapshot.get(path)
+            oldFiles = oldState.files if oldState is not None and oldState.inode == dirStat.st_ino else {}
+            files = {}
+            complete = True
+            for name in fileNames:
+                fileStat = fileStats[os.path.join(path, name)]
+                if isinstance(fileStat, OSError):
+                    if not _isGone(fileStat):
+                        complete = False
+                        if name in oldFiles:
+                            files[name] = oldFiles[name]
+                # Symbolic links to directories are listed as files, but are not followed
+                elif not stat.S_ISDIR(fileStat.st_mode):
+                    files[name] = FileState(fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns)
+
+            mtime = dirStat.st_mtime_ns if complete and dirStat.st_mtime_ns < racyTime else 0
+            yield path, DirectoryState(dirStat.st_ino, mtime, files, dirNames)
+
+    def _keepSubtree(self, snapshot: TreeSnapshot, path: str, newSnapshot: TreeSnapshot, keptDirs: Set[str]):
+        """
+        Copies the directory and everything inside it from the snapshot to the
+        new one, for a directory that couldn't be accessed.
+        """
+
+        state = snapshot.get(path)
+        if state is None:
+            return
+
+        newSnapshot[path] = state
+        keptDirs.add(path)
+        for name in state.dirs:
+            self._keepSubtree(snapshot, os.path.join(path, name), newSnapshot, keptDirs)
+
+    def _collectSubtree(
+        self,
+        snapshot: TreeSnapshot,
+        path: str,
+        filesDeleted: Dict[str, FileState],
+        dirsDeleted: Dict[str, int],
+    ):
+        """
+        Adds the directory and everything inside it, as it's known from the
+        snapshot, to the deleted files and directories.
+        """
+
+        state = snapshot.get(path)
+        if state is None:
+            return
+
+        dirsDeleted[path] = state.inode
+        for name, fileState in state.files.items():
+            filesDeleted[os.path.join(path, name)] = fileState
+        for name in state.dirs:
+            self._collectSubtree(snapshot, os.path.join(path, name), filesDeleted, dirsDeleted)
+
+
+class TreeDiffEmitter(EventEmitter):
+    """
+    Polling emitter that uses TreeDiffer to find changes, instead of taking a
+    full snapshot of the tree on every pass, as watchdog's PollingEmitter does.
+    Starts from the snapshot passed in, if there is one, or takes a new one.
+
+    Extra keyword arguments are passed over to EventEmitter as they are, as
+    different versions of watchdog pass different arguments to emitters.
+    """
+
+    def __init__(
+        self,
+        event_queue,
+        watch,
+        timeout=DEFAULT_EMITTER_TIMEOUT,
+        executor: Executor = None,
+        snapshot: TreeSnapshot = None,
+        fileFilter: Callable[[str], bool] = None,
+        **kwargs
+    ):
+        super().__init__(event_queue, watch, timeout=timeout, **kwargs)
+        self.logger = logging.getLogger(self)
+        self.differ = TreeDiffer(watch.path, executor, fileFilter)
+        self.snapshot = snapshot
+
+    def on_thread_start(self):
+        if self.snapshot is None:
+            self.snapshot = self.differ.takeSnapshot()
+
+    def queue_events(self, timeout):
+        # Timeout works as polling interval, so file system is not hit continuously
+        if self.stopped_event.wait(timeout):
+            return
+
+        try:
+            start = time.perf_counter()
+            self.snapshot, diff = self.differ.diff(self.snapshot)
+        except OSError as e:
+            if _isGone(e):
+                self.queue_event(DirDeletedEvent(self.watch.path))
+                self.stop()
+                return
+            # Network mounts can be unreachable for a moment, so the previous
+            # snapshot is kept and the tree is polled again on the next pass.
+            self.logger.warn('Polling "%s" failed, trying again later. Error: "%s".' % (self.watch.path, e))
+            return
+
+        self.logger.debug(
+            'Polled "%s" in %.3f seconds, %i directories.'
+            % (self.watch.path, time.perf_counter() - start, len(self.snapshot))
+        )
+
+        for event in getEvents(diff):
+            self.queue_event(event)
+
+
+class TreeDiffObserver(BaseObserver):
+    """
+    Polling observer that uses TreeDiffEmitter. Stat calls of all emitters
+    run on the executor passed in. The snapshot passed in is used as the
+    starting point for watches, so changes made after it was taken are not
+    missed.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        timeout: float = DEFAULT_EMITTER_TIMEOUT,
+        snapshot: TreeSnapshot = None,
+        fileFilter: Callable[[str], bool] = None,
+    ):
+        emitterClass = functools.partial(TreeDiffEmitter, executor=executor, snapshot=snapshot, fileFilter=fileFilter)
+        super().__init__(emitterClass, timeout=timeout)
+
+
+def getEvents(diff: TreeDiff) -> List[FileSystemEvent]:
+    """
+    Turns differences between two snapshots into file system events, in the
+    same order as watchdog's PollingEmitter queues them.
+    """
+
+    return (
+        [FileDeletedEvent(path) for path in diff.filesDeleted]
+        + [FileModifiedEvent(path) for path in diff.filesModified]
+        + [FileCreatedEvent(path) for path in diff.filesCreated]
+        + [FileMovedEvent(srcPath, destPath) for srcPath, destPath in diff.filesMoved]
+        + [DirDeletedEvent(path) for path in diff.dirsDeleted]
+        + [DirCreatedEvent(path) for path in diff.dirsCreated]
+        + [DirMovedEvent(srcPath, destPath) for srcPath, destPath in diff.dirsMoved]
+    )
+
+
+def _isGone(error: OSError) -> bool:
+    """
+    Checks whether the error means that the path doesn't exist anymore, as
+    opposed to errors that can go away, like I/O errors.
+    """
+
+    return isinstance(error, (FileNotFoundError, NotADirectoryError))
+
+
+def _statOrError(path: str) -> Union[os.stat_result, OSError]:
+    try:
+        return os.stat(path)
+    except OSError as e:
+        return e
+
+
+def _listDirectory(path: str) -> Union[Tuple[List[str], Tuple[str, ...]], OSError]:
+    """
+    Returns names of files and subdirectories in the directory, skipping
+    hidden ones, or the error if the directory can't be listed. Symbolic links
+    to directories are not followed, so links pointing back up the tree can't
+    make the walk endless.
+    """
+
+    fileNames = []
+    dirNames = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    dirNames.append(entry.name)
+                else:
+                    fileNames.append(entry.name)
+    except OSError as e:
+        return e
+
+    return fileNames, tuple(sorted(dirNames))
+
+
+def _matchMoves(deleted: Dict, created: Dict, getInode) -> List[Tuple[str, str]]:
+    """
+    Matches deleted and created paths by their inode and turns them into
+    moves. Matched paths are removed from the deleted and created ones.
+    Zero inodes are not matched, as some network file systems don't provide
+    real inode numbers.
+    """
+
+    createdByInode = {}
+    for path, value in created.items():
+        inode = getInode(value)
+        if inode != 0:
+            createdByInode[inode] = path
+
+    result = []
+    for srcPath, value in list(deleted.items()):
+        destPath = createdByInode.pop(getInode(value), None)
+        if destPath is None:
+            continue
+        result.append((srcPath, destPath))
+        del deleted[srcPath]
+        del created[destPath]
+
+    return sorted(result)
@@ -1,4 +1,16 @@
+import hashlib
 import os
+import re
+from typing import List, NamedTuple, Optional
+
+MOUNT_INFO_PATH = "/proc/self/mountinfo"
+INOTIFY_WATCH_LIMIT_PATH = "/proc/sys/fs/inotify/max_user_watches"
+
+# File system types, changes on which can be made by other machines, so inotify
+# doesn't get to know about them. FUSE file systems are checked separately.
+REMOTE_FILE_SYSTEM_TYPES = frozenset(
+    ["cifs", "smb3", "smbfs", "nfs", "nfs4", "9p", "afs", "ceph", "glusterfs", "davfs"]
+)
 
 
 def isHidden(basePath, path):
@@ -35,3 +47,128 @@ def isHidden(basePath, path):
 
 def getFileExt(path):
     return os.path.splitext(path)[1]
+
+
+def getPathHash(path: str) -> int:
+    """
+    Returns 64-bit hash of the path, which stays the same between runs, unlike
+    the built-in hash function. Paths that can't be encoded, due to invalid
+    characters in file names, are hashed by their original bytes.
+    """
+
+    data = path.encode("utf-8", "surrogateescape")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class Mount(NamedTuple):
+    path: str
+    fileSystemType: str
+
+
+def getMounts(mountInfoPath: str = MOUNT_INFO_PATH) -> List[Mount]:
+    """
+    Returns mounts from Linux mountinfo file, sorted by the mount point path
+    length, the longest first. Returns an empty list if the file can't be read,
+    which is the case on other operating systems.
+    """
+
+    try:
+        with open(mountInfoPath, encoding="utf-8", errors="surrogateescape") as file:
+            lines = file.readlines()
+    except OSError:
+        return []
+
+    result = []
+    for line in lines:
+        # Optional fields go before the "-" separator, and there can be any
+        # number of them, so the file system type is found after the separator.
+        fields = line.split()
+        if "-" not in fields:
+            continue
+        separatorIndex = fields.index("-")
+        if len(fields) < 5 or separatorIndex + 1 >= len(fields):
+            continue
+        result.append(Mount(_unescapeMountPath(fields[4]), fields[separatorIndex + 1]))
+
+    return sorted(result, key=lambda mount: len(mount.path), reverse=True)
+
+
+def getFileSystemType(path: str, mounts: List[Mount]) -> Optional[str]:
+    """
+    Returns type of the file system the path is located on, by finding the mount
+    with the longest mount point that contains the path. Mounts should be sorted
+    as returned by getMounts function. Returns None if no mount is found.
+    """
+
+    realPath = os.path.realpath(path)
+    for mount in mounts:
+        if realPath == mount.path or realPath.startswith(os.path.join(mount.path, "")):
+            return mount.fileSystemType
+
+    return None
+
+
+def isRemoteFileSystemType(fileSystemType: Optional[str]) -> bool:
+    """
+    Checks whether the file system type is a network or FUSE file system, for
+    which inotify can't be relied on. "fuseblk" is not included, as it's used
+    for local disks, with NTFS or exFAT file systems for example.
+    """
+
+    if fileSystemType is None:
+        return False
+    if fileSystemType == "fuse" or fileSystemType.startswith("fuse."):
+        return True
+
+    return fileSystemType in REMOTE_FILE_SYSTEM_TYPES
+
+
+def getInotifyWatchLimit(limitPath: str = INOTIFY_WATCH_LIMIT_PATH) -> Optional[int]:
+    """
+    Returns the maximum number of inotify watches a user can have, or None if
+    it's unknown, which is the case on other operating systems than Linux.
+    """
+
+    try:
+        with open(limitPath) as file:
+            return int(file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def countDirectories(path: str) -> int:
+    """
+    Counts the directory and all of its subdirectories, which is the number of
+    inotify watches a recursive watch of the directory takes. Hidden directories
+    are counted as well, as those get watched too. Symbolic links to directories
+    are counted, but not followed, the same way as they are watched.
+    """
+
+    # Fails for the directory itself, but not for subdirectories removed meanwhile
+    with os.scandir(path) as entries:
+        pendingEntries = list(entries)
+
+    result = 1
+    while len(pendingEntries) > 0:
+        entry = pendingEntries.pop()
+        try:
+            if not entry.is_dir():
+                continue
+            result += 1
+            if entry.is_symlink():
+                continue
+            with os.scandir(entry.path) as entries:
+                pendingEntries.extend(entries)
+        except OSError:
+            continue
+
+    return result
+
+
+def _unescapeMountPath(path: str) -> str:
+    """
+    Mount points in mountinfo file have spaces, tabs, new lines and backslashes
+    escaped as octal numbers. For example, "/media/my disk" is "/media/my\\040disk".
+    """
+
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), path)
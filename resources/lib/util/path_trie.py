@@ -0,0 +1,81 @@
+import os
+from typing import Dict, Generic, List, TypeVar
+
+T = TypeVar("T")
+
+
+class _Node(Generic[T]):
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node[T]"] = {}
+        self.values: List[T] = []
+
+
+class PathTrie(Generic[T]):
+    """
+    Keeps values by directory path, in a tree of path components. Finding all
+    the values for a path and its parent directories takes a single walk down
+    the tree, no matter how many paths there are.
+    """
+
+    def __init__(self):
+        self.root: _Node[T] = _Node()
+
+    def add(self, path: str, value: T):
+        node = self.root
+        for component in _splitPath(path):
+            node = node.children.setdefault(component, _Node())
+        node.values.append(value)
+
+    def getMatches(self, path: str) -> List[T]:
+        """
+        Returns values for the path and all of its parent directories, starting
+        with the top-most one.
+        """
+
+        result = list(self.root.values)
+        node = self.root
+        for component in _splitPath(path):
+            node = node.children.get(component)
+            if node is None:
+                break
+            result.extend(node.values)
+
+        return result
+
+    def getRoots(self) -> List[str]:
+        """
+        Returns the top-most paths with values, the ones that are not located
+        inside other paths with values.
+        """
+
+        result = []
+        pending = [(self.root, [])]
+        while len(pending) > 0:
+            node, components = pending.pop()
+            if len(node.values) > 0:
+                result.append(_joinPath(components))
+                continue
+            for component, child in node.children.items():
+                pending.append((child, components + [component]))
+
+        return sorted(result)
+
+
+def _splitPath(path: str) -> List[str]:
+    """
+    Splits the path into its components. The root of an absolute path, like
+    "/" or "C:\\", is kept as the first component.
+    """
+
+    drive, rest = os.path.splitdrive(os.path.normpath(path))
+    components = [c for c in rest.split(os.sep) if c != ""]
+    if rest.startswith(os.sep):
+        return [drive + os.sep] + components
+
+    return ([drive] if drive != "" else []) + components
+
+
+def _joinPath(components: List[str]) -> str:
+    return os.path.join(*components) if len(components) > 0 else ""
@@ -1,29 +1,69 @@
+import errno
+import os
 import sys
 import threading
-import xbmc
-from typing import List
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait as waitForFutures
+from typing import Dict, FrozenSet, Iterable, List, Optional
 import resources.lib.logging as logging
 import resources.lib.task_management as task_management
-import resources.lib.tasks as tasks
+from resources.lib.batching import ChangeBatcher
+from resources.lib.scheduling import Scheduler
+from resources.lib.settings import Settings
+from resources.lib.snapshots import SnapshotStore
+from resources.lib.task_costs import TaskCostEstimator
+from resources.lib.tree_diff import TreeDiffer, TreeDiffObserver, TreeSnapshot, getEvents
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileSystemEvent, FileSystemMovedEvent
-from resources.lib.library import MediaSource, MediaType, InvalidMediaTypeException
-from resources.lib.util.file_system import getFileExt, isHidden
+from watchdog.events import (
+    EVENT_TYPE_MOVED,
+    DirCreatedEvent,
+    DirDeletedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileSystemEventHandler,
+    FileSystemEvent,
+    FileSystemMovedEvent,
+)
+from resources.lib.library import MediaClassifier, MediaSource, MediaType
+from resources.lib.library_index import LibraryIndex
+from resources.lib.util.file_system import (
+    countDirectories,
+    getFileExt,
+    getFileSystemType,
+    getInotifyWatchLimit,
+    getMounts,
+    isHidden,
+    isRemoteFileSystemType,
+)
+from resources.lib.util.path_trie import PathTrie
 
 
 class EventHandler(FileSystemEventHandler):
-    def __init__(self, taskManager: task_management.TaskManager, mediaSource: MediaSource):
+    def __init__(
+        self,
+        batcher: ChangeBatcher,
+        mediaSource: MediaSource,
+        mediaClassifier: MediaClassifier,
+        libraryIndex: LibraryIndex = None,
+        probeExecutor: Executor = None,
+    ):
         super().__init__()
         self.logger = logging.getLogger(self)
-        self.taskManager = taskManager
+        self.batcher = batcher
         self.mediaSource = mediaSource
+        self.mediaClassifier = mediaClassifier
+        self.libraryIndex = libraryIndex
+        # Added directories get probed for media files, and the library for items
+        # in removed directories, on the executor, if provided. So walking a large
+        # directory or waiting for Kodi doesn't hold up dispatching of events.
+        self.probeExecutor = probeExecutor
 
     def on_any_event(self, event: FileSystemEvent):
         self.logger.debug('File system event: <%s> for "%s".' % (event.event_type, event.src_path))
 
     def on_created(self, event: FileSystemEvent):
         if event.is_directory:
-            self._logDirectorySkip(event)
+            self._onDirectoryAdded(event, event.src_path)
             return
         if self._isNotSupportedExtension(event.src_path):
             self._logNotSupportedSkip(event, event.src_path)
@@ -32,33 +72,181 @@ class EventHandler(FileSystemEventHandler):
             self._logHiddenSkip(event, event.src_path)
             return
 
-        self.taskManager.add(tasks.UpdateLibrary(self.mediaSource))
+        # The file might still be being written, like when it's being copied
+        self.batcher.trackWrite(event.src_path)
+        self._addUpdateTask(event.src_path)
+
+    def on_closed(self, event: FileSystemEvent):
+        """
+        Called when a file opened for writing gets closed. Not reported by all
+        observers, so files being written are also checked for size changes.
+        """
+
+        self.batcher.completeWrite(event.src_path)
 
     def on_deleted(self, event: FileSystemEvent):
+        if event.is_directory:
+            self._onDirectoryRemoved(event, event.src_path)
+            return
         if self._shouldSkipDelete(event):
             return
 
-        self.taskManager.add(tasks.CleanLibrary(self.mediaSource))
+        self._addCleanTask(event.src_path)
 
     def on_moved(self, event: FileSystemMovedEvent):
         if event.is_directory:
-            self._logDirectorySkip(event)
+            self._onDirectoryRemoved(event, event.src_path)
+            self._onDirectoryAdded(event, event.dest_path)
             return
         if self._isNotSupportedExtension(event.src_path):
             self._logNotSupportedSkip(event, event.src_path)
             return
         if self._isHidden(event.src_path) and not self._isHidden(event.dest_path):
-            self.taskManager.add(tasks.UpdateLibrary(self.mediaSource))
+            self._addUpdateTask(event.dest_path)
             return
         if self._isHidden(event.dest_path) and not self._isHidden(event.src_path):
-            self.taskManager.add(tasks.CleanLibrary(self.mediaSource))
+            self._addCleanTask(event.src_path)
             return
         if self._isHidden(event.dest_path):
             self._logHiddenSkip(event, event.dest_path)
             return
 
-        self.taskManager.add(tasks.UpdateLibrary(self.mediaSource))
-        self.taskManager.add(tasks.CleanLibrary(self.mediaSource))
+        self._addUpdateTask(event.dest_path)
+        self._addCleanTask(event.src_path)
+
+    def _onDirectoryAdded(self, event: FileSystemEvent, path: str):
+        """
+        Handles a directory that was created or moved into the media source.
+        Some observers report a directory moved in from outside of the media
+        source with a single event, without any events for the files in it.
+        So the directory gets probed for media files, and scanned as a whole
+        if it has any.
+        """
+
+        if self._isHidden(path):
+            self._logHiddenSkip(event, path)
+            return
+
+        self._runProbe(self._probeDirectory, event, path)
+
+    def _probeDirectory(self, event: FileSystemEvent, path: str):
+        if not self._containsMediaFiles(path):
+            self.logger.debug(
+                'Skip <%s> event for "%s" because the directory has no media files.' % (event.event_type, path)
+            )
+            return
+
+        self.batcher.addUpdate(self.mediaSource, path)
+
+    def _onDirectoryRemoved(self, event: FileSystemEvent, path: str):
+        """
+        Handles a directory that was deleted or moved out of the media source.
+        A directory moved out to another file system, or out of the media source,
+        gets reported with a single event, without any events for the files in
+        it. So the library gets cleaned for the directory, if Kodi had any items
+        located in it.
+        """
+
+        if self._isHidden(path):
+            self._logHiddenSkip(event, path)
+            return
+
+        self._runProbe(self._probeLibrary, event, path)
+
+    def _probeLibrary(self, event: FileSystemEvent, path: str):
+        if (
+            self.libraryIndex is not None
+            and self.libraryIndex.hasItemsInDirectory(self.mediaSource.type, path) is False
+        ):
+            self.logger.debug(
+                'Skip <%s> event for "%s" because the library has no items in the directory.'
+                % (event.event_type, path)
+            )
+            return
+
+        self._addDirectoryCleanTask(path)
+
+    def _runProbe(self, probe, event: FileSystemEvent, path: str):
+        if self.probeExecutor is None:
+            probe(event, path)
+            return
+
+        # The batch is held open until the probe is done, so its changes get
+        # handed over together with the rest of the changes of the batch.
+        self.batcher.beginProbe()
+        try:
+            self.probeExecutor.submit(self._probeAndEnd, probe, event, path)
+        except RuntimeError:
+            # The executor has been shut down, as the watcher is stopping
+            self.batcher.endProbe()
+            raise
+
+    def _probeAndEnd(self, probe, event: FileSystemEvent, path: str):
+        try:
+            probe(event, path)
+        finally:
+            self.batcher.endProbe()
+
+    def _containsMediaFiles(self, path: str) -> bool:
+        """
+        Walks the directory until the first supported media file is found.
+        Hidden files and directories are skipped, the same way as for events,
+        and symbolic links to directories are not followed.
+        """
+
+        pendingPaths = [path]
+        while len(pendingPaths) > 0:
+            try:
+                with os.scandir(pendingPaths.pop()) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            pendingPaths.append(entry.path)
+                        elif self.mediaClassifier.isSupported(entry.name, self.mediaSource.type):
+                            return True
+            except OSError:
+                # The directory might have been deleted or moved away in the meantime
+                continue
+
+        return False
+
+    def _addUpdateTask(self, path: str):
+        """
+        Adds the directory the changed file is located in to the directories
+        to scan, so Kodi doesn't have to walk through the whole library. Files
+        that are already in the library are skipped, as the scan wouldn't add
+        anything, for example when a file gets renamed back and forth.
+        """
+
+        if self._isInLibrary(path) is True:
+            self.logger.debug('Skip update for "%s" because it\'s already in the library.' % path)
+            return
+
+        self.batcher.addUpdate(self.mediaSource, os.path.dirname(path))
+
+    def _addCleanTask(self, path: str):
+        """
+        Adds the directory the deleted or moved out file was located in to the
+        directories to clean. Files that have never been in the library are
+        skipped, as the clean wouldn't remove anything.
+        """
+
+        if self._isInLibrary(path) is False:
+            self.logger.debug('Skip clean for "%s" because it\'s not in the library.' % path)
+            return
+
+        self._addDirectoryCleanTask(os.path.dirname(path))
+
+    def _addDirectoryCleanTask(self, path: str):
+        """
+        Adds the directory to the directories to clean. Music library can't be
+        cleaned for a directory, as "AudioLibrary.Clean" JSONRPC method doesn't
+        support that, so the whole music library gets cleaned instead.
+        """
+
+        cleanPath = path if self.mediaSource.type == MediaType.video else None
+        self.batcher.addClean(self.mediaSource, cleanPath)
 
     def _shouldSkipDelete(self, event: FileSystemEvent):
         if sys.platform.startswith("win"):
@@ -67,9 +255,6 @@ class EventHandler(FileSystemEventHandler):
         return self._shouldSkipDeleteDefault(event)
 
     def _shouldSkipDeleteDefault(self, event: FileSystemEvent):
-        if event.is_directory:
-            self._logDirectorySkip(event)
-            return True
         if self._isNotSupportedExtension(event.src_path):
             self._logNotSupportedSkip(event, event.src_path)
             return True
@@ -91,14 +276,23 @@ class EventHandler(FileSystemEventHandler):
 
         return False
 
+    def _isInLibrary(self, path: str) -> Optional[bool]:
+        """
+        Tells whether the file is in the library. Returns None if it's unknown,
+        so neither the scan nor the clean gets skipped. Paths without a supported
+        extension, like deleted directories on Windows, are never looked up.
+        """
+
+        if self.libraryIndex is None or self._isNotSupportedExtension(path):
+            return None
+
+        return self.libraryIndex.contains(self.mediaSource.type, path)
+
     def _isHidden(self, path):
         return isHidden(self.mediaSource.path, path)
 
     def _isNotSupportedExtension(self, path: str):
-        return getFileExt(path) not in _getSupportedExtensions(self.mediaSource.type)
-
-    def _logDirectorySkip(self, event: FileSystemEvent):
-        self.logger.debug('Skip <%s> event for "%s" because it\'s a directory.' % (event.event_type, event.src_path))
+        return not self.mediaClassifier.isSupported(path, self.mediaSource.type)
 
     def _logNotSupportedSkip(self, event: FileSystemEvent, path: str):
         self.logger.debug(
@@ -112,14 +306,144 @@ class EventHandler(FileSystemEventHandler):
         )
 
 
+class EventRouter(FileSystemEventHandler):
+    """
+    Passes events of a watched directory tree on to the event handlers of all
+    the media sources the events are located in. Media sources located inside
+    other media sources, or added for more than one media type, share a single
+    watch this way, so each event is received once. Event handlers are found
+    with a single walk down the path trie.
+
+    A move between the directory trees of two media sources gets passed on as
+    a delete to the source it was moved out of, and as a create to the source
+    it was moved into.
+    """
+
+    def __init__(self, path: str, eventHandlers: List[EventHandler]):
+        super().__init__()
+        self.path = path
+        self.eventHandlers = eventHandlers
+        # Native observer watch, or polling observer and its interval, once watched
+        self.watch = None
+        # Number of directories in the watched tree, if it has been counted
+        self.directoryCount: Optional[int] = None
+        self.pollingObserver: Optional[TreeDiffObserver] = None
+        self.pollingInterval: Optional[float] = None
+        self.trie: PathTrie[EventHandler] = PathTrie()
+        for eventHandler in eventHandlers:
+            self.trie.add(eventHandler.mediaSource.path, eventHandler)
+
+    def dispatch(self, event: FileSystemEvent):
+        if event.event_type != EVENT_TYPE_MOVED:
+            for eventHandler in self.trie.getMatches(event.src_path):
+                eventHandler.dispatch(event)
+            return
+
+        srcEventHandlers = self.trie.getMatches(event.src_path)
+        destEventHandlers = self.trie.getMatches(event.dest_path)
+        for eventHandler in srcEventHandlers:
+            if eventHandler in destEventHandlers:
+                eventHandler.dispatch(event)
+            else:
+                deletedEventType = DirDeletedEvent if event.is_directory else FileDeletedEvent
+                eventHandler.dispatch(deletedEventType(event.src_path))
+        for eventHandler in destEventHandlers:
+            if eventHandler not in srcEventHandlers:
+                createdEventType = DirCreatedEvent if event.is_directory else FileCreatedEvent
+                eventHandler.dispatch(createdEventType(event.dest_path))
+
+    def setMediaClassifier(self, mediaClassifier: MediaClassifier):
+        """
+        Makes the event handlers, and the file filters based on them, use the
+        media classifier from now on, for example, after the settings change.
+        """
+
+        for eventHandler in self.eventHandlers:
+            eventHandler.mediaClassifier = mediaClassifier
+
+    def getMediaSources(self) -> FrozenSet[MediaSource]:
+        return frozenset(h.mediaSource for h in self.eventHandlers)
+
+    def getNestedSourcesNote(self) -> str:
+        if len(self.eventHandlers) == 1:
+            return ""
+        return ", shared by %i media sources" % len(self.eventHandlers)
+
+
 class Watcher:
-    def __init__(self, taskManager: task_management.TaskManager):
+    """
+    Watches media sources for changes. Sources on local file systems are watched
+    with the native observer, which is inotify on Linux. Sources on network and
+    FUSE file systems are polled instead, as inotify doesn't get to know about
+    changes made by other machines. Each of those sources gets its own polling
+    observer, so polling of a slow network share doesn't hold up the others.
+    Stat calls of all polling observers run on a shared, bounded thread pool.
+
+    Sources on local file systems that don't fit into the inotify watch limit
+    are polled as well, instead of not being watched at all.
+
+    Media sources located inside other media sources are not watched on their
+    own. Only the top-most directories get watched, and their events get routed
+    to all the media sources they are located in.
+
+    If a snapshot store is provided, snapshots of the media source directory
+    trees are stored when watching stops. Once watching starts again, the
+    stored snapshots get compared with the directory trees, and changes made
+    in the meantime get handled as if they were just made.
+    """
+
+    # Default polling interval in seconds, used when no settings are provided
+    POLLING_INTERVAL = 30
+    # Maximum number of stat calls in flight for polled sources
+    STAT_WORKERS = 16
+    # Maximum number of directories probed for media files at the same time
+    PROBE_WORKERS = 4
+    # Share of the inotify watch limit that can be used. The limit is per user,
+    # so the rest is left for Kodi and other programs.
+    INOTIFY_WATCH_SHARE = 0.8
+    # Number of threads watches get installed with, one watched directory per thread
+    INSTALL_WORKERS = 4
+
+    def __init__(
+        self,
+        taskManager: task_management.TaskManager,
+        settings: Settings = None,
+        snapshotStore: SnapshotStore = None,
+        costEstimator: TaskCostEstimator = None,
+        scheduler: Scheduler = None,
+    ):
         self.logger = logging.getLogger(self)
         self.taskManager = taskManager
+        self.settings = settings
+        # The scheduler thread can be shared with the task manager. It's started
+        # and stopped here only if it's not provided.
+        self.ownsScheduler = scheduler is None
+        self.scheduler = scheduler or Scheduler()
+        self.batcher = ChangeBatcher(taskManager, self.scheduler, costEstimator)
         self.observer = Observer()
+        self.pollingObservers: List[TreeDiffObserver] = []
+        self.statExecutor = ThreadPoolExecutor(self.STAT_WORKERS)
+        self.probeExecutor = ThreadPoolExecutor(self.PROBE_WORKERS)
+        self.snapshotStore = snapshotStore
+        self.snapshots: Dict[MediaSource, TreeSnapshot] = {}
+        self.differs: Dict[MediaSource, TreeDiffer] = {}
+        # Key is a watched directory, value is the router of its events
+        self.routers: Dict[str, EventRouter] = {}
+        # Key is a directory watched with inotify, value is the number of watches it takes
+        self.inotifyWatches: Dict[str, int] = {}
+        self.installExecutor = ThreadPoolExecutor(self.INSTALL_WORKERS)
+        self.pendingInstalls: List[Future] = []
+        # Updates run one at a time, in the order they were requested, off the
+        # thread that requests them, as those wait for watch installs.
+        self.updateExecutor = ThreadPoolExecutor(1)
+        # Guards the state that watch installs running in parallel change
+        self.lock = threading.Lock()
+        self.stopRequested = False
         self.started = threading.Event()
 
     def __enter__(self):
+        if self.ownsScheduler:
+            self.scheduler.start()
         self.observer.start()
         self.started.set()
 
@@ -130,11 +454,41 @@ class Watcher:
             return
 
         self.logger.info("Stopping...")
+        # Installs that haven't started yet are skipped, the ones in progress are waited for
+        self.stopRequested = True
+        # Updates in progress are waited for first, as those can add installs
+        self.updateExecutor.shutdown()
+        self.installExecutor.shutdown()
         self.observer.stop()
+        self._stopPollingObservers()
         self.observer.join()
+        # Let the directory probes in progress add their changes
+        self.probeExecutor.shutdown()
+        if self.ownsScheduler:
+            self.scheduler.stop()
+        # Hand over the changes that are still waiting for their batch to be done,
+        # including scans held back for files being written, as those can't be
+        # tracked any longer.
+        self.batcher.flush(force=True)
+        self._saveSnapshots()
+        self.statExecutor.shutdown()
         self.logger.info("Stopped.")
 
-    def watch(self, mediaSources):
+    def watch(
+        self,
+        mediaSources,
+        mediaClassifier: MediaClassifier = None,
+        libraryIndex: LibraryIndex = None,
+        wait: bool = True,
+    ):
+        """
+        Starts watching the media sources. Watches of different directories get
+        installed in parallel, on a worker pool, and changes in a directory are
+        handled as soon as its watch is installed, while the rest are still being
+        installed. If wait is False, returns right away, without waiting for the
+        installs to finish.
+        """
+
         # Making sure the observer has been started before creating any watchers.
         # This is needed to prevent the watch fail as a whole in case of some
         # invalid media sources. We want to create one watcher for a given media
@@ -144,27 +498,404 @@ class Watcher:
         if not self.started.is_set():
             raise Exception("Observer is not running. It needs to be started before adding watchers.")
 
-        for mediaSource in mediaSources:
-            eventHandler = EventHandler(self.taskManager, mediaSource)
-            try:
-                self.observer.schedule(eventHandler, mediaSource.path, recursive=True)
-                self.logger.info('Watching "%s".' % mediaSource.path)
-            except OSError:
-                self.logger.warn('Failed to watch "%s".' % mediaSource.path)
-                logging.notifyWarning("Unable to watch some media sources.")
+        if mediaClassifier is None:
+            mediaClassifier = MediaClassifier()
+
+        mounts = getMounts()
+        eventHandlers: List[EventHandler] = []
+        differs: Dict[MediaSource, TreeDiffer] = {}
+        fileSystemTypes: Dict[str, str] = {}
+        # The same media source can be added more than once, for example, as a part
+        # of different multipath sources, so duplicates get dropped.
+        for mediaSource in dict.fromkeys(mediaSources):
+            eventHandler = EventHandler(
+                self.batcher, mediaSource, mediaClassifier, libraryIndex, probeExecutor=self.probeExecutor
+            )
+            eventHandlers.append(eventHandler)
+            # Snapshots keep only supported media files, as changes of other files
+            # get skipped by the event handler anyway.
+            differs[mediaSource] = TreeDiffer(mediaSource.path, self.statExecutor, self._getFileFilter([eventHandler]))
+            # File system type is unknown on other than Linux operating systems
+            fileSystemTypes[mediaSource.path] = getFileSystemType(mediaSource.path, mounts) or "unknown"
+
+        localEventHandlers = [
+            h for h in eventHandlers if not isRemoteFileSystemType(fileSystemTypes[h.mediaSource.path])
+        ]
+        remoteEventHandlers = [h for h in eventHandlers if isRemoteFileSystemType(fileSystemTypes[h.mediaSource.path])]
+
+        inotifyWatchLimit = getInotifyWatchLimit()
+        installs = [
+            self.installExecutor.submit(
+                self._install, router, fileSystemTypes[router.path], inotifyWatchLimit, differs
+            )
+            for router in _getEventRouters(localEventHandlers)
+        ]
+        # Remote directories are always polled, so there is no inotify limit for them
+        installs += [
+            self.installExecutor.submit(
+                self._install, router, fileSystemTypes[router.path], None, differs, polling=True
+            )
+            for router in _getEventRouters(remoteEventHandlers)
+        ]
+        with self.lock:
+            self.pendingInstalls = [f for f in self.pendingInstalls if not f.done()] + installs
+
+        if wait:
+            for install in installs:
+                install.result()
+
+    def _waitForInstalls(self):
+        with self.lock:
+            installs = list(self.pendingInstalls)
+            self.pendingInstalls.clear()
+
+        waitForFutures(installs)
+
+    def update(
+        self,
+        mediaSources,
+        mediaClassifier: MediaClassifier = None,
+        libraryIndex: LibraryIndex = None,
+        wait: bool = True,
+    ):
+        """
+        Brings watched media sources in line with the given ones. Only watches of
+        directories with added or removed media sources get re-created, the rest
+        are kept as they are, together with changes and tasks of their media
+        sources. Changes and tasks of removed media sources are dropped.
+
+        The update runs in the background, after the installs in progress are
+        done. If wait is False, returns right away, without waiting for the
+        update and the installs it starts to finish.
+        """
+
+        update = self.updateExecutor.submit(self._update, list(mediaSources), mediaClassifier, libraryIndex)
+        if wait:
+            update.result()
+            self._waitForInstalls()
+
+    @logging.notifyOnError
+    def _update(self, mediaSources, mediaClassifier: Optional[MediaClassifier], libraryIndex: Optional[LibraryIndex]):
+        if self.stopRequested:
+            return
+
+        # Routers of watches being installed are not known until those are done
+        self._waitForInstalls()
+        mediaSources = list(dict.fromkeys(mediaSources))
+        mounts = getMounts()
+        isRemote = {ms: isRemoteFileSystemType(getFileSystemType(ms.path, mounts)) for ms in mediaSources}
+        plannedGroups = {
+            **_groupByTopMostDirectory([ms for ms in mediaSources if not isRemote[ms]]),
+            **_groupByTopMostDirectory([ms for ms in mediaSources if isRemote[ms]]),
+        }
+
+        watchedMediaSources = set()
+        keptMediaSources = set()
+        for path, router in list(self.routers.items()):
+            routerMediaSources = router.getMediaSources()
+            watchedMediaSources |= routerMediaSources
+            pollingIntervalChanged = (
+                router.pollingObserver is not None and router.pollingInterval != self._getPollingInterval()
+            )
+            if frozenset(plannedGroups.get(path, [])) == routerMediaSources and not pollingIntervalChanged:
+                keptMediaSources |= routerMediaSources
+                # Supported file extensions might have changed, even if the media sources haven't
+                if mediaClassifier is not None:
+                    router.setMediaClassifier(mediaClassifier)
+            else:
+                self._unwatch(router)
+
+        removedMediaSources = watchedMediaSources - set(mediaSources)
+        if len(removedMediaSources) > 0:
+            self.batcher.clear(removedMediaSources)
+            self.taskManager.removeTasks(removedMediaSources)
+
+        addedMediaSources = [ms for ms in mediaSources if ms not in keptMediaSources]
+        self.logger.info(
+            "Updating watched media sources: %i kept, %i removed, %i (re-)added."
+            % (len(keptMediaSources), len(removedMediaSources), len(addedMediaSources))
+        )
+        if len(addedMediaSources) > 0:
+            self.watch(addedMediaSources, mediaClassifier, libraryIndex, wait=False)
 
     def clear(self):
+        self._waitForInstalls()
         self.observer.unschedule_all()
+        with self.lock:
+            self.inotifyWatches.clear()
+            self.routers.clear()
+        self._stopPollingObservers()
+        self._saveSnapshots()
+        self.batcher.clear()
         self.logger.info("All watchers cleared.")
 
+    @logging.notifyOnError
+    def _install(
+        self,
+        router: "EventRouter",
+        fileSystemType: str,
+        inotifyWatchLimit: Optional[int],
+        differs: Dict[MediaSource, TreeDiffer],
+        polling: bool = False,
+    ):
+        """
+        Watches the directory of the router and reconciles its media sources.
+        Runs on the install worker pool, one call per watched directory.
+        """
+
+        if self.stopRequested:
+            return
+
+        startTime = time.monotonic()
+        try:
+            if not polling and self._tryWatchWithNativeObserver(router, fileSystemType, inotifyWatchLimit):
+                # The snapshots are taken after the watch is created, so no changes
+                # get missed in between. Some might be handled twice, which is fine.
+                for eventHandler in router.eventHandlers:
+                    self._reconcile(eventHandler, eventHandler.mediaSource, differs[eventHandler.mediaSource])
+            else:
+                self._reconcileAndWatchWithPolling(router, fileSystemType, differs)
+        except OSError:
+            self._logWatchFailure(router)
+            return
+
+        # Directories are not counted when the native observer watches them without a limit
+        directoryCountNote = ", %i directories" % router.directoryCount if router.directoryCount is not None else ""
+        self.logger.info(
+            'Installed watch of "%s" in %.2f seconds%s.'
+            % (router.path, time.monotonic() - startTime, directoryCountNote)
+        )
+
+    def _tryWatchWithNativeObserver(
+        self, router: "EventRouter", fileSystemType: str, inotifyWatchLimit: Optional[int]
+    ) -> bool:
+        """
+        Watches the directory with the native observer, if there are enough
+        inotify watches left for all of its subdirectories. Returns False if
+        there are not, so the directory can be polled instead. The inotify
+        limit is unknown on other operating systems than Linux, and those
+        are always watched with the native observer.
+        """
+
+        if inotifyWatchLimit is None:
+            router.watch = self.observer.schedule(router, router.path, recursive=True)
+            with self.lock:
+                self.routers[router.path] = router
+            self.logger.info(
+                'Watching "%s" with native observer, "%s" file system%s.'
+                % (router.path, fileSystemType, router.getNestedSourcesNote())
+            )
+            return True
+
+        directoryCount = countDirectories(router.path)
+        router.directoryCount = directoryCount
+        watchBudget = int(inotifyWatchLimit * self.INOTIFY_WATCH_SHARE)
+        with self.lock:
+            watchesUsed = sum(self.inotifyWatches.values())
+            if watchesUsed + directoryCount > watchBudget:
+                self.logger.warn(
+                    'Not enough inotify watches for "%s": %i needed, %i of %i left. Polling it instead.'
+                    % (router.path, directoryCount, max(watchBudget - watchesUsed, 0), watchBudget)
+                )
+                return False
+            # Reserved before watching, so installs running in parallel don't exceed the budget together
+            self.inotifyWatches[router.path] = directoryCount
+
+        try:
+            router.watch = self.observer.schedule(router, router.path, recursive=True)
+        except OSError as e:
+            with self.lock:
+                del self.inotifyWatches[router.path]
+            # Other programs might have used up the limit in the meantime
+            if e.errno != errno.ENOSPC:
+                raise
+            self.logger.warn('Ran out of inotify watches for "%s". Polling it instead.' % router.path)
+            return False
+
+        with self.lock:
+            self.routers[router.path] = router
+        self.logger.info(
+            'Watching "%s" with native observer, "%s" file system%s, %i inotify watches. %i of %i in use.'
+            % (
+                router.path,
+                fileSystemType,
+                router.getNestedSourcesNote(),
+                directoryCount,
+                watchesUsed + directoryCount,
+                watchBudget,
+            )
+        )
+        return True
+
+    def _reconcileAndWatchWithPolling(
+        self,
+        router: "EventRouter",
+        fileSystemType: str,
+        differs: Dict[MediaSource, TreeDiffer],
+    ):
+        # Polling starts from the snapshot, so changes made after it
+        # was taken get picked up by the first poll.
+        snapshots = [
+            self._reconcile(eventHandler, eventHandler.mediaSource, differs[eventHandler.mediaSource])
+            for eventHandler in router.eventHandlers
+        ]
+        # Snapshot of a single media source covers the whole directory tree
+        # that gets polled. Otherwise, polling starts from a new snapshot.
+        snapshot = snapshots[0] if len(snapshots) == 1 else None
+        if snapshot is not None:
+            router.directoryCount = len(snapshot)
+        fileFilter = self._getFileFilter(router.eventHandlers)
+        self._watchWithPolling(router, fileSystemType, fileFilter, snapshot)
+
+    def _watchWithPolling(
+        self, router: "EventRouter", fileSystemType: str, fileFilter, snapshot: Optional[TreeSnapshot]
+    ):
+        # Polling observer checks the path only in its own thread, once it's
+        # started, so check it here to fail the same way the native observer does.
+        if not os.path.isdir(router.path):
+            raise FileNotFoundError('Media source directory "%s" not found.' % router.path)
+
+        pollingInterval = self._getPollingInterval()
+        observer = TreeDiffObserver(
+            self.statExecutor, timeout=pollingInterval, snapshot=snapshot, fileFilter=fileFilter
+        )
+        observer.schedule(router, router.path, recursive=True)
+        observer.start()
+        router.pollingObserver = observer
+        router.pollingInterval = pollingInterval
+        with self.lock:
+            self.pollingObservers.append(observer)
+            self.routers[router.path] = router
+        self.logger.info(
+            'Watching "%s" with polling every %i seconds, "%s" file system%s.'
+            % (router.path, pollingInterval, fileSystemType, router.getNestedSourcesNote())
+        )
+
+    def _unwatch(self, router: "EventRouter"):
+        if router.watch is not None:
+            self.observer.unschedule(router.watch)
+            with self.lock:
+                self.inotifyWatches.pop(router.path, None)
+        if router.pollingObserver is not None:
+            router.pollingObserver.stop()
+            router.pollingObserver.join()
+            with self.lock:
+                self.pollingObservers.remove(router.pollingObserver)
+        self._saveSnapshots(router.getMediaSources())
+        with self.lock:
+            del self.routers[router.path]
+        self.logger.info('Stopped watching "%s".' % router.path)
+
+    def _logWatchFailure(self, router: "EventRouter"):
+        self.logger.warn('Failed to watch "%s".' % router.path)
+        logging.notifyWarning("Unable to watch some media sources.")
+
+    def _reconcile(
+        self, eventHandler: EventHandler, mediaSource: MediaSource, differ: TreeDiffer
+    ) -> Optional[TreeSnapshot]:
+        """
+        Takes a snapshot of the media source and compares it with the stored one.
+        Differences are passed to the event handler. Returns the new snapshot, or
+        None if there is no snapshot store.
+        """
+
+        if self.snapshotStore is None:
+            return None
+
+        storedSnapshot = self.snapshotStore.load(mediaSource)
+        if storedSnapshot is None:
+            # Nothing to compare with, the snapshot is used for the next start only
+            self.logger.debug('No stored snapshot for "%s". Taking a new one.' % mediaSource.path)
+            snapshot = differ.takeSnapshot()
+        else:
+            snapshot, diff = differ.diff(storedSnapshot)
+            events = getEvents(diff)
+            self.logger.info('Found %i changes in "%s" since the last run.' % (len(events), mediaSource.path))
+            for event in events:
+                eventHandler.dispatch(event)
+
+        self.snapshots[mediaSource] = snapshot
+        self.differs[mediaSource] = differ
+        return snapshot
+
+    def _saveSnapshots(self, mediaSources: Iterable[MediaSource] = None):
+        """
+        Brings snapshots of the media sources, all watched ones by default, up to
+        date and stores them. Only directories changed since the snapshots were
+        taken get read again.
+
+        If some changes haven't been handled yet, the snapshots are stored as
+        they were taken when watching started, so those changes are found again
+        next time. Changes that have been handled already might be handled once
+        more then, which is fine.
+        """
+
+        upToDate = not self.batcher.hasChanges() and self.taskManager.isIdle()
+        if not upToDate:
+            self.logger.info("Some changes haven't been handled yet. Storing snapshots taken at the start.")
+
+        if mediaSources is None:
+            mediaSources = list(self.snapshots)
+        for mediaSource in mediaSources:
+            snapshot = self.snapshots.pop(mediaSource, None)
+            differ = self.differs.pop(mediaSource, None)
+            if snapshot is None:
+                continue
+            try:
+                if upToDate:
+                    snapshot, _ = differ.diff(snapshot)
+                self.snapshotStore.save(mediaSource, snapshot)
+                self.logger.debug('Stored snapshot for "%s".' % mediaSource.path)
+            except OSError:
+                self.logger.warn('Failed to store snapshot for "%s".' % mediaSource.path)
+
+    def _getFileFilter(self, eventHandlers: List[EventHandler]):
+        # Media classifier is looked up on every call, as it can be replaced in event handlers
+        return lambda name: any(h.mediaClassifier.isSupported(name, h.mediaSource.type) for h in eventHandlers)
+
+    def _stopPollingObservers(self):
+        with self.lock:
+            observers = list(self.pollingObservers)
+            self.pollingObservers.clear()
+
+        for observer in observers:
+            observer.stop()
+        for observer in observers:
+            observer.join()
+
+    def _getPollingInterval(self) -> float:
+        return self.settings.getPollingInterval() if self.settings is not None else self.POLLING_INTERVAL
+
+
+def _getEventRouters(eventHandlers: List[EventHandler]) -> List[EventRouter]:
+    """
+    Groups event handlers by the top-most media source directories they are
+    located in, and returns an event router for each of those directories.
+    """
+
+    eventHandlersBySource = {h.mediaSource: h for h in eventHandlers}
+    groups = _groupByTopMostDirectory(list(eventHandlersBySource))
+
+    return [
+        EventRouter(path, [eventHandlersBySource[ms] for ms in groupMediaSources])
+        for path, groupMediaSources in groups.items()
+    ]
+
+
+def _groupByTopMostDirectory(mediaSources: List[MediaSource]) -> Dict[str, List[MediaSource]]:
+    """
+    Groups media sources by the top-most media source directories they are
+    located in. Those are the directories that get watched.
+    """
+
+    trie: PathTrie[MediaSource] = PathTrie()
+    for mediaSource in mediaSources:
+        trie.add(mediaSource.path, mediaSource)
 
-def _getSupportedExtensions(mediaType: MediaType) -> List[str]:
-    response = ""
-    if mediaType == MediaType.video:
-        response = xbmc.getSupportedMedia("video")
-    elif mediaType == MediaType.music:
-        response = xbmc.getSupportedMedia("music")
-    else:
-        raise InvalidMediaTypeException(mediaType)
+    groups: Dict[str, List[MediaSource]] = {}
+    for mediaSource in mediaSources:
+        # Matches start with the top-most directory
+        rootPath = trie.getMatches(mediaSource.path)[0].path
+        groups.setdefault(rootPath, []).append(mediaSource)
 
-    return response.strip("|").split("|")
+    return groups
@@ -0,0 +1,141 @@
+import os
+import threading
+from typing import Dict, Optional, Set, Tuple
+import resources.lib.logging as logging
+from resources.lib.scheduling import Scheduler, Timer
+
+
+class WriteTracker:
+    """
+    Keeps track of files that are still being written, like a large video file
+    that is being copied into a media source. A file stops being tracked once
+    it's closed after writing, if the observer reports that, or once its size
+    and modification time stay the same for CHECK_INTERVAL seconds otherwise.
+
+    The callback is called with no arguments every time some files are done
+    being written. Checks run on the scheduler thread, so no threads get
+    created for them.
+    """
+
+    # Seconds between checks of the size and modification time of tracked files
+    CHECK_INTERVAL = 3
+
+    def __init__(self, scheduler: Scheduler, callback):
+        self.logger = logging.getLogger(self)
+        self.scheduler = scheduler
+        self.callback = callback
+        self.lock = threading.Lock()
+        # Key is the path of a tracked file, value is its last seen size and modification time
+        self.files: Dict[str, Optional[Tuple[int, float]]] = {}
+        # Key is a directory, value is the paths of tracked files located in it
+        self.directories: Dict[str, Set[str]] = {}
+        self.checkTimer: Optional[Timer] = None
+
+    def track(self, path: str):
+        with self.lock:
+            if path in self.files:
+                return
+
+        # Stat is done without the lock, as it can be slow on network shares
+        state = _getFileState(path)
+        with self.lock:
+            if path in self.files:
+                return
+            self.files[path] = state
+            self.directories.setdefault(os.path.dirname(path), set()).add(path)
+            if self.checkTimer is None:
+                self.checkTimer = self.scheduler.schedule(self.CHECK_INTERVAL, self._check)
+            self._logCount()
+
+    def complete(self, path: str):
+        """
+        Stops tracking the file, as it's known to be written completely.
+        """
+
+        with self.lock:
+            if path not in self.files:
+                return
+            self._untrack(path)
+            self._logCount()
+
+        self.callback()
+
+    def hasPendingWrites(self, path: str) -> bool:
+        """
+        Checks whether any files are still being written in the directory or
+        its subdirectories.
+        """
+
+        with self.lock:
+            if path in self.directories:
+                return True
+            directoryPrefix = os.path.join(path, "")
+            return any(d.startswith(directoryPrefix) for d in self.directories)
+
+    def count(self) -> int:
+        with self.lock:
+            return len(self.files)
+
+    def clear(self):
+        with self.lock:
+            if self.checkTimer is not None:
+                self.scheduler.cancel(self.checkTimer)
+                self.checkTimer = None
+            self.files.clear()
+            self.directories.clear()
+
+    def _check(self):
+        with self.lock:
+            self.checkTimer = None
+            lastStates = dict(self.files)
+
+        # Files are checked without the lock, as stat can be slow on network
+        # shares and the watcher shouldn't wait for it.
+        states = {path: _getFileState(path) for path in lastStates}
+
+        with self.lock:
+            completedCount = 0
+            for path, state in states.items():
+                lastState = lastStates[path]
+                # The file might have been completed, or cleared, in the meantime
+                if path not in self.files or self.files[path] != lastState:
+                    continue
+                # Deleted files are not being written anymore either
+                if state is None or state == lastState:
+                    self._untrack(path)
+                    completedCount += 1
+                else:
+                    self.files[path] = state
+
+            # Tracking a file in the meantime might have scheduled a check already
+            if len(self.files) > 0 and self.checkTimer is None:
+                self.checkTimer = self.scheduler.schedule(self.CHECK_INTERVAL, self._check)
+            if completedCount > 0:
+                self._logCount()
+
+        if completedCount > 0:
+            self.callback()
+
+    def _untrack(self, path: str):
+        """
+        Should be called with the lock acquired.
+        """
+
+        del self.files[path]
+        directory = os.path.dirname(path)
+        paths = self.directories[directory]
+        paths.discard(path)
+        if len(paths) == 0:
+            del self.directories[directory]
+
+    def _logCount(self):
+        self.logger.debug("Files being written: %i." % len(self.files))
+
+
+def _getFileState(path: str) -> Optional[Tuple[int, float]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return stat.st_size, stat.st_mtime
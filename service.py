@@ -1,22 +1,47 @@
+import os
 import threading
+import xbmcaddon
+import xbmcvfs
+import resources.lib.jsonrpc as jsonrpc
 import resources.lib.logging as logging
 from resources.lib.library import Library
+from resources.lib.library_index import LibraryIndex
+from resources.lib.player import Player
 from resources.lib.settings import Settings
+from resources.lib.source_discovery import SourceDiscovery
+from resources.lib.snapshots import SnapshotStore
 from resources.lib.monitoring import Monitor
+from resources.lib.task_costs import TaskCostEstimator
 from resources.lib.watcher import Watcher
 from resources.lib.task_management import TaskManager
 
+# Seconds between summaries of JSONRPC call latencies in the log
+LATENCY_LOG_INTERVAL = 3600
+
 
 def main():
     logger = logging.getLogger(__name__)
 
     # And event handler for add-on settings changes. If the settings
-    # change we re-create file system watchers to be sure those are
-    # created with the latest add-on settings.
+    # change we update file system watchers to be sure those are in
+    # line with the latest add-on settings. Only watchers of added or
+    # removed media sources get re-created.
     def _onSettingsChange():
-        watcher.clear()
-        taskManager.clear()
-        watcher.watch(library.getMediaSources())
+        library.resetMediaClassifier()
+        taskManager.onSettingsChanged()
+        sourceDiscovery.check(force=True)
+
+    # An event handler for media sources changes, found either by periodic
+    # checks or after the add-on settings change.
+    def _onMediaSourcesChange(mediaSources):
+        # Runs in the background, so Kodi callbacks don't wait for watch installs
+        watcher.update(mediaSources, library.getMediaClassifier(), libraryIndex, wait=False)
+
+    # Logs a summary of JSONRPC call latencies every once in a while, so slow
+    # calls to Kodi can be spotted in the log of a long-running service.
+    def _logLatencies():
+        jsonrpc.latencyRecorder.log()
+        taskManager.scheduler.schedule(LATENCY_LOG_INTERVAL, _logLatencies)
 
     # Handle uncaught exceptions raised by other than the main threads
     # in order to show an error notification in the UI, as those
@@ -29,14 +54,37 @@ def main():
     logger.info("Starting...")
     threading.excepthook = _threadingExceptionHandler
     monitor = Monitor()
+    # The settings change handler is set only while the components it uses are
+    # running, so a change during start up or shut down isn't handled.
+    settings = Settings(None)
+    library = Library(settings)
+    sourceDiscovery = SourceDiscovery(library, Player(), _onMediaSourcesChange)
+    profilePath = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo("profile"))
+    snapshotStore = SnapshotStore(os.path.join(profilePath, "snapshots"))
+
+    # Shared, so durations of executed tasks help to scope tasks of later changes
+    costEstimator = TaskCostEstimator()
 
-    with TaskManager(monitor) as taskManager, Watcher(taskManager) as watcher:
-        settings = Settings(_onSettingsChange)
-        library = Library(settings)
-        watcher.watch(library.getMediaSources())
+    # Timers of the watcher run on the scheduler thread of the task manager, so
+    # there is a single scheduler thread for the whole add-on.
+    with TaskManager(monitor, settings, costEstimator) as taskManager, LibraryIndex(monitor) as libraryIndex, Watcher(
+        taskManager, settings, snapshotStore, costEstimator, taskManager.scheduler
+    ) as watcher:
+        # Watches get installed in the background, so the service is running
+        # while large media sources are still being watched.
+        watcher.watch(sourceDiscovery.getMediaSources(), library.getMediaClassifier(), libraryIndex, wait=False)
+        taskManager.scheduler.schedule(LATENCY_LOG_INTERVAL, _logLatencies)
+        settings.onUpdate = _onSettingsChange
         logger.info("Started.")
-        monitor.waitForAbort()
+        try:
+            # Kodi doesn't notify about added or removed media sources, so those
+            # are checked for periodically, until Kodi asks the add-on to stop.
+            while not monitor.waitForAbort(settings.getSourcesCheckInterval()):
+                sourceDiscovery.check()
+        finally:
+            settings.onUpdate = None
 
+    jsonrpc.latencyRecorder.log()
     logger.info("Stopped.")
 
 
@@ -0,0 +1,79 @@
+"""
+Measures the cost of a 3,000-file season pack copy: adding a task to the
+task manager for every file created, the way EventHandler used to do, and
+collecting the changes with the change batcher, which then adds a single
+consolidated task. The number of threads alive includes the main thread.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_batching
+"""
+
+import threading
+import time
+import xbmc
+from unittest.mock import patch
+from watchdog.events import FileCreatedEvent
+import resources.lib.tasks as tasks
+from resources.lib.batching import ChangeBatcher
+from resources.lib.library import MediaClassifier, MediaSource, MediaType
+from resources.lib.monitoring import Monitor
+from resources.lib.scheduling import Scheduler
+from resources.lib.task_management import TaskManager
+from resources.lib.watcher import EventHandler
+
+FILE_COUNT = 3000
+SEASON_PATH = "/media/tv/Show/Season 01"
+
+
+def measureTaskManager(mediaSource, events):
+    with TaskManager(Monitor()) as taskManager:
+        start = time.perf_counter()
+        for event in events:
+            taskManager.add(tasks.UpdateLibrary(mediaSource, [SEASON_PATH]))
+        elapsed = time.perf_counter() - start
+        threadCount = threading.active_count()
+        taskManager.clear()
+
+    return elapsed, threadCount
+
+
+def measureBatcher(mediaSource, events):
+    with TaskManager(Monitor()) as taskManager, Scheduler() as scheduler:
+        batcher = ChangeBatcher(taskManager, scheduler)
+        handler = EventHandler(batcher, mediaSource, MediaClassifier())
+        start = time.perf_counter()
+        for event in events:
+            handler.dispatch(event)
+        batcher.flush()
+        elapsed = time.perf_counter() - start
+        threadCount = threading.active_count()
+        taskManager.clear()
+
+    return elapsed, threadCount
+
+
+def main():
+    mediaSource = MediaSource("/media/tv", MediaType.video)
+    events = [FileCreatedEvent("%s/episode-%04i.mkv" % (SEASON_PATH, i)) for i in range(FILE_COUNT)]
+
+    # Keep the task manager waiting, so the tasks only get queued up
+    with patch.object(xbmc, "getSupportedMedia", return_value=".mkv|"), patch.object(
+        xbmc.Player, "isPlaying", return_value=True
+    ):
+        taskManagerTime, taskManagerThreads = measureTaskManager(mediaSource, events)
+        batcherTime, batcherThreads = measureBatcher(mediaSource, events)
+
+    print("Files created: %i" % FILE_COUNT)
+    print(
+        "Task per event:  %.1f ms, %.1f us/event, %i threads alive"
+        % (taskManagerTime * 1000, taskManagerTime / FILE_COUNT * 1e6, taskManagerThreads)
+    )
+    print(
+        "Change batcher:  %.1f ms, %.1f us/event, %i threads alive"
+        % (batcherTime * 1000, batcherTime / FILE_COUNT * 1e6, batcherThreads)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures how many file system events per second go through EventHandler,
+with the cached media classifier and with the classifier that fetches
+supported media from Kodi on every call, the way it was done before the
+classifier got cached.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_event_handler
+"""
+
+import time
+import xbmc
+from unittest.mock import patch
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileMovedEvent
+from resources.lib.library import MediaClassifier, MediaSource, MediaType
+from resources.lib.util.file_system import getFileExt
+from resources.lib.watcher import EventHandler
+
+EVENT_COUNT = 20000
+
+# Default supported video file extensions of Kodi
+SUPPORTED_VIDEO = (
+    ".m4v|.3g2|.3gp|.nsv|.tp|.ts|.ty|.strm|.pls|.rm|.rmvb|.mpd|.m3u|.m3u8|.ifo|.mov|.qt|.divx|.xvid|.bivx|.vob|"
+    ".nrg|.img|.iso|.udf|.pva|.wmv|.asf|.asx|.ogm|.m2v|.avi|.bin|.dat|.mpg|.mpeg|.mp4|.mkv|.mk3d|.avc|.vp3|.svq3|"
+    ".nuv|.viv|.dv|.fli|.flv|.001|.wpl|.xspf|.zip|.vdr|.dvr-ms|.xsp|.mts|.m2t|.m2ts|.evo|.ogv|.sdp|.avs|.rec|.url|"
+    ".pxml|.vc1|.h264|.rcv|.rss|.mpls|.mpl|.webm|.bdmv|.bdm|.wtv|.trp|.f4v|.rar|.7z|.tar|.gz|"
+)
+
+
+class UncachedMediaClassifier:
+    """
+    Fetches and splits supported media on every call, as EventHandler used
+    to do before the classifier got cached.
+    """
+
+    def isSupported(self, path, mediaType):
+        return getFileExt(path) in xbmc.getSupportedMedia(mediaType.name).strip("|").split("|")
+
+
+class BatcherStub:
+    def addUpdate(self, mediaSource, path=None):
+        pass
+
+    def addClean(self, mediaSource, path=None):
+        pass
+
+    def trackWrite(self, path):
+        pass
+
+    def completeWrite(self, path):
+        pass
+
+
+def createEvents():
+    events = []
+    for i in range(EVENT_COUNT):
+        ext = [".mkv", ".nfo", ".MKV", ".srt"][i % 4]
+        path = "/media/tv/Show/Season 01/episode-%05i%s" % (i, ext)
+        if i % 3 == 0:
+            events.append(FileCreatedEvent(path))
+        elif i % 3 == 1:
+            events.append(FileDeletedEvent(path))
+        else:
+            events.append(FileMovedEvent(path, path + ".part"))
+
+    return events
+
+
+def measure(mediaClassifier, events):
+    mediaSource = MediaSource("/media/tv", MediaType.video)
+    handler = EventHandler(BatcherStub(), mediaSource, mediaClassifier)
+
+    start = time.perf_counter()
+    for event in events:
+        handler.dispatch(event)
+
+    return len(events) / (time.perf_counter() - start)
+
+
+def main():
+    events = createEvents()
+    with patch.object(xbmc, "getSupportedMedia", return_value=SUPPORTED_VIDEO):
+        uncached = measure(UncachedMediaClassifier(), events)
+        cached = measure(MediaClassifier(), events)
+
+    print("Events: %i" % len(events))
+    print("Uncached classifier: %.0f events/sec" % uncached)
+    print("Cached classifier:   %.0f events/sec" % cached)
+    print("Speed-up: %.1fx" % (cached / uncached))
+
+
+if __name__ == "__main__":
+    main()
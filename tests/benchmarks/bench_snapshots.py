@@ -0,0 +1,123 @@
+"""
+Measures load time and memory use of a stored snapshot with 1M and 5M files,
+in the memory-mapped format and in the format it replaced: the whole snapshot
+dictionary pickled and compressed with zlib. Every measurement runs in its own
+process, so memory use of one doesn't affect the others.
+
+"Visit" is looking up every directory of the snapshot, the way diffing a tree
+with no changes does. RSS is the resident memory of the process after that.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_snapshots
+"""
+
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from resources.lib.snapshots import MappedSnapshot, writeSnapshot
+from resources.lib.tree_diff import DirectoryState, FileState
+
+FILE_COUNTS = [1000000, 5000000]
+FILES_PER_SEASON = 20
+SEASONS_PER_SHOW = 10
+ROOT_PATH = "/media/tv"
+
+
+def createSnapshot(fileCount):
+    seasonCount = fileCount // FILES_PER_SEASON
+    showCount = seasonCount // SEASONS_PER_SHOW
+    showNames = tuple("Show %06i" % i for i in range(showCount))
+    seasonNames = tuple("Season %02i" % i for i in range(SEASONS_PER_SHOW))
+    fileNames = ["Episode %02i.mkv" % i for i in range(FILES_PER_SEASON)]
+
+    inode = 1
+    snapshot = {ROOT_PATH: DirectoryState(inode, 1, {}, showNames)}
+    for showName in showNames:
+        showPath = os.path.join(ROOT_PATH, showName)
+        inode += 1
+        snapshot[showPath] = DirectoryState(inode, 1, {}, seasonNames)
+        for seasonName in seasonNames:
+            files = {}
+            for fileName in fileNames:
+                inode += 1
+                files[fileName] = FileState(inode, 1500000000, 1700000000000000000 + inode)
+            inode += 1
+            snapshot[os.path.join(showPath, seasonName)] = DirectoryState(inode, 1, files, ())
+
+    return snapshot
+
+
+def getRss():
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def write(fileFormat, fileCount, filePath):
+    snapshot = createSnapshot(fileCount)
+    if fileFormat == "pickle":
+        with open(filePath, "wb") as file:
+            file.write(zlib.compress(pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)))
+    else:
+        writeSnapshot(filePath, ROOT_PATH, snapshot)
+
+
+def load(fileFormat, filePath):
+    start = time.perf_counter()
+    if fileFormat == "pickle":
+        with open(filePath, "rb") as file:
+            snapshot = pickle.loads(zlib.decompress(file.read()))
+    else:
+        snapshot = MappedSnapshot(filePath)
+    loadTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path in snapshot:
+        snapshot.get(path)
+    visitTime = time.perf_counter() - start
+
+    print("%.3f %.3f %i" % (loadTime, visitTime, getRss()))
+
+
+def runChild(*args):
+    result = subprocess.run(
+        [sys.executable, "-m", "tests.benchmarks.bench_snapshots"] + [str(arg) for arg in args],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return result.stdout
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tempDirPath:
+        for fileCount in FILE_COUNTS:
+            print("Files: %i" % fileCount)
+            for fileFormat in ["pickle", "mmap"]:
+                filePath = os.path.join(tempDirPath, "%s-%i.snapshot" % (fileFormat, fileCount))
+                runChild("write", fileFormat, fileCount, filePath)
+                loadTime, visitTime, rss = runChild("load", fileFormat, filePath).split()
+                print(
+                    "  %-6s file %6.1f MB, load %7.3f s, visit %6.3f s, RSS %7.1f MB"
+                    % (
+                        fileFormat,
+                        os.path.getsize(filePath) / 1e6,
+                        float(loadTime),
+                        float(visitTime),
+                        int(rss) / 1e6,
+                    )
+                )
+                os.remove(filePath)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "write":
+        write(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    elif len(sys.argv) > 1 and sys.argv[1] == "load":
+        load(sys.argv[2], sys.argv[3])
+    else:
+        main()
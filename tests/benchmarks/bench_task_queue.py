@@ -0,0 +1,77 @@
+"""
+Measures the cost of queueing up 100,000 path-scoped tasks, most of which are
+duplicates, with TaskQueue and with the list-backed queue it used to be,
+followed by popping all the queued up tasks.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_task_queue
+"""
+
+import random
+import time
+import resources.lib.tasks as tasks
+from resources.lib.library import MediaSource, MediaType
+from resources.lib.task_management import TaskQueue
+
+TASK_COUNT = 100000
+DIRECTORY_COUNT = 2000
+
+
+class ListTaskQueue:
+    """
+    Keeps tasks in a list, as TaskQueue used to do before tasks became hashable.
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def append(self, task):
+        if task in self.tasks:
+            return
+        self.tasks.append(task)
+
+    def pop(self):
+        return self.tasks.pop(0)
+
+    def size(self):
+        return len(self.tasks)
+
+
+def createTasks():
+    random.seed(0)
+    mediaSource = MediaSource("/media/tv", MediaType.video)
+    result = []
+    for _ in range(TASK_COUNT):
+        path = "/media/tv/Show %04i" % random.randrange(DIRECTORY_COUNT)
+        taskType = random.choice([tasks.UpdateLibrary, tasks.CleanLibrary])
+        result.append(taskType(mediaSource, [path]))
+
+    return result
+
+
+def measure(queue, taskList):
+    start = time.perf_counter()
+    for task in taskList:
+        queue.append(task)
+    queueSize = queue.size()
+    while queue.size() > 0:
+        queue.pop()
+
+    return time.perf_counter() - start, queueSize
+
+
+def main():
+    taskList = createTasks()
+
+    listTime, _ = measure(ListTaskQueue(), taskList)
+    dictTime, dictSize = measure(TaskQueue(), taskList)
+
+    print("Tasks appended: %i, unique: %i" % (len(taskList), dictSize))
+    print("List-backed queue: %.1f ms" % (listTime * 1000))
+    print("Dict-backed queue: %.1f ms" % (dictTime * 1000))
+    print("Speed-up: %.1fx" % (listTime / dictTime))
+
+
+if __name__ == "__main__":
+    main()
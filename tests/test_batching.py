@@ -0,0 +1,250 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, PropertyMock, call, patch
+import resources.lib.tasks as tasks
+from resources.lib.batching import ChangeBatcher
+from resources.lib.library import MediaSource, MediaType
+from resources.lib.scheduling import Scheduler
+from resources.lib.task_costs import TaskCostEstimator
+from resources.lib.task_management import TaskManager
+from resources.lib.write_tracking import WriteTracker
+
+
+class ChangeBatcher_Flush_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.taskManagerMock = Mock(TaskManager)
+        self.mediaSource = MediaSource("/media/tv", MediaType.video)
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_addsSingleUpdateTask_whenSameDirectoryIsAddedMultipleTimes(self):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        for _ in range(3000):
+            sut.addUpdate(self.mediaSource, "/media/tv/Show/Season 1")
+        sut.flush()
+
+        self.taskManagerMock.add.assert_called_once_with(
+            tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show/Season 1"])
+        )
+
+    def test_collapsesNestedDirectories_whenFlushed(self):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show/Season 1")
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        sut.addUpdate(self.mediaSource, "/media/tv/Show 2")
+        sut.addUpdate(self.mediaSource, "/media/tv/Show/Season 2/Extras")
+        sut.flush()
+
+        self.taskManagerMock.add.assert_called_once_with(
+            tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show", "/media/tv/Show 2"])
+        )
+
+    def test_addsWholeLibraryTask_whenWholeLibraryIsAdded(self):
+        mediaSource = MediaSource("/media/music", MediaType.music)
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addClean(mediaSource, "/media/music/Album")
+        sut.addClean(mediaSource)
+        sut.flush()
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.CleanLibrary(mediaSource))
+
+    def test_addsTaskForCommonParentDirectory_whenCostEstimatorExpectsItToBeCheaper(self):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler, TaskCostEstimator())
+
+        for i in range(20):
+            sut.addUpdate(self.mediaSource, "/media/tv/Show/Season %i" % i)
+        sut.flush()
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show"]))
+
+    def test_addsUpdateTaskBeforeCleanTask_whenFlushed(self):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addClean(self.mediaSource, "/media/tv/Show")
+        sut.addUpdate(self.mediaSource, "/media/tv/Show 2")
+        sut.flush()
+
+        self.assertEqual(
+            self.taskManagerMock.add.call_args_list,
+            [
+                call(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show 2"])),
+                call(tasks.CleanLibrary(self.mediaSource, ["/media/tv/Show"])),
+            ],
+        )
+
+    def test_addsTasksPerMediaSource_whenMultipleMediaSourcesChanged(self):
+        mediaSource2 = MediaSource("/media/movies", MediaType.video)
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        sut.addUpdate(mediaSource2, "/media/movies")
+        sut.flush()
+
+        self.assertEqual(self.taskManagerMock.add.call_count, 2)
+
+    def test_addsTasksOfOtherMediaSources_afterClearForMediaSource(self):
+        mediaSource2 = MediaSource("/media/movies", MediaType.video)
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        sut.addUpdate(mediaSource2, "/media/movies")
+        sut.clear([self.mediaSource])
+        sut.flush()
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(mediaSource2, ["/media/movies"]))
+
+    def test_doesNotAddAnyTasks_afterClear(self):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        sut.clear()
+        sut.flush()
+
+        self.taskManagerMock.add.assert_not_called()
+
+
+@patch.object(ChangeBatcher, "BATCH_WAIT", new_callable=PropertyMock, return_value=0.1)
+class ChangeBatcher_Batch_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.taskManagerMock = Mock(TaskManager)
+        self.mediaSource = MediaSource("/media/tv", MediaType.video)
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_addsTasks_afterBatchWaitTime(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        self.taskManagerMock.add.assert_not_called()
+        time.sleep(0.2)
+
+        self.taskManagerMock.add.assert_called_once()
+
+    def test_doesNotRestartBatch_whenChangesKeepComing(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        time.sleep(0.05)
+        sut.addUpdate(self.mediaSource, "/media/tv/Show 2")
+        time.sleep(0.1)
+
+        self.taskManagerMock.add.assert_called_once_with(
+            tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show", "/media/tv/Show 2"])
+        )
+
+    def test_holdsBatchOpen_whileProbeIsPending(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addClean(self.mediaSource, "/media/tv/Show")
+        sut.beginProbe()
+        time.sleep(0.2)
+        self.taskManagerMock.add.assert_not_called()
+        sut.addUpdate(self.mediaSource, "/media/tv/Show 2")
+        sut.endProbe()
+        time.sleep(0.05)
+
+        self.taskManagerMock.add.assert_has_calls(
+            [
+                call(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show 2"])),
+                call(tasks.CleanLibrary(self.mediaSource, ["/media/tv/Show"])),
+            ]
+        )
+        self.assertEqual(self.taskManagerMock.add.call_count, 2)
+
+    def test_startsBatch_whenProbeBegins(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.beginProbe()
+        time.sleep(0.05)
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        sut.endProbe()
+        time.sleep(0.1)
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show"]))
+
+    def test_doesNotHoldBatchOpen_whenForced(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.addUpdate(self.mediaSource, "/media/tv/Show")
+        sut.beginProbe()
+        sut.flush(force=True)
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/Show"]))
+
+
+@patch.object(ChangeBatcher, "BATCH_WAIT", new_callable=PropertyMock, return_value=0.1)
+@patch.object(WriteTracker, "CHECK_INTERVAL", new_callable=PropertyMock, return_value=0.1)
+class ChangeBatcher_PendingWrites_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.taskManagerMock = Mock(TaskManager)
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.mediaSource = MediaSource(self.tempDir.name, MediaType.video)
+        self.filePath = os.path.join(self.tempDir.name, "movie.mkv")
+        with open(self.filePath, "wb"):
+            pass
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.tempDir.cleanup()
+
+    def test_holdsBackUpdateTask_whileFileIsBeingWritten(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.trackWrite(self.filePath)
+        sut.addUpdate(self.mediaSource, self.tempDir.name)
+        sut.addClean(self.mediaSource, "/media/movies")
+        sut.flush()
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.CleanLibrary(self.mediaSource, ["/media/movies"]))
+        self.assertTrue(sut.hasChanges())
+
+    def test_addsUpdateTask_whenFileIsClosed(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.trackWrite(self.filePath)
+        sut.addUpdate(self.mediaSource, self.tempDir.name)
+        sut.flush()
+        sut.completeWrite(self.filePath)
+        time.sleep(0.15)
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(self.mediaSource, [self.tempDir.name]))
+
+    def test_addsUpdateTask_whenFileStopsGrowing(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.trackWrite(self.filePath)
+        sut.addUpdate(self.mediaSource, self.tempDir.name)
+        for _ in range(3):
+            time.sleep(0.07)
+            with open(self.filePath, "ab") as file:
+                file.write(b"data")
+        self.taskManagerMock.add.assert_not_called()
+        time.sleep(0.4)
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(self.mediaSource, [self.tempDir.name]))
+
+    def test_addsUpdateTask_whenForced(self, *args):
+        sut = ChangeBatcher(self.taskManagerMock, self.scheduler)
+
+        sut.trackWrite(self.filePath)
+        sut.addUpdate(self.mediaSource, self.tempDir.name)
+        sut.flush(force=True)
+
+        self.taskManagerMock.add.assert_called_once_with(tasks.UpdateLibrary(self.mediaSource, [self.tempDir.name]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import json
+import unittest
+import xbmc
+from unittest.mock import patch
+from resources.lib.jsonrpc import JsonRpcClient, JsonRpcError, LatencyRecorder, Request
+
+
+class JsonRpcClient_Call_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.rpcPatcher = patch.object(xbmc, "executeJSONRPC")
+        self.rpcMock = self.rpcPatcher.start()
+        self.recorder = LatencyRecorder()
+        self.sut = JsonRpcClient(self.recorder)
+
+    def tearDown(self):
+        self.rpcPatcher.stop()
+
+    def test_sendsSingleRequest_whenCallingOneMethod(self):
+        self.rpcMock.return_value = '{"id": 1, "jsonrpc": "2.0", "result": "OK"}'
+
+        response = self.sut.call("VideoLibrary.Scan", {"directory": "/media/tv/"})
+
+        self.rpcMock.assert_called_once_with(
+            '{"jsonrpc": "2.0", "method": "VideoLibrary.Scan", "params": {"directory": "/media/tv/"}, "id": 1}'
+        )
+        self.assertTrue(response.ok)
+        self.assertEqual(response.result, "OK")
+
+    def test_returnsError_whenCallFails(self):
+        self.rpcMock.return_value = '{"id": 1, "jsonrpc": "2.0", "error": {"code": -32601, "message": "Not found."}}'
+
+        response = self.sut.call("Files.GetSources", {"media": "video"})
+
+        self.assertFalse(response.ok)
+        self.assertEqual(response.error["code"], -32601)
+
+    def test_sendsBatchInSingleRoundTrip_whenCallingSeveralMethods(self):
+        self.rpcMock.return_value = "[]"
+
+        self.sut.callBatch([Request("Files.GetSources", {"media": "video"}), Request("JSONRPC.Ping")])
+
+        self.rpcMock.assert_called_once()
+        self.assertEqual(
+            json.loads(self.rpcMock.call_args.args[0]),
+            [
+                {"jsonrpc": "2.0", "method": "Files.GetSources", "params": {"media": "video"}, "id": 1},
+                {"jsonrpc": "2.0", "method": "JSONRPC.Ping", "params": {}, "id": 2},
+            ],
+        )
+
+    def test_returnsResponsesInOrderOfRequests_whenBatchResponsesComeInOtherOrder(self):
+        self.rpcMock.return_value = json.dumps(
+            [
+                {"id": 2, "jsonrpc": "2.0", "result": "pong"},
+                {"id": 1, "jsonrpc": "2.0", "result": {"sources": []}},
+            ]
+        )
+
+        responses = self.sut.callBatch([Request("Files.GetSources", {"media": "video"}), Request("JSONRPC.Ping")])
+
+        self.assertEqual([r.method for r in responses], ["Files.GetSources", "JSONRPC.Ping"])
+        self.assertEqual([r.result for r in responses], [{"sources": []}, "pong"])
+
+    def test_returnsErrorForEveryRequest_whenWholeBatchFails(self):
+        self.rpcMock.return_value = '{"id": null, "jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse."}}'
+
+        responses = self.sut.callBatch([Request("JSONRPC.Ping"), Request("JSONRPC.Ping")])
+
+        self.assertEqual([r.error["code"] for r in responses], [-32700, -32700])
+
+    def test_measuresLatencyPerMethod(self):
+        self.rpcMock.return_value = '{"id": 1, "jsonrpc": "2.0", "result": "pong"}'
+
+        self.sut.call("JSONRPC.Ping")
+        self.sut.call("JSONRPC.Ping")
+
+        latencies = self.recorder.getLatencies()
+        self.assertEqual(list(latencies), ["JSONRPC.Ping"])
+        self.assertEqual(latencies["JSONRPC.Ping"].calls, 2)
+
+    def test_sharesLatencies_betweenClientsByDefault(self):
+        self.rpcMock.return_value = '{"id": 1, "jsonrpc": "2.0", "result": "pong"}'
+        sharedRecorder = LatencyRecorder()
+
+        with patch("resources.lib.jsonrpc.latencyRecorder", sharedRecorder):
+            JsonRpcClient().call("JSONRPC.Ping")
+            JsonRpcClient().call("JSONRPC.Ping")
+
+        self.assertEqual(sharedRecorder.getLatencies()["JSONRPC.Ping"].calls, 2)
+
+
+class JsonRpcClient_GetPages_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.rpcPatcher = patch.object(xbmc, "executeJSONRPC")
+        self.rpcMock = self.rpcPatcher.start()
+        self.rpcMock.side_effect = self._executeJSONRPCStub
+        self.items = [{"file": "/movies/%i.mkv" % i} for i in range(5)]
+        self.sut = JsonRpcClient()
+
+    def tearDown(self):
+        self.rpcPatcher.stop()
+
+    def test_yieldsAllItemsPageByPage(self):
+        pages = list(self.sut.getPages("VideoLibrary.GetMovies", {"properties": ["file"]}, "movies", 2))
+
+        self.assertEqual(pages, [self.items[0:2], self.items[2:4], self.items[4:5]])
+        self.assertEqual(
+            [json.loads(c.args[0])["params"] for c in self.rpcMock.call_args_list],
+            [
+                {"properties": ["file"], "limits": {"start": 0, "end": 2}},
+                {"properties": ["file"], "limits": {"start": 2, "end": 4}},
+                {"properties": ["file"], "limits": {"start": 4, "end": 6}},
+            ],
+        )
+
+    def test_raisesError_whenFetchingPageFails(self):
+        self.rpcMock.side_effect = lambda _: '{"error": {"code": -32602, "message": "Invalid params."}}'
+
+        with self.assertRaises(JsonRpcError):
+            list(self.sut.getPages("VideoLibrary.GetMovies", {}, "movies", 2))
+
+    def _executeJSONRPCStub(self, query: str):
+        limits = json.loads(query)["params"]["limits"]
+        page = self.items[limits["start"] : limits["end"]]
+
+        return json.dumps(
+            {
+                "id": 1,
+                "jsonrpc": "2.0",
+                "result": {
+                    "movies": page,
+                    "limits": {"start": limits["start"], "end": limits["start"] + len(page), "total": len(self.items)},
+                },
+            }
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 import xbmc
 from unittest.mock import MagicMock, patch
-from resources.lib.library import MediaType, Library
+from resources.lib.library import MediaClassifier, MediaSource, MediaType, Library
 
 
 class Library_GetMediaSources_TestCase(unittest.TestCase):
@@ -24,7 +24,7 @@ class Library_GetMediaSources_TestCase(unittest.TestCase):
         _ = library.getMediaSources()
 
         self.rpcMock.assert_called_once_with(
-            '{"jsonrpc": "2.0", "method": "Files.GetSources", "params": { "media": "video" }, "id": 1}'
+            '{"jsonrpc": "2.0", "method": "Files.GetSources", "params": {"media": "video"}, "id": 1}'
         )
 
     def test_doesNotCallRpcApi_whenWatchVideoSettingIsDisabled(self):
@@ -42,7 +42,7 @@ class Library_GetMediaSources_TestCase(unittest.TestCase):
         _ = library.getMediaSources()
 
         self.rpcMock.assert_called_once_with(
-            '{"jsonrpc": "2.0", "method": "Files.GetSources", "params": { "media": "music" }, "id": 1}'
+            '{"jsonrpc": "2.0", "method": "Files.GetSources", "params": {"media": "music"}, "id": 1}'
         )
 
     def test_doesNotCallRpcApi_whenWatchMusicSettingIsDisabled(self):
@@ -53,6 +53,24 @@ class Library_GetMediaSources_TestCase(unittest.TestCase):
 
         self.rpcMock.assert_not_called()
 
+    def test_callsRpcApiOnce_whenBothWatchSettingsAreEnabled(self):
+        self.rpcMock.return_value = """
+          [
+            {"id": 1, "jsonrpc": "2.0", "result": {"sources": [{"file": "/media/movies", "label": "Movies"}]}},
+            {"id": 2, "jsonrpc": "2.0", "result": {"sources": [{"file": "/media/music", "label": "Music"}]}}
+          ]
+        """
+        self.settingsMock.return_value.isRefreshVideoEnabled.return_value = True
+        self.settingsMock.return_value.isRefreshMusicEnabled.return_value = True
+        library = Library(self.settingsMock())
+
+        result = library.getMediaSources()
+
+        self.rpcMock.assert_called_once()
+        self.assertEqual(
+            result, [MediaSource("/media/movies", MediaType.video), MediaSource("/media/music", MediaType.music)]
+        )
+
     def test_returnsVideoSources_whenWatchVideoSettingIsEnabled(self):
         self.rpcMock.return_value = """
           {
@@ -200,5 +218,58 @@ class Library_GetMediaSources_TestCase(unittest.TestCase):
         self.assertEqual(result[1].type, MediaType.music)
 
 
+class MediaClassifier_IsSupported_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.supportedMediaPatcher = patch.object(xbmc, "getSupportedMedia")
+        self.supportedMediaMock = self.supportedMediaPatcher.start()
+        self.supportedMediaMock.side_effect = lambda type: ".mkv|.mp4|" if type == "video" else ".mp3|.flac|"
+
+    def tearDown(self):
+        self.supportedMediaPatcher.stop()
+
+    def test_returnsTrue_forSupportedExtension(self):
+        sut = MediaClassifier()
+
+        self.assertTrue(sut.isSupported("/media/movies/movie.mkv", MediaType.video))
+        self.assertTrue(sut.isSupported("/media/music/song.flac", MediaType.music))
+
+    def test_returnsTrue_forSupportedExtensionInUpperCase(self):
+        sut = MediaClassifier()
+
+        self.assertTrue(sut.isSupported("/media/movies/MOVIE.MKV", MediaType.video))
+
+    def test_returnsFalse_forNotSupportedExtension(self):
+        sut = MediaClassifier()
+
+        self.assertFalse(sut.isSupported("/media/movies/RARBG.txt", MediaType.video))
+        self.assertFalse(sut.isSupported("/media/movies/no-ext", MediaType.video))
+        self.assertFalse(sut.isSupported("/media/music/song.mkv", MediaType.music))
+
+    def test_fetchesSupportedMediaOnlyOnce_whenCalledMultipleTimes(self):
+        sut = MediaClassifier()
+
+        sut.isSupported("/media/movies/movie.mkv", MediaType.video)
+        sut.isSupported("/media/movies/movie.mp4", MediaType.video)
+
+        self.assertEqual(self.supportedMediaMock.call_count, 2)  # Once for video and once for music
+
+
+class Library_GetMediaClassifier_TestCase(unittest.TestCase):
+    @patch.object(xbmc, "getSupportedMedia", return_value="")
+    def test_returnsCachedClassifier_whenCalledMultipleTimes(self, *args):
+        library = Library(MagicMock())
+
+        self.assertIs(library.getMediaClassifier(), library.getMediaClassifier())
+
+    @patch.object(xbmc, "getSupportedMedia", return_value="")
+    def test_returnsNewClassifier_afterReset(self, *args):
+        library = Library(MagicMock())
+        classifier = library.getMediaClassifier()
+
+        library.resetMediaClassifier()
+
+        self.assertIsNot(library.getMediaClassifier(), classifier)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,222 @@
+import json
+import unittest
+import xbmc
+from unittest.mock import patch
+from resources.lib.library import MediaType
+from resources.lib.library_index import LibraryIndex
+from resources.lib.monitoring import Monitor
+
+
+class LibraryIndex_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.items = {
+            "VideoLibrary.GetMovies": ["/movies/a.mkv", "/movies/b.mkv", "/movies/c.mkv"],
+            "VideoLibrary.GetEpisodes": ["/tv/s01e01.mkv"],
+            "VideoLibrary.GetMusicVideos": [],
+            "AudioLibrary.GetSongs": ["/music/song.mp3"],
+        }
+        self.rpcPatcher = patch.object(xbmc, "executeJSONRPC")
+        self.rpcMock = self.rpcPatcher.start()
+        self.rpcMock.side_effect = self._executeJSONRPCStub
+        self.pageSizePatcher = patch.object(LibraryIndex, "PAGE_SIZE", 2)
+        self.pageSizePatcher.start()
+        self.monitor = Monitor()
+
+    def tearDown(self):
+        self.pageSizePatcher.stop()
+        self.rpcPatcher.stop()
+
+    def test_containsLibraryFiles_whenLoaded(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+
+            self.assertTrue(sut.contains(MediaType.video, "/movies/a.mkv"))
+            self.assertTrue(sut.contains(MediaType.video, "/movies/c.mkv"))
+            self.assertTrue(sut.contains(MediaType.video, "/tv/s01e01.mkv"))
+            self.assertTrue(sut.contains(MediaType.music, "/music/song.mp3"))
+            self.assertFalse(sut.contains(MediaType.video, "/movies/d.mkv"))
+            self.assertFalse(sut.contains(MediaType.music, "/movies/a.mkv"))
+
+    def test_fetchesItemsInPages(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+
+        movieQueries = [q for q in self._getQueries() if q["method"] == "VideoLibrary.GetMovies"]
+        self.assertEqual(
+            [q["params"]["limits"] for q in movieQueries],
+            [{"start": 0, "end": 2}, {"start": 2, "end": 4}],
+        )
+
+    def test_containsFilesOfStackedItems(self):
+        self.items["VideoLibrary.GetMovies"] = ["stack:///movies/cd1.mkv , /movies/a,,b.mkv"]
+
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+
+            self.assertTrue(sut.contains(MediaType.video, "/movies/cd1.mkv"))
+            self.assertTrue(sut.contains(MediaType.video, "/movies/a,b.mkv"))
+
+    def test_isUnknown_whenFetchingFails(self):
+        self.rpcMock.side_effect = lambda _: '{"error": {"code": -32601, "message": "Method not found."}}'
+
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+
+            self.assertIsNone(sut.contains(MediaType.video, "/movies/a.mkv"))
+
+    def test_keepsBeingUsed_whileLibraryIsChanging(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.monitor.onScanStarted("video")
+
+            self.assertTrue(sut.contains(MediaType.video, "/movies/a.mkv"))
+
+    def test_addsItem_whenKodiNotifiesAboutAddedItem(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.items["VideoLibrary.GetMovies"].append("/movies/d.mkv")
+            queryCount = len(self._getQueries())
+            self._notify("VideoLibrary.OnUpdate", {"item": {"id": 4, "type": "movie"}, "added": True})
+            self._waitForLoad(sut)
+
+            self.assertTrue(sut.contains(MediaType.video, "/movies/d.mkv"))
+            # Only the added item is fetched, the index doesn't get reloaded
+            self.assertEqual([q["method"] for q in self._getQueries()[queryCount:]], ["VideoLibrary.GetMovieDetails"])
+
+    def test_replacesPath_whenKodiNotifiesAboutChangedItem(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.items["VideoLibrary.GetEpisodes"][0] = "/tv/s01e01-e02.mkv"
+            self._notify("VideoLibrary.OnUpdate", {"item": {"id": 1, "type": "episode"}})
+            self._waitForLoad(sut)
+
+            self.assertFalse(sut.contains(MediaType.video, "/tv/s01e01.mkv"))
+            self.assertTrue(sut.contains(MediaType.video, "/tv/s01e01-e02.mkv"))
+
+    def test_removesItem_whenKodiNotifiesAboutRemovedItem(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.items["AudioLibrary.GetSongs"][0] = None
+            self._notify("AudioLibrary.OnRemove", {"id": 1, "type": "song"})
+            self._waitForLoad(sut)
+
+            self.assertFalse(sut.contains(MediaType.music, "/music/song.mp3"))
+
+    def test_removesItem_whenChangedItemDoesNotExistAnymore(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.items["VideoLibrary.GetMovies"][0] = None
+            self._notify("VideoLibrary.OnUpdate", {"item": {"id": 1, "type": "movie"}})
+            self._waitForLoad(sut)
+
+            self.assertFalse(sut.contains(MediaType.video, "/movies/a.mkv"))
+
+    def test_keepsFile_whenOtherItemOfTheSameFileIsRemoved(self):
+        self.items["VideoLibrary.GetEpisodes"] = ["/tv/s01e01-e02.mkv", "/tv/s01e01-e02.mkv"]
+
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.items["VideoLibrary.GetEpisodes"][1] = None
+            self._notify("VideoLibrary.OnRemove", {"id": 2, "type": "episode"})
+            self._waitForLoad(sut)
+
+            self.assertTrue(sut.contains(MediaType.video, "/tv/s01e01-e02.mkv"))
+
+    def test_reloads_whenTvShowIsRemoved(self):
+        with LibraryIndex(self.monitor) as sut:
+            self._waitForLoad(sut)
+            self.items["VideoLibrary.GetEpisodes"] = []
+            self._notify("VideoLibrary.OnRemove", {"id": 1, "type": "tvshow"})
+            self._waitForLoad(sut)
+
+            self.assertFalse(sut.contains(MediaType.video, "/tv/s01e01.mkv"))
+
+    def test_hasItemsInDirectory_whenItemsAreLocatedInIt(self):
+        sut = LibraryIndex(self.monitor)
+
+        self.assertTrue(sut.hasItemsInDirectory(MediaType.video, "/tv"))
+        self.assertTrue(sut.hasItemsInDirectory(MediaType.music, "/music"))
+        self.assertEqual(self._getQueries()[-1]["params"]["filter"]["value"], "/music/")
+
+    def test_hasNoItemsInDirectory_whenNoItemsAreLocatedInIt(self):
+        sut = LibraryIndex(self.monitor)
+
+        self.assertFalse(sut.hasItemsInDirectory(MediaType.video, "/mov"))
+        self.assertFalse(sut.hasItemsInDirectory(MediaType.music, "/movies"))
+
+    def test_checksAllItemKindsInSingleRequest_whenCheckingDirectory(self):
+        sut = LibraryIndex(self.monitor)
+
+        sut.hasItemsInDirectory(MediaType.video, "/movies")
+
+        self.rpcMock.assert_called_once()
+
+    def test_hasItemsInDirectoryIsUnknown_whenFetchingFails(self):
+        self.rpcMock.side_effect = lambda _: '{"error": {"code": -32602, "message": "Invalid params."}}'
+        sut = LibraryIndex(self.monitor)
+
+        self.assertIsNone(sut.hasItemsInDirectory(MediaType.video, "/movies"))
+
+    def _waitForLoad(self, sut: LibraryIndex):
+        # Loads and changes run one at a time, in the order they were requested
+        sut.executor.submit(lambda: None).result()
+
+    def _notify(self, method: str, data: dict):
+        self.monitor.onNotification("xbmc", method, json.dumps(data))
+
+    def _getQueries(self):
+        queries = []
+        for call in self.rpcMock.call_args_list:
+            query = json.loads(call.args[0])
+            queries.extend(query if isinstance(query, list) else [query])
+
+        return queries
+
+    def _executeJSONRPCStub(self, query: str):
+        query = json.loads(query)
+        if isinstance(query, list):
+            return json.dumps([json.loads(self._executeJSONRPCStub(json.dumps(q))) for q in query])
+
+        method = query["method"]
+        if method.endswith("Details"):
+            return self._getItemDetails(query)
+
+        field, itemType = {
+            "VideoLibrary.GetMovies": ("movies", "movie"),
+            "VideoLibrary.GetEpisodes": ("episodes", "episode"),
+            "VideoLibrary.GetMusicVideos": ("musicvideos", "musicvideo"),
+            "AudioLibrary.GetSongs": ("songs", "song"),
+        }[method]
+        limits = query["params"]["limits"]
+        # Item IDs start from 1, removed items are None
+        items = [(i + 1, f) for i, f in enumerate(self.items[method]) if f is not None]
+        filter = query["params"].get("filter")
+        if filter is not None:
+            items = [(i, f) for i, f in items if f.startswith(filter["value"])]
+        page = items[limits["start"] : limits["end"]]
+
+        return json.dumps(
+            {
+                "id": query["id"],
+                "jsonrpc": "2.0",
+                "result": {
+                    field: [{itemType + "id": i, "file": f, "label": f} for i, f in page],
+                    "limits": {"start": limits["start"], "end": limits["start"] + len(page), "total": len(items)},
+                },
+            }
+        )
+
+    def _getItemDetails(self, query: dict):
+        method, field, itemType = {
+            "VideoLibrary.GetMovieDetails": ("VideoLibrary.GetMovies", "moviedetails", "movie"),
+            "VideoLibrary.GetEpisodeDetails": ("VideoLibrary.GetEpisodes", "episodedetails", "episode"),
+            "AudioLibrary.GetSongDetails": ("AudioLibrary.GetSongs", "songdetails", "song"),
+        }[query["method"]]
+        itemId = query["params"][itemType + "id"]
+        files = self.items[method]
+        if itemId > len(files) or files[itemId - 1] is None:
+            return json.dumps(
+                {"id": query["id"], "jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params."}}
+            )
+
+        return json.dumps({"id": query["id"], "jsonrpc": "2.0", "result": {field: {"file": files[itemId - 1]}}})
@@ -0,0 +1,63 @@
+import unittest
+import resources.lib.tasks as tasks
+from resources.lib.library import MediaSource, MediaType
+from resources.lib.playback_policy import PlaybackPolicy
+from resources.lib.player import AvType, PlaybackStatus, PlayerState
+
+
+class PlaybackPolicy_TestCase(unittest.TestCase):
+    def setUp(self):
+        mediaSource = MediaSource("/media/tv", MediaType.video)
+        self.scopedScan = tasks.UpdateLibrary(mediaSource, ["/media/tv/Show"])
+        self.libraryScan = tasks.UpdateLibrary(mediaSource)
+        self.clean = tasks.CleanLibrary(mediaSource, ["/media/tv/Show"])
+        self.sut = PlaybackPolicy()
+
+    def test_allowsAllTasks_whenNothingIsPlaying(self):
+        state = PlayerState(PlaybackStatus.stopped, None)
+
+        for task in (self.scopedScan, self.libraryScan, self.clean):
+            self.assertTrue(self.sut.allows(task, state))
+
+    def test_allowsOnlyScans_duringAudioPlayback(self):
+        state = PlayerState(PlaybackStatus.playing, AvType.audio)
+
+        self.assertTrue(self.sut.allows(self.scopedScan, state))
+        self.assertTrue(self.sut.allows(self.libraryScan, state))
+        self.assertFalse(self.sut.allows(self.clean, state))
+
+    def test_allowsOnlyScopedScans_whilePlaybackOfVideoIsPaused(self):
+        state = PlayerState(PlaybackStatus.paused, AvType.video)
+
+        self.assertTrue(self.sut.allows(self.scopedScan, state))
+        self.assertFalse(self.sut.allows(self.libraryScan, state))
+        self.assertFalse(self.sut.allows(self.clean, state))
+
+    def test_allowsScansButNotCleans_whilePlaybackOfAudioIsPaused(self):
+        state = PlayerState(PlaybackStatus.paused, AvType.audio)
+
+        self.assertTrue(self.sut.allows(self.scopedScan, state))
+        self.assertTrue(self.sut.allows(self.libraryScan, state))
+        self.assertFalse(self.sut.allows(self.clean, state))
+
+    def test_allowsAtLeastAsMuchWhilePaused_asDuringThePlayback(self):
+        for avType in (AvType.audio, AvType.video, None):
+            for task in (self.scopedScan, self.libraryScan, self.clean):
+                if self.sut.allows(task, PlayerState(PlaybackStatus.playing, avType)):
+                    self.assertTrue(self.sut.allows(task, PlayerState(PlaybackStatus.paused, avType)))
+
+    def test_allowsNoTasks_duringVideoPlayback(self):
+        state = PlayerState(PlaybackStatus.playing, AvType.video)
+
+        for task in (self.scopedScan, self.libraryScan, self.clean):
+            self.assertFalse(self.sut.allows(task, state))
+
+    def test_allowsNoTasks_whenTypeOfPlayedMediaIsNotKnownYet(self):
+        state = PlayerState(PlaybackStatus.playing, None)
+
+        for task in (self.scopedScan, self.libraryScan, self.clean):
+            self.assertFalse(self.sut.allows(task, state))
+
+
+if __name__ == "__main__":
+    unittest.main()
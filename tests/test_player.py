@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import xbmc
+from resources.lib.player import AvType, Event, PlaybackStatus, Player, PlayerState
+
+
+@patch.object(xbmc.Player, "isPlayingVideo", return_value=False)
+@patch.object(xbmc.Player, "isPlaying", return_value=False)
+class Player_State_TestCase(unittest.TestCase):
+    def test_isStopped_whenNothingIsPlayingOnStart(self, *args):
+        sut = Player()
+
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.stopped, None))
+
+    def test_isPlaying_whenSomethingIsPlayingOnStart(self, isPlayingMock: MagicMock, *args):
+        isPlayingMock.return_value = True
+
+        sut = Player()
+
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.playing, AvType.audio))
+
+    def test_tracksStateFromPlaybackCallbacks(self, *args):
+        sut = Player()
+
+        sut.onPlayBackStarted()
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.playing, None))
+        sut.onAVStarted()
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.playing, AvType.audio))
+        sut.onPlayBackPaused()
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.paused, AvType.audio))
+        sut.onPlayBackResumed()
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.playing, AvType.audio))
+        sut.onPlayBackEnded()
+        self.assertEqual(sut.getState(), PlayerState(PlaybackStatus.stopped, None))
+
+    def test_callsCallback_onlyWhenStateChanges(self, *args):
+        callback = MagicMock()
+        sut = Player()
+        sut.attach(Event.onPlayBackStateChanged, callback)
+
+        sut.onPlayBackStopped()
+        sut.onPlayBackStarted()
+        sut.onPlayBackPaused()
+        sut.onPlayBackPaused()
+
+        self.assertEqual(callback.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
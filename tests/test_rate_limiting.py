@@ -0,0 +1,57 @@
+import time
+import unittest
+from resources.lib.rate_limiting import TokenBucket
+
+
+class TokenBucket_TestCase(unittest.TestCase):
+    def test_allowsActionsUpToCapacity_whenBucketIsFull(self):
+        sut = TokenBucket(2, 10)
+
+        self.assertTrue(sut.take())
+        self.assertTrue(sut.take())
+        self.assertFalse(sut.take())
+
+    def test_returnsTimeUntilTokenIsRefilled_whenBucketIsEmpty(self):
+        sut = TokenBucket(2, 10)
+        sut.take()
+        sut.take()
+
+        self.assertAlmostEqual(sut.getWaitTime(), 5, places=1)
+
+    def test_allowsAction_afterTokenIsRefilled(self):
+        sut = TokenBucket(1, 0.1)
+        sut.take()
+
+        time.sleep(0.1)
+
+        self.assertTrue(sut.take())
+
+    def test_allowsAnyNumberOfActions_whenCapacityIsZero(self):
+        sut = TokenBucket(0, 10)
+
+        for _ in range(100):
+            self.assertTrue(sut.take())
+        self.assertEqual(sut.getWaitTime(), 0)
+
+    def test_keepsTokensThatAreLeft_whenCapacityChanges(self):
+        sut = TokenBucket(2, 10)
+        sut.take()
+        sut.take()
+
+        sut.setCapacity(4)
+
+        self.assertFalse(sut.take())
+
+    def test_fillsBucket_whenLimitIsSetAfterNoLimit(self):
+        sut = TokenBucket(0, 10)
+        sut.take()
+
+        sut.setCapacity(2)
+
+        self.assertTrue(sut.take())
+        self.assertTrue(sut.take())
+        self.assertFalse(sut.take())
+
+
+if __name__ == "__main__":
+    unittest.main()
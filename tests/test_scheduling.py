@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from resources.lib.scheduling import Debouncer, Scheduler
+
+
+class Scheduler_Schedule_TestCase(unittest.TestCase):
+    def test_runsCallback_afterDelay(self):
+        callback = MagicMock()
+
+        with Scheduler() as sut:
+            sut.schedule(0.1, callback)
+            time.sleep(0.05)
+            callback.assert_not_called()
+            time.sleep(0.1)
+
+        callback.assert_called_once()
+
+    def test_runsCallbacksInDueTimeOrder_whenScheduledInDifferentOrder(self):
+        calls = []
+
+        with Scheduler() as sut:
+            sut.schedule(0.2, lambda: calls.append(2))
+            sut.schedule(0.1, lambda: calls.append(1))
+            sut.schedule(0, lambda: calls.append(0))
+            time.sleep(0.3)
+
+        self.assertEqual(calls, [0, 1, 2])
+
+    def test_doesNotRunCallback_whenCancelled(self):
+        callback = MagicMock()
+
+        with Scheduler() as sut:
+            timer = sut.schedule(0.1, callback)
+            sut.cancel(timer)
+            time.sleep(0.2)
+
+        callback.assert_not_called()
+
+    def test_runsLaterCallbacks_whenCallbackRaisesException(self):
+        callback = MagicMock()
+
+        with Scheduler() as sut:
+            sut.schedule(0, MagicMock(side_effect=RuntimeError()))
+            sut.schedule(0.1, callback)
+            time.sleep(0.2)
+
+        callback.assert_called_once()
+
+    def test_doesNotCreateThreads_whenManyCallbacksScheduled(self):
+        with Scheduler() as sut:
+            for _ in range(1000):
+                sut.schedule(10, MagicMock())
+            threadCount = threading.active_count()
+
+        self.assertEqual(threadCount, 2)
+
+    def test_endsItsOwnThread_afterExitingTheWithContext(self):
+        with Scheduler() as sut:
+            sut.schedule(10, MagicMock())
+
+        self.assertEqual(threading.active_count(), 1)
+
+
+class Debouncer_Touch_TestCase(unittest.TestCase):
+    def test_callsCallback_afterQuietPeriod(self):
+        callback = MagicMock()
+
+        with Scheduler() as scheduler:
+            sut = Debouncer(scheduler, callback)
+            sut.touch(0.1, 10)
+            time.sleep(0.05)
+            sut.touch(0.1, 10)
+            time.sleep(0.05)
+            sut.touch(0.1, 10)
+            time.sleep(0.05)
+            callback.assert_not_called()
+            time.sleep(0.1)
+
+        callback.assert_called_once()
+
+    def test_callsCallback_afterMaxDelay_whenTouchesKeepComing(self):
+        callback = MagicMock()
+
+        with Scheduler() as scheduler:
+            sut = Debouncer(scheduler, callback)
+            start = time.time()
+            while callback.call_count == 0 and time.time() - start < 1:
+                sut.touch(0.1, 0.3)
+                time.sleep(0.05)
+            callbackTime = time.time() - start
+
+        callback.assert_called_once()
+        self.assertAlmostEqual(callbackTime, 0.3, places=1)
+
+    def test_doesNotCallCallback_whenCancelled(self):
+        callback = MagicMock()
+
+        with Scheduler() as scheduler:
+            sut = Debouncer(scheduler, callback)
+            sut.touch(0.1, 10)
+            sut.cancel()
+            time.sleep(0.2)
+
+        callback.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
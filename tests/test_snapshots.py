@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from resources.lib.library import MediaSource, MediaType
+from resources.lib.snapshots import SnapshotStore
+from resources.lib.tree_diff import DirectoryState, FileState, TreeDiffer
+
+
+class SnapshotStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.storePath = os.path.join(self.tempDir.name, "snapshots")
+        self.mediaSource = MediaSource("/media/movies", MediaType.video)
+        self.snapshot = {
+            "/media/movies": DirectoryState(
+                1, 100, {"movie.mkv": FileState(2, 1024, 200), "другой фильм.mkv": FileState(5, 0, -1)}, ("extras",)
+            ),
+            "/media/movies/extras": DirectoryState(3, 300, {"trailer.mkv": FileState(4, 2048, 400)}, ()),
+        }
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def getSnapshotFilePath(self):
+        return os.path.join(self.storePath, os.listdir(self.storePath)[0])
+
+    def test_loadsSavedSnapshot(self):
+        sut = SnapshotStore(self.storePath)
+
+        sut.save(self.mediaSource, self.snapshot)
+        result = sut.load(self.mediaSource)
+
+        self.assertEqual(dict(result), self.snapshot)
+
+    def test_looksUpFilesOfSavedSnapshot(self):
+        sut = SnapshotStore(self.storePath)
+
+        sut.save(self.mediaSource, self.snapshot)
+        result = sut.load(self.mediaSource)
+
+        self.assertEqual(result["/media/movies/extras"].files["trailer.mkv"], FileState(4, 2048, 400))
+        self.assertIsNone(result["/media/movies/extras"].files.get("movie.mkv"))
+        self.assertIsNone(result.get("/media/movies/missing"))
+
+    def test_leavesOutDirectories_whenTheyCanNotBeReachedFromMediaSourceDirectory(self):
+        sut = SnapshotStore(self.storePath)
+        self.snapshot["/media/other"] = DirectoryState(6, 600, {}, ())
+
+        sut.save(self.mediaSource, self.snapshot)
+        result = sut.load(self.mediaSource)
+
+        self.assertEqual(sorted(result), ["/media/movies", "/media/movies/extras"])
+
+    def test_loadsNone_whenSnapshotWasSavedForAnotherMediaSource(self):
+        sut = SnapshotStore(self.storePath)
+
+        sut.save(MediaSource("/media/movies", MediaType.music), self.snapshot)
+        result = sut.load(self.mediaSource)
+
+        self.assertIsNone(result)
+
+    def test_loadsNone_whenSnapshotFileIsTruncated(self):
+        sut = SnapshotStore(self.storePath)
+        sut.save(self.mediaSource, self.snapshot)
+        with open(self.getSnapshotFilePath(), "r+b") as file:
+            file.truncate(100)
+
+        result = sut.load(self.mediaSource)
+
+        self.assertIsNone(result)
+
+    def test_loadsNone_whenSnapshotFileHasUnknownFormat(self):
+        sut = SnapshotStore(self.storePath)
+        sut.save(self.mediaSource, self.snapshot)
+        with open(self.getSnapshotFilePath(), "r+b") as file:
+            file.write(b"LRSNAP00")
+
+        result = sut.load(self.mediaSource)
+
+        self.assertIsNone(result)
+
+    def test_loadsSnapshotSavedUnderTemporaryName_whenSnapshotFileCouldNotBeReplaced(self):
+        sut = SnapshotStore(self.storePath)
+        sut.save(self.mediaSource, self.snapshot)
+        filePath = self.getSnapshotFilePath()
+        os.replace(filePath, filePath + ".new")
+        sut.save(self.mediaSource, {"/media/movies": DirectoryState(1, 100, {}, ())})
+
+        result = sut.load(self.mediaSource)
+
+        self.assertEqual(dict(result), self.snapshot)
+        self.assertFalse(os.path.exists(filePath + ".new"))
+
+
+class MappedSnapshot_Diff_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(4)
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.mediaSource = MediaSource(os.path.join(self.tempDir.name, "video"), MediaType.video)
+        os.makedirs(os.path.join(self.mediaSource.path, "show", "season 1"))
+        with open(os.path.join(self.mediaSource.path, "show", "season 1", "episode 1.mkv"), "wb"):
+            pass
+        self.store = SnapshotStore(os.path.join(self.tempDir.name, "snapshots"))
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+        self.executor.shutdown()
+
+    def test_returnsNoChanges_whenTreeDidNotChangeSinceSnapshotWasSaved(self):
+        differ = TreeDiffer(self.mediaSource.path, self.executor)
+        self.store.save(self.mediaSource, differ.takeSnapshot())
+
+        _, diff = differ.diff(self.store.load(self.mediaSource))
+
+        self.assertEqual(diff, differ.diff(differ.takeSnapshot())[1])
+        self.assertEqual(diff.filesCreated + diff.filesDeleted + diff.dirsCreated + diff.dirsDeleted, [])
+
+    def test_returnsCreatedFile_whenFileCreatedSinceSnapshotWasSaved(self):
+        differ = TreeDiffer(self.mediaSource.path, self.executor)
+        self.store.save(self.mediaSource, differ.takeSnapshot())
+
+        filePath = os.path.join(self.mediaSource.path, "show", "season 1", "episode 2.mkv")
+        with open(filePath, "wb"):
+            pass
+        _, diff = differ.diff(self.store.load(self.mediaSource))
+
+        self.assertEqual(diff.filesCreated, [filePath])
+
+
+if __name__ == "__main__":
+    unittest.main()
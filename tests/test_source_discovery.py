@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import Mock
+from resources.lib.library import Library, MediaSource, MediaType
+from resources.lib.player import Player
+from resources.lib.source_discovery import SourceDiscovery
+
+
+class SourceDiscovery_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.videoSource = MediaSource("/videos", MediaType.video)
+        self.musicSource = MediaSource("/music", MediaType.music)
+        self.libraryMock = Mock(Library)
+        self.libraryMock.getMediaSources.return_value = [self.videoSource]
+        self.playerMock = Mock(Player)
+        self.playerMock.isPlaying.return_value = False
+        self.callbackMock = Mock()
+        self.sut = SourceDiscovery(self.libraryMock, self.playerMock, self.callbackMock)
+
+    def test_callsCallback_whenMediaSourceIsAdded(self):
+        self.sut.getMediaSources()
+        self.libraryMock.getMediaSources.return_value = [self.videoSource, self.musicSource]
+
+        self.sut.check()
+
+        self.callbackMock.assert_called_once_with([self.videoSource, self.musicSource])
+
+    def test_callsCallback_whenMediaSourceIsRemoved(self):
+        self.libraryMock.getMediaSources.return_value = [self.videoSource, self.musicSource]
+        self.sut.getMediaSources()
+        self.libraryMock.getMediaSources.return_value = [self.musicSource]
+
+        self.sut.check()
+
+        self.callbackMock.assert_called_once_with([self.musicSource])
+
+    def test_doesNotCallCallback_whenMediaSourcesAreTheSame(self):
+        self.libraryMock.getMediaSources.return_value = [self.videoSource, self.musicSource]
+        self.sut.getMediaSources()
+        self.libraryMock.getMediaSources.return_value = [self.musicSource, self.videoSource]
+
+        self.sut.check()
+
+        self.callbackMock.assert_not_called()
+
+    def test_callsCallbackOnce_whenMediaSourcesChangeOnce(self):
+        self.sut.getMediaSources()
+        self.libraryMock.getMediaSources.return_value = [self.musicSource]
+
+        self.sut.check()
+        self.sut.check()
+
+        self.callbackMock.assert_called_once_with([self.musicSource])
+
+    def test_doesNotFetchMediaSources_whilePlaybackIsActive(self):
+        self.sut.getMediaSources()
+        self.libraryMock.getMediaSources.reset_mock()
+        self.playerMock.isPlaying.return_value = True
+
+        self.sut.check()
+
+        self.libraryMock.getMediaSources.assert_not_called()
+        self.callbackMock.assert_not_called()
+
+    def test_callsCallback_whenForcedEvenIfMediaSourcesAreTheSame(self):
+        self.sut.getMediaSources()
+        self.playerMock.isPlaying.return_value = True
+
+        self.sut.check(force=True)
+
+        self.callbackMock.assert_called_once_with([self.videoSource])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import resources.lib.tasks as tasks
+from resources.lib.library import MediaSource, MediaType
+from resources.lib.task_costs import Outcome, TaskCostEstimator, TaskExecution
+
+
+class TaskCostEstimator_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.mediaSource = MediaSource("/media/tv", MediaType.video)
+        self.sut = TaskCostEstimator()
+
+    def test_estimatesWholeLibraryTasksAsMostExpensive_whenNothingHasBeenRecorded(self):
+        directoryCost = self.sut.estimate(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/a", "/media/tv/b"]))
+        libraryCost = self.sut.estimate(tasks.UpdateLibrary(self.mediaSource))
+
+        self.assertLess(directoryCost, libraryCost)
+
+    def test_estimatesCostPerDirectory_fromRecordedDurationsOfDirectoriesOfTheSameDepth(self):
+        task = tasks.UpdateLibrary(self.mediaSource, ["/media/tv/a", "/media/tv/b"])
+        self._recordExecution(task, Outcome.finished, [("/media/tv/a", 4)])
+
+        cost = self.sut.estimate(tasks.UpdateLibrary(self.mediaSource, ["/media/tv/c", "/media/tv/d", "/media/tv/e"]))
+
+        self.assertEqual(cost, 12)
+
+    def test_weighsRecentDurationsMore(self):
+        task = tasks.UpdateLibrary(self.mediaSource)
+        self._recordExecution(task, Outcome.finished, [(None, 100)])
+        self._recordExecution(task, Outcome.finished, [(None, 200)])
+
+        self.assertAlmostEqual(self.sut.estimate(task), 130)
+
+    def test_keepsDurationsPerTaskTypeAndMediaSource(self):
+        otherSource = MediaSource("/media/movies", MediaType.video)
+        self._recordExecution(tasks.UpdateLibrary(self.mediaSource), Outcome.finished, [(None, 100)])
+
+        self.assertEqual(self.sut.estimate(tasks.CleanLibrary(self.mediaSource)), TaskCostEstimator.LIBRARY_COST)
+        self.assertEqual(self.sut.estimate(tasks.UpdateLibrary(otherSource)), TaskCostEstimator.LIBRARY_COST)
+
+    def test_recordsOnlyFinishedCalls_whenTaskDidNotStartInTime(self):
+        task = tasks.UpdateLibrary(self.mediaSource, ["/media/tv/a", "/media/tv/b/c"])
+        self._recordExecution(task, Outcome.notStarted, [("/media/tv/a", 50)])
+
+        cost = self.sut.estimate(task)
+
+        self.assertEqual(cost, 50 + TaskCostEstimator.DIRECTORY_COSTS[2])
+
+    def test_plansCallPerDirectory_whenItIsCheapest(self):
+        paths = ["/media/tv/a/1", "/media/tv/b/2"]
+
+        result = self.sut.planScope(tasks.UpdateLibrary, self.mediaSource, paths)
+
+        self.assertEqual(result, paths)
+
+    def test_plansCallForCommonParentDirectory_whenItIsCheaperThanCallPerDirectory(self):
+        paths = ["/media/tv/a/%i" % i for i in range(10)]
+
+        result = self.sut.planScope(tasks.UpdateLibrary, self.mediaSource, paths)
+
+        self.assertEqual(result, ["/media/tv/a"])
+
+    def test_plansCallForWholeLibrary_whenItIsCheaperThanCallPerDirectory(self):
+        paths = ["/media/tv/%i" % i for i in range(10)]
+        task = tasks.CleanLibrary(self.mediaSource)
+        self._recordExecution(task, Outcome.finished, [(None, 30)])
+
+        result = self.sut.planScope(tasks.CleanLibrary, self.mediaSource, paths)
+
+        self.assertEqual(result, [])
+
+    def _recordExecution(self, task, outcome, callDurations):
+        duration = sum(d for _, d in callDurations)
+        self.sut.recordExecution(TaskExecution(task, outcome, duration, tuple(callDurations)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,7 @@ import resources.lib.tasks as tasks
 from unittest.mock import MagicMock, patch
 from resources.lib.task_handling import CleanLibraryTaskHandler, UpdateLibraryTaskHandler
 from resources.lib.library import MediaSource, MediaType
+from resources.lib.task_costs import Outcome, TaskCostEstimator
 
 
 class CleanLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
@@ -35,6 +36,28 @@ class CleanLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
         # Assert
         mock.assert_called_once_with("cleanlibrary(video)")
 
+    @patch.object(xbmc, "executeJSONRPC")
+    @patch.object(xbmc, "executebuiltin")
+    def test_executesCleanForDirectoryOnly_whenTaskHasPath(self, builtinMock: MagicMock, rpcMock: MagicMock):
+        # Arrange
+        monitor = Monitor()
+        mediaSource = MediaSource("/media/tv", MediaType.video)
+        task = tasks.CleanLibrary(mediaSource, ["/media/tv/Show"])
+        sut = CleanLibraryTaskHandler(task, monitor)
+        sutThread = Thread(target=lambda: sut.execute())
+
+        # Act
+        sutThread.start()
+        monitor.onCleanStarted("video")
+        monitor.onCleanFinished("video")
+        sutThread.join()
+
+        # Assert
+        builtinMock.assert_not_called()
+        rpcMock.assert_called_once_with(
+            '{"jsonrpc": "2.0", "method": "VideoLibrary.Clean", "params": {"directory": "/media/tv/Show/"}, "id": 1}'
+        )
+
     def test_waitsUntilLibraryCleanGetsStarted_afterExecutingKodiBuiltInFunction(self):
         # Arrange
         monitor = Monitor()
@@ -104,6 +127,24 @@ class CleanLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
         # Assert
         self.assertAlmostEqual(sutExecutionTime, 0.1, places=1)
 
+    @patch.object(xbmc, "executebuiltin")
+    def test_recordsExecutionThatDidNotStart_ifCleanDoesNotStartBeforeTheTimeOut(self, *args):
+        # Arrange
+        monitor = Monitor()
+        costEstimatorMock = MagicMock(TaskCostEstimator)
+        task = tasks.CleanLibrary(MediaSource("/media/movies", MediaType.video))
+        sut = CleanLibraryTaskHandler(task, monitor, costEstimatorMock)
+        sut.WAIT_TO_START_TIMEOUT = 0.1
+
+        # Act
+        result = sut.execute()
+
+        # Assert
+        self.assertFalse(result)
+        execution = costEstimatorMock.recordExecution.call_args.args[0]
+        self.assertEqual(execution.outcome, Outcome.notStarted)
+        self.assertEqual(execution.callDurations, ())
+
 
 class UpdateLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
     def setUp(self):
@@ -130,6 +171,28 @@ class UpdateLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
         # Assert
         mock.assert_called_once_with("updatelibrary(video)")
 
+    @patch.object(xbmc, "executeJSONRPC")
+    @patch.object(xbmc, "executebuiltin")
+    def test_executesScanForDirectoryOnly_whenTaskHasPath(self, builtinMock: MagicMock, rpcMock: MagicMock):
+        # Arrange
+        monitor = Monitor()
+        mediaSource = MediaSource("/media/tv", MediaType.video)
+        task = tasks.UpdateLibrary(mediaSource, ["/media/tv/Show"])
+        sut = UpdateLibraryTaskHandler(task, monitor)
+        sutThread = Thread(target=lambda: sut.execute())
+
+        # Act
+        sutThread.start()
+        monitor.onScanStarted("video")
+        monitor.onScanFinished("video")
+        sutThread.join()
+
+        # Assert
+        builtinMock.assert_not_called()
+        rpcMock.assert_called_once_with(
+            '{"jsonrpc": "2.0", "method": "VideoLibrary.Scan", "params": {"directory": "/media/tv/Show/"}, "id": 1}'
+        )
+
     def test_waitsUntilLibraryScanGetsStarted_afterExecutingKodiBuiltInFunction(self):
         # Arrange
         monitor = Monitor()
@@ -171,6 +234,29 @@ class UpdateLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
         # Assert
         self.assertAlmostEqual(sutExecutionTime, 0.3, places=1)
 
+    @patch.object(xbmc, "executebuiltin")
+    def test_waitsUntilLibraryScanGetsFinished_whenScanOfOtherLibraryFinishes(self, *args):
+        # Arrange
+        monitor = Monitor()
+        mediaSource = MediaSource("/media/movies", MediaType.video)
+        task = tasks.UpdateLibrary(mediaSource)
+        sut = UpdateLibraryTaskHandler(task, monitor)
+        sutThread = Thread(target=lambda: sut.execute())
+
+        # Act
+        start = time.time()
+        sutThread.start()
+        monitor.onScanStarted("video")
+        time.sleep(0.1)
+        monitor.onScanFinished("music")  # Should not release the video scan
+        time.sleep(0.1)
+        monitor.onScanFinished("video")
+        sutThread.join()
+        sutExecutionTime = time.time() - start
+
+        # Assert
+        self.assertAlmostEqual(sutExecutionTime, 0.2, places=1)
+
     def test_aborts_ifUpdateDoesNotStartBeforeTheTimeOut_afterExecutingKodiBuiltInFunction(self):
         # Arrange
         def sutThreadTarget(monitor):
@@ -198,3 +284,27 @@ class UpdateLibraryTaskHandler_Execute_TestCase(unittest.TestCase):
 
         # Assert
         self.assertAlmostEqual(sutExecutionTime, 0.1, places=1)
+
+    @patch.object(xbmc, "executeJSONRPC", return_value='{"jsonrpc": "2.0", "result": "OK", "id": 1}')
+    def test_recordsDurationOfEachDirectory_whenScanFinishes(self, *args):
+        # Arrange
+        monitor = Monitor()
+        costEstimatorMock = MagicMock(TaskCostEstimator)
+        task = tasks.UpdateLibrary(MediaSource("/media/tv", MediaType.video), ["/media/tv/A", "/media/tv/B"])
+        sut = UpdateLibraryTaskHandler(task, monitor, costEstimatorMock)
+        sutThread = Thread(target=lambda: sut.execute())
+
+        # Act
+        sutThread.start()
+        for _ in task.paths:
+            time.sleep(0.1)
+            monitor.onScanStarted("video")
+            monitor.onScanFinished("video")
+        sutThread.join()
+
+        # Assert
+        execution = costEstimatorMock.recordExecution.call_args.args[0]
+        self.assertEqual(execution.task, task)
+        self.assertEqual(execution.outcome, Outcome.finished)
+        self.assertEqual([p for p, _ in execution.callDurations], ["/media/tv/A", "/media/tv/B"])
+        self.assertEqual(execution.directoryCount, 2)
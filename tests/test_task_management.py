@@ -7,7 +7,8 @@ from resources.lib.player import Player
 import resources.lib.tasks as tasks
 import resources.lib.task_handling as task_handling
 import resources.lib.library as library
-from resources.lib.task_management import TaskManager
+from resources.lib.task_costs import Outcome, TaskCostEstimator, TaskExecution
+from resources.lib.task_management import TaskLane, TaskManager, TaskQueue
 from resources.lib.monitoring import Monitor
 
 
@@ -111,6 +112,22 @@ class TaskManager_AddTasks_TestCase(unittest.TestCase):
 
         self.assertEqual(updateMock.call_count, 3)
 
+    def test_queuesUpMultipleUpdateLibraryTasks_whenMultipleTasksAddedWithDifferentDirectories(
+        self, cleanMock: MagicMock, updateMock: MagicMock, *args
+    ):
+        mediaSource = library.MediaSource("~/Downloads/tv", library.MediaType.video)
+        updateMock.side_effect = lambda: time.sleep(0.2)
+
+        with TaskManager(Monitor()) as sut:
+            sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/tv/Show"]))  # Starts executing immediately
+            time.sleep(0.1)
+            sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/tv/Show"]))  # Gets queued up
+            sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/tv/Other Show"]))  # Gets queued up as well
+            sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/tv/Show"]))  # Does not get queued up
+            time.sleep(0.6)
+
+        self.assertEqual(updateMock.call_count, 3)
+
     def test_queuesUpMultipleTasks_whenMultipleDifferentTasksAddedWithTheSameMediaSource(
         self, cleanMock: MagicMock, updateMock: MagicMock, *args
     ):
@@ -129,6 +146,143 @@ class TaskManager_AddTasks_TestCase(unittest.TestCase):
         self.assertEqual(cleanMock.call_count, 2)
         self.assertEqual(updateMock.call_count, 1)
 
+    def test_executesTaskOfOtherMediaType_whileTaskIsBeingExecuted(
+        self, cleanMock: MagicMock, updateMock: MagicMock, *args
+    ):
+        videoSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        musicSource = library.MediaSource("~/Downloads/music", library.MediaType.music)
+        cleanMock.side_effect = lambda: time.sleep(0.5)
+
+        with TaskManager(Monitor()) as sut:
+            sut.add(tasks.CleanLibrary(musicSource))  # Starts executing immediately and takes long
+            time.sleep(0.1)
+            sut.add(tasks.UpdateLibrary(videoSource))  # Starts executing as well, in the video lane
+            time.sleep(0.1)
+
+            updateMock.assert_called_once()
+            self.assertFalse(sut.isIdle())
+
+
+class TaskQueue_TestCase(unittest.TestCase):
+    def test_popsScansBeforeCleans(self):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        sut = TaskQueue()
+
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1"]))
+        sut.append(tasks.CleanLibrary(mediaSource, ["~/Downloads/movies/1"]))
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/2"]))
+
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1"]))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/2"]))
+        self.assertEqual(sut.pop(), tasks.CleanLibrary(mediaSource, ["~/Downloads/movies/1"]))
+        self.assertEqual(sut.size(), 0)
+
+    def test_popsTasksOfFewerDirectoriesFirst(self):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        sut = TaskQueue()
+
+        sut.append(tasks.UpdateLibrary(mediaSource))
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1", "~/Downloads/movies/2"]))
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/3"]))
+
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/3"]))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1", "~/Downloads/movies/2"]))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource))
+
+    def test_popsTasksInTheOrderTheyWereAppended_whenTheyHaveTheSamePriorityAndCost(self):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        sut = TaskQueue()
+
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/2"]))
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1"]))
+
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/2"]))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1"]))
+
+    def test_popsTaskOfMediaSourceWithLowerMeasuredCostFirst(self):
+        movies = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        tv = library.MediaSource("~/Downloads/tv", library.MediaType.video)
+        costEstimator = TaskCostEstimator()
+        moviesTask = tasks.UpdateLibrary(movies, ["~/Downloads/movies/0"])
+        tvTask = tasks.UpdateLibrary(tv, ["~/Downloads/tv/0"])
+        costEstimator.recordExecution(TaskExecution(moviesTask, Outcome.finished, 30, (("~/Downloads/movies/0", 30),)))
+        costEstimator.recordExecution(TaskExecution(tvTask, Outcome.finished, 5, (("~/Downloads/tv/0", 5),)))
+        sut = TaskQueue(costEstimator)
+
+        sut.append(tasks.UpdateLibrary(movies, ["~/Downloads/movies/1"]))
+        sut.append(tasks.UpdateLibrary(tv, ["~/Downloads/tv/1"]))
+
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(tv, ["~/Downloads/tv/1"]))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(movies, ["~/Downloads/movies/1"]))
+
+    @patch.object(TaskQueue, "MAX_WAIT", new_callable=PropertyMock, return_value=0)
+    def test_popsTasksInTheOrderTheyWereAppended_whenTheyHaveBeenWaitingForTooLong(self, *args):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        sut = TaskQueue()
+
+        sut.append(tasks.CleanLibrary(mediaSource))
+        sut.append(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1"]))
+
+        self.assertEqual(sut.pop(), tasks.CleanLibrary(mediaSource))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/1"]))
+
+    def test_removesTasksOfMediaSources_whenRemovedForThem(self):
+        movies = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        music = library.MediaSource("~/Downloads/music", library.MediaType.music)
+        sut = TaskQueue()
+
+        sut.append(tasks.UpdateLibrary(movies))
+        sut.append(tasks.UpdateLibrary(music))
+        sut.append(tasks.CleanLibrary(music))
+        sut.removeFor({music})
+
+        self.assertEqual(sut.size(), 1)
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(movies))
+
+    def test_keepsPositionOfQueuedUpTask_whenTheSameTaskAppendedAgain(self):
+        movies = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        music = library.MediaSource("~/Downloads/music", library.MediaType.music)
+        sut = TaskQueue()
+
+        sut.append(tasks.UpdateLibrary(movies))
+        sut.append(tasks.UpdateLibrary(music))
+        sut.append(tasks.UpdateLibrary(movies))
+
+        self.assertEqual(sut.size(), 2)
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(movies))
+        self.assertEqual(sut.pop(), tasks.UpdateLibrary(music))
+
+    def test_skipsTask_whenTaskWithTheSameMediaTypeAndDirectoriesIsQueuedUp(self):
+        sut = TaskQueue()
+
+        sut.append(
+            tasks.UpdateLibrary(library.MediaSource("~/Downloads/movies", library.MediaType.video), ["/a", "/b"])
+        )
+        sut.append(tasks.UpdateLibrary(library.MediaSource("~/Downloads/tv", library.MediaType.video), ["/b", "/a"]))
+
+        self.assertEqual(sut.size(), 1)
+
+
+class Task_TestCase(unittest.TestCase):
+    def test_hasTheSameHash_whenTasksAreEqual(self):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+
+        self.assertEqual(
+            hash(tasks.CleanLibrary(mediaSource, ["/a", "/b"])), hash(tasks.CleanLibrary(mediaSource, ["/b", "/a"]))
+        )
+
+    def test_isNotEqual_whenTasksHaveDifferentType(self):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+
+        self.assertNotEqual(tasks.UpdateLibrary(mediaSource), tasks.CleanLibrary(mediaSource))
+
+    def test_raisesAttributeError_whenAttributeIsSet(self):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        sut = tasks.UpdateLibrary(mediaSource)
+
+        with self.assertRaises(AttributeError):
+            sut.paths = ("/a",)
+
 
 @patch.object(xbmc.Player, "isPlaying", return_value=False)
 @patch.object(task_handling.UpdateLibraryTaskHandler, "execute")
@@ -280,6 +434,52 @@ class TaskManager_DebounceTasks_TestCase(unittest.TestCase):
         updateMock.assert_called_once()
 
 
+    def test_executesTasks_afterMaxDebounceWaitTime_whenTasksKeepGettingAddedFast(
+        self, cleanMock: MagicMock, updateMock: MagicMock, *args
+    ):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        self.debounceMock.return_value = 0.2
+
+        with patch.object(TaskManager, "MAX_DEBOUNCE_WAIT", new_callable=PropertyMock, return_value=0.3):
+            with TaskManager(Monitor()) as sut:
+                # Keep adding tasks faster than debounce wait time
+                for i in range(5):
+                    sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/%i" % i]))
+                    time.sleep(0.1)
+
+                # Should be executed after max debounce wait time, despite new tasks
+                # being added all the time.
+                self.assertGreater(updateMock.call_count, 0)
+
+    def test_usesDebounceWaitTimesFromSettings_whenSettingsProvided(self, cleanMock: MagicMock, *args):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        settingsMock = MagicMock()
+        settingsMock.getDebounceWait.return_value = 0.2
+        settingsMock.getMaxDebounceWait.return_value = 10
+        settingsMock.getMaxScansPerHour.return_value = 0
+        settingsMock.getMaxCleansPerHour.return_value = 0
+        self.debounceMock.return_value = 0
+
+        with TaskManager(Monitor(), settingsMock) as sut:
+            sut.add(tasks.CleanLibrary(mediaSource))
+            time.sleep(0.1)  # Wait less than debounce wait time from the settings
+            cleanMock.assert_not_called()
+            time.sleep(0.2)  # Wait more than debounce wait time from the settings
+
+        cleanMock.assert_called_once()
+
+    def test_doesNotCreateThreads_whenMultipleTasksGetAddedFast(self, *args):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        self.debounceMock.return_value = 10
+
+        with TaskManager(Monitor()) as sut:
+            threadCount = threading.active_count()
+            for i in range(100):
+                sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/%i" % i]))
+
+            self.assertEqual(threading.active_count(), threadCount)
+
+
 @patch.object(TaskManager, "DEBOUNCE_WAIT", new_callable=PropertyMock, return_value=0)
 @patch.object(xbmc.Player, "isPlaying", return_value=True)
 @patch.object(task_handling.CleanLibraryTaskHandler, "execute")
@@ -334,6 +534,124 @@ class TaskManager_TasksDuringPlayback_TestCase(unittest.TestCase):
         executeMock.assert_called_once()
 
 
+@patch.object(TaskManager, "DEBOUNCE_WAIT", new_callable=PropertyMock, return_value=0)
+@patch.object(xbmc.Player, "isPlayingVideo", return_value=False)
+@patch.object(xbmc.Player, "isPlaying", return_value=True)
+@patch.object(task_handling.UpdateLibraryTaskHandler, "execute")
+@patch.object(task_handling.CleanLibraryTaskHandler, "execute")
+class TaskManager_PlaybackPolicy_TestCase(unittest.TestCase):
+    def test_executesScanButNotClean_duringAudioPlayback(self, cleanMock: MagicMock, updateMock: MagicMock, *args):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+
+        with TaskManager(Monitor()) as sut:
+            sut.add(tasks.UpdateLibrary(mediaSource))
+            sut.add(tasks.CleanLibrary(mediaSource))
+            time.sleep(0.1)
+
+        updateMock.assert_called_once()
+        cleanMock.assert_not_called()
+
+    def test_executesOnlyScopedScan_afterPlaybackOfVideoGetsPaused(
+        self, cleanMock: MagicMock, updateMock: MagicMock, _, isPlayingVideoMock: MagicMock, *args
+    ):
+        mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        isPlayingVideoMock.return_value = True
+        player = Player()
+
+        # Inject own instance of Player, so we can call playback related methods
+        # from outside of TaskManager, somewhat simulating what xbmc.Player does.
+        with patch.object(xbmc.Player, "__new__", return_value=player):
+            with TaskManager(Monitor()) as sut:
+                sut.add(tasks.UpdateLibrary(mediaSource, ["~/Downloads/movies/Movie"]))
+                time.sleep(0.1)
+                updateMock.assert_not_called()
+
+                player.onPlayBackPaused()
+                time.sleep(0.1)
+                updateMock.assert_called_once()
+
+                sut.add(tasks.UpdateLibrary(mediaSource))
+                time.sleep(0.1)
+
+        updateMock.assert_called_once()
+
+
+@patch.object(TaskLane, "BUDGET_PERIOD", 0.4)
+@patch.object(xbmc.Player, "isPlaying", return_value=False)
+@patch.object(task_handling.TaskHandlerFactory, "getHandler")
+class TaskManager_Budget_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
+        self.settingsMock = MagicMock()
+        self.settingsMock.getDebounceWait.return_value = 0
+        self.settingsMock.getMaxDebounceWait.return_value = 10
+        # One scan per 0.4 seconds, as the budget period is patched
+        self.settingsMock.getMaxScansPerHour.return_value = 1
+        self.settingsMock.getMaxCleansPerHour.return_value = 0
+
+    def test_holdsBackScan_whenBudgetIsUsedUp(self, getHandlerMock: MagicMock, *args):
+        with TaskManager(Monitor(), self.settingsMock) as sut:
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/1"]))
+            time.sleep(0.1)
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/2"]))
+            time.sleep(0.1)
+            self.assertEqual(getHandlerMock.call_count, 1)
+            time.sleep(0.4)  # Wait for the budget to refill
+
+        self.assertEqual(getHandlerMock.call_count, 2)
+
+    def test_mergesTasksHeldBackByBudget_intoNextAllowedRun(self, getHandlerMock: MagicMock, *args):
+        with TaskManager(Monitor(), self.settingsMock) as sut:
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/1"]))
+            time.sleep(0.1)
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/2"]))
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/3"]))
+            time.sleep(0.5)  # Wait for the budget to refill
+
+        self.assertEqual(
+            [c.args[0] for c in getHandlerMock.call_args_list],
+            [
+                tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/1"]),
+                tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/2", "~/Downloads/movies/3"]),
+            ],
+        )
+
+    def test_doesNotHoldBackClean_whenOnlyScanBudgetIsUsedUp(self, getHandlerMock: MagicMock, *args):
+        with TaskManager(Monitor(), self.settingsMock) as sut:
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/1"]))
+            time.sleep(0.1)
+            sut.add(tasks.CleanLibrary(self.mediaSource, ["~/Downloads/movies/2"]))
+            time.sleep(0.1)
+
+            self.assertEqual(getHandlerMock.call_count, 2)
+
+    def test_appliesChangedBudget_whenSettingsChange(self, getHandlerMock: MagicMock, *args):
+        with TaskManager(Monitor(), self.settingsMock) as sut:
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/1"]))
+            time.sleep(0.1)
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/2"]))
+            time.sleep(0.1)
+            self.assertEqual(getHandlerMock.call_count, 1)
+
+            self.settingsMock.getMaxScansPerHour.return_value = 0
+            sut.onSettingsChanged()
+            time.sleep(0.1)
+
+            self.assertEqual(getHandlerMock.call_count, 2)
+
+    def test_exposesTimeSpentWaitingForBudget(self, *args):
+        with TaskManager(Monitor(), self.settingsMock) as sut:
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/1"]))
+            time.sleep(0.1)
+            sut.add(tasks.UpdateLibrary(self.mediaSource, ["~/Downloads/movies/2"]))
+            time.sleep(0.5)  # Wait for the budget to refill
+
+            throttledTimes = sut.getThrottledTimes()
+
+        self.assertAlmostEqual(throttledTimes[library.MediaType.video], 0.3, delta=0.1)
+        self.assertEqual(throttledTimes[library.MediaType.music], 0)
+
+
 @patch.object(TaskManager, "DEBOUNCE_WAIT", new_callable=PropertyMock, return_value=0)
 @patch.object(xbmc.Player, "isPlaying", return_value=False)
 @patch.object(task_handling.UpdateLibraryTaskHandler, "execute")
@@ -377,20 +695,21 @@ class TaskManager_Dispose_TestCase(unittest.TestCase):
 
         cleanMock.assert_not_called()
 
-    def test_stopsWaitingForNewTasks_whenExceptionOccursDuringTaskExecution(
+    def test_keepsExecutingTasks_whenExceptionOccursDuringTaskExecution(
         self, cleanMock: MagicMock, updateMock: MagicMock, *args
     ):
         mediaSource = library.MediaSource("~/Downloads/movies", library.MediaType.video)
         updateMock.side_effect = Exception()
-        cleanMock.side_effect = lambda: time.sleep(0.2)
 
-        with TaskManager(Monitor()) as sut:
+        with patch("resources.lib.logging.notifyError"), TaskManager(Monitor()) as sut:
             sut.add(tasks.UpdateLibrary(mediaSource))  # Should fail
             time.sleep(0.1)
-            sut.add(tasks.CleanLibrary(mediaSource))  # Should not get queued up
-            time.sleep(0.3)
+            sut.add(tasks.CleanLibrary(mediaSource))  # Should still get executed
+            time.sleep(0.1)
 
-        cleanMock.assert_not_called()
+            self.assertTrue(sut.isIdle())
+
+        cleanMock.assert_called_once()
 
     def test_endsItsOwnThread_afterExitingTheWithContext(self, *args):
         """
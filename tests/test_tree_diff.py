@@ -0,0 +1,266 @@
+import errno
+import os
+import queue
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from resources.lib.tree_diff import TreeDiffEmitter, TreeDiffer
+from watchdog.events import DirDeletedEvent
+from watchdog.observers.api import ObservedWatch
+
+
+class TreeDifferTestCaseBase:
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(4)
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.tempDirPath = self.tempDir.name
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+        self.executor.shutdown()
+
+    def getFullPath(self, path: str):
+        return os.path.join(self.tempDirPath, os.path.normpath(path))
+
+    def createFile(self, filePath: str):
+        os.makedirs(os.path.dirname(self.getFullPath(filePath)), exist_ok=True)
+        with open(self.getFullPath(filePath), "wb"):
+            pass
+
+    def createDir(self, dirPath: str):
+        os.makedirs(self.getFullPath(dirPath), exist_ok=True)
+
+    def makeDirsOld(self):
+        """
+        Sets mtime of all directories to an hour ago, so they don't get listed
+        again only because they've been changed very recently.
+        """
+
+        oldTime = time.time() - 3600
+        for dirPath, _, _ in os.walk(self.tempDirPath):
+            os.utime(dirPath, (oldTime, oldTime))
+
+
+class TreeDiffer_Diff_TestCase(TreeDifferTestCaseBase, unittest.TestCase):
+    def test_returnsCreatedFile_whenFileCreated(self):
+        self.createDir("video")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        self.createFile("video/movie.mkv")
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.filesCreated, [self.getFullPath("video/movie.mkv")])
+        self.assertEqual(diff.filesDeleted, [])
+
+    def test_returnsDeletedFile_whenFileDeleted(self):
+        self.createFile("video/movie.mkv")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        os.remove(self.getFullPath("video/movie.mkv"))
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.filesDeleted, [self.getFullPath("video/movie.mkv")])
+        self.assertEqual(diff.filesCreated, [])
+
+    def test_returnsMovedFile_whenFileMovedToAnotherDirectory(self):
+        self.createFile("downloads/movie.mkv")
+        self.createDir("video")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        os.rename(self.getFullPath("downloads/movie.mkv"), self.getFullPath("video/movie.mkv"))
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(
+            diff.filesMoved, [(self.getFullPath("downloads/movie.mkv"), self.getFullPath("video/movie.mkv"))]
+        )
+        self.assertEqual(diff.filesCreated, [])
+        self.assertEqual(diff.filesDeleted, [])
+
+    def test_returnsCreatedDirectoryAndFiles_whenDirectoryWithFilesCreated(self):
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        self.createFile("video/season 1/episode 1.mkv")
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.dirsCreated, [self.getFullPath("video"), self.getFullPath("video/season 1")])
+        self.assertEqual(diff.filesCreated, [self.getFullPath("video/season 1/episode 1.mkv")])
+
+    def test_returnsDeletedDirectoryAndFiles_whenDirectoryWithFilesDeleted(self):
+        self.createFile("video/season 1/episode 1.mkv")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        os.remove(self.getFullPath("video/season 1/episode 1.mkv"))
+        os.rmdir(self.getFullPath("video/season 1"))
+        os.rmdir(self.getFullPath("video"))
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.dirsDeleted, [self.getFullPath("video"), self.getFullPath("video/season 1")])
+        self.assertEqual(diff.filesDeleted, [self.getFullPath("video/season 1/episode 1.mkv")])
+
+    def test_returnsMovedDirectoryAndFiles_whenDirectoryWithFilesMoved(self):
+        self.createFile("downloads/show/episode 1.mkv")
+        self.createDir("video")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        os.rename(self.getFullPath("downloads/show"), self.getFullPath("video/show"))
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.dirsMoved, [(self.getFullPath("downloads/show"), self.getFullPath("video/show"))])
+        self.assertEqual(
+            diff.filesMoved,
+            [(self.getFullPath("downloads/show/episode 1.mkv"), self.getFullPath("video/show/episode 1.mkv"))],
+        )
+        self.assertEqual(diff.dirsCreated, [])
+        self.assertEqual(diff.dirsDeleted, [])
+
+    def test_skipsHiddenFilesAndDirectories(self):
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        self.createFile(".snapshot/movie.mkv")
+        self.createFile("video/.movie.mkv")
+        _, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.dirsCreated, [self.getFullPath("video")])
+        self.assertEqual(diff.filesCreated, [])
+
+    def test_raisesOSError_whenRootDirectoryDoesNotExist(self):
+        sut = TreeDiffer(self.getFullPath("missing-dir"), self.executor)
+
+        with self.assertRaises(OSError):
+            sut.takeSnapshot()
+
+
+class TreeDiffer_Errors_TestCase(TreeDifferTestCaseBase, unittest.TestCase):
+    def failFor(self, function, failingPath: str):
+        """
+        Returns a replacement of the function that fails with an I/O error for
+        the path, the way a network mount does when it's briefly unreachable.
+        """
+
+        def wrapper(path, *args, **kwargs):
+            if path == self.getFullPath(failingPath):
+                raise OSError(errno.EIO, "Input/output error", path)
+            return function(path, *args, **kwargs)
+
+        return wrapper
+
+    def test_keepsDirectoryAndItsContent_whenDirectoryCanNotBeStated(self):
+        self.createFile("video/show/season 1/episode 1.mkv")
+        self.makeDirsOld()
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        with patch("resources.lib.tree_diff.os.stat", self.failFor(os.stat, "video/show")):
+            newSnapshot, diff = sut.diff(snapshot)
+
+        self.assertEqual(diff.dirsDeleted, [])
+        self.assertEqual(diff.filesDeleted, [])
+        self.assertEqual(newSnapshot, snapshot)
+
+    def test_keepsFiles_whenDirectoryCanNotBeListed(self):
+        self.createFile("video/show/episode 1.mkv")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        self.createFile("video/show/episode 2.mkv")
+        with patch("resources.lib.tree_diff.os.scandir", self.failFor(os.scandir, "video/show")):
+            snapshot, diff = sut.diff(snapshot)
+        self.assertEqual(diff.filesDeleted, [])
+        self.assertEqual(diff.filesCreated, [])
+
+        # Gets listed again, once it's accessible
+        _, diff = sut.diff(snapshot)
+        self.assertEqual(diff.filesCreated, [self.getFullPath("video/show/episode 2.mkv")])
+
+    def test_keepsFile_whenFileCanNotBeStated(self):
+        self.createFile("video/show/episode 1.mkv")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        self.createFile("video/show/episode 2.mkv")
+        with patch("resources.lib.tree_diff.os.stat", self.failFor(os.stat, "video/show/episode 1.mkv")):
+            snapshot, diff = sut.diff(snapshot)
+        self.assertEqual(diff.filesDeleted, [])
+        self.assertEqual(diff.filesCreated, [self.getFullPath("video/show/episode 2.mkv")])
+
+        self.makeDirsOld()
+        _, diff = sut.diff(snapshot)
+        self.assertEqual(diff.filesDeleted, [])
+        self.assertEqual(diff.filesCreated, [])
+
+
+class TreeDiffEmitter_TestCase(TreeDifferTestCaseBase, unittest.TestCase):
+    def createEmitter(self) -> TreeDiffEmitter:
+        self.eventQueue = queue.Queue()
+        return TreeDiffEmitter(self.eventQueue, ObservedWatch(self.tempDirPath, recursive=True), 0, self.executor, {})
+
+    def test_keepsPolling_whenRootDirectoryCanNotBeAccessed(self):
+        sut = self.createEmitter()
+
+        with patch.object(sut.differ, "diff", side_effect=OSError(errno.EIO, "Input/output error")):
+            sut.queue_events(0)
+
+        self.assertTrue(self.eventQueue.empty())
+        self.assertFalse(sut.stopped_event.is_set())
+
+    def test_reportsRootDirectoryDeleted_whenItDoesNotExist(self):
+        sut = self.createEmitter()
+
+        with patch.object(sut.differ, "diff", side_effect=FileNotFoundError(errno.ENOENT, "No such file")):
+            sut.queue_events(0)
+
+        event, _ = self.eventQueue.get_nowait()
+        self.assertEqual(event, DirDeletedEvent(self.tempDirPath))
+        self.assertTrue(sut.stopped_event.is_set())
+
+
+class TreeDiffer_Pruning_TestCase(TreeDifferTestCaseBase, unittest.TestCase):
+    def test_doesNotListDirectories_whenNothingChanged(self):
+        self.createFile("video/show 1/episode 1.mkv")
+        self.createFile("video/show 2/episode 1.mkv")
+        self.makeDirsOld()
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        with patch("resources.lib.tree_diff.os.scandir", wraps=os.scandir) as scandirMock:
+            _, diff = sut.diff(snapshot)
+
+        scandirMock.assert_not_called()
+        self.assertEqual(diff.filesCreated, [])
+
+    def test_listsOnlyChangedDirectory_whenFileCreatedInNestedDirectory(self):
+        self.createFile("video/show 1/episode 1.mkv")
+        self.createFile("video/show 2/episode 1.mkv")
+        self.makeDirsOld()
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        self.createFile("video/show 2/episode 2.mkv")
+        with patch("resources.lib.tree_diff.os.scandir", wraps=os.scandir) as scandirMock:
+            _, diff = sut.diff(snapshot)
+
+        scandirMock.assert_called_once_with(self.getFullPath("video/show 2"))
+        self.assertEqual(diff.filesCreated, [self.getFullPath("video/show 2/episode 2.mkv")])
+
+    def test_listsDirectoryAgain_whenItHasBeenChangedRecently(self):
+        self.createFile("video/episode 1.mkv")
+        sut = TreeDiffer(self.tempDirPath, self.executor)
+        snapshot = sut.takeSnapshot()
+
+        with patch("resources.lib.tree_diff.os.scandir", wraps=os.scandir) as scandirMock:
+            sut.diff(snapshot)
+
+        scandirMock.assert_any_call(self.getFullPath("video"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,18 @@
+import os
 import sys
+import tempfile
 from parameterized import parameterized
 import unittest
-from resources.lib.util.file_system import isHidden
+from resources.lib.util.file_system import (
+    Mount,
+    countDirectories,
+    getFileSystemType,
+    getInotifyWatchLimit,
+    getMounts,
+    getPathHash,
+    isHidden,
+    isRemoteFileSystemType,
+)
 
 
 class IsHiddenTestCase(unittest.TestCase):
@@ -32,5 +43,146 @@ class IsHiddenTestCase(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class GetMountsTestCase(unittest.TestCase):
+    MOUNT_INFO = (
+        "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n"
+        "40 22 0:40 / /media/nas rw,relatime shared:20 master:3 - nfs4 nas:/export rw,vers=4.2\n"
+        "41 22 0:41 / /media/my\\040share rw,relatime - cifs //nas/share rw\n"
+        "42 22 0:42 / /media rw,relatime - tmpfs tmpfs rw\n"
+    )
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.mountInfoPath = os.path.join(self.tempDir.name, "mountinfo")
+        with open(self.mountInfoPath, "w") as file:
+            file.write(self.MOUNT_INFO)
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def test_returnsMountsWithTheLongestMountPointFirst(self):
+        result = getMounts(self.mountInfoPath)
+
+        self.assertEqual(
+            result,
+            [
+                Mount("/media/my share", "cifs"),
+                Mount("/media/nas", "nfs4"),
+                Mount("/media", "tmpfs"),
+                Mount("/", "ext4"),
+            ],
+        )
+
+    def test_returnsEmptyList_whenMountInfoFileDoesNotExist(self):
+        result = getMounts(os.path.join(self.tempDir.name, "missing"))
+
+        self.assertEqual(result, [])
+
+
+class GetInotifyWatchLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.limitPath = os.path.join(self.tempDir.name, "max_user_watches")
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def test_returnsLimit_whenLimitFileExists(self):
+        with open(self.limitPath, "w") as file:
+            file.write("524288\n")
+
+        self.assertEqual(getInotifyWatchLimit(self.limitPath), 524288)
+
+    def test_returnsNone_whenLimitFileDoesNotExist(self):
+        self.assertIsNone(getInotifyWatchLimit(self.limitPath))
+
+
+class CountDirectoriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def test_countsDirectoryAndAllOfItsSubdirectories(self):
+        os.makedirs(os.path.join(self.tempDir.name, "Show", "Season 1"))
+        os.makedirs(os.path.join(self.tempDir.name, "Show", ".actors"))
+        with open(os.path.join(self.tempDir.name, "Show", "tvshow.nfo"), "wb"):
+            pass
+
+        self.assertEqual(countDirectories(self.tempDir.name), 4)
+
+    @unittest.skipUnless(sys.platform in ["linux", "darwin"], "Unix-like OS specific tests.")
+    def test_doesNotFollowSymbolicLinks(self):
+        os.makedirs(os.path.join(self.tempDir.name, "Show", "Season 1"))
+        os.symlink(self.tempDir.name, os.path.join(self.tempDir.name, "Show", "Season 1", "loop"))
+
+        self.assertEqual(countDirectories(self.tempDir.name), 4)
+
+    def test_raisesError_whenDirectoryDoesNotExist(self):
+        with self.assertRaises(FileNotFoundError):
+            countDirectories(os.path.join(self.tempDir.name, "missing"))
+
+
+class GetFileSystemTypeTestCase(unittest.TestCase):
+    MOUNTS = [
+        Mount("/media/nas", "nfs4"),
+        Mount("/media", "tmpfs"),
+        Mount("/", "ext4"),
+    ]
+
+    @parameterized.expand(
+        [
+            ("/media/nas", "nfs4"),
+            ("/media/nas/movies", "nfs4"),
+            ("/media/nas2/movies", "tmpfs"),
+            ("/home/kodi/movies", "ext4"),
+        ]
+    )
+    @unittest.skipUnless(sys.platform == "linux", "Linux specific tests.")
+    def test_returnsFileSystemTypeOfTheMountWithTheLongestMatchingMountPoint(self, path, expected):
+        result = getFileSystemType(path, self.MOUNTS)
+
+        self.assertEqual(result, expected)
+
+    def test_returnsNone_whenThereAreNoMounts(self):
+        result = getFileSystemType("/media/nas/movies", [])
+
+        self.assertIsNone(result)
+
+
+class IsRemoteFileSystemTypeTestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("nfs4", True),
+            ("cifs", True),
+            ("fuse.sshfs", True),
+            ("fuse", True),
+            ("ext4", False),
+            ("fuseblk", False),
+            (None, False),
+        ]
+    )
+    def test_returnsExpected(self, fileSystemType, expected: bool):
+        result = isRemoteFileSystemType(fileSystemType)
+
+        self.assertEqual(result, expected)
+
+
+class GetPathHashTestCase(unittest.TestCase):
+    def test_returnsTheSameHash_forTheSamePath(self):
+        self.assertEqual(getPathHash("/media/tv/Show/Season 1"), getPathHash("/media/tv/Show/Season 1"))
+
+    def test_returnsDifferentHashes_forDifferentPaths(self):
+        self.assertNotEqual(getPathHash("/media/tv/Show/Season 1"), getPathHash("/media/tv/Show/Season 2"))
+
+    def test_returns64BitHash_whenPathHasUndecodableCharacters(self):
+        path = b"/media/tv/\xff.mkv".decode("utf-8", "surrogateescape")
+
+        result = getPathHash(path)
+
+        self.assertLess(result, 2**64)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,42 @@
+import sys
+import unittest
+from resources.lib.util.path_trie import PathTrie
+
+
+@unittest.skipUnless(sys.platform in ["linux", "darwin"], "Unix-like OS specific tests.")
+class PathTrieTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sut = PathTrie()
+        self.sut.add("/media/tv", "tv")
+        self.sut.add("/media/tv/Anime", "anime")
+        self.sut.add("/media/tv/Anime/", "anime-music")
+        self.sut.add("/media/movies", "movies")
+
+    def test_returnsMatchesStartingWithTopMost_forPathInNestedDirectories(self):
+        result = self.sut.getMatches("/media/tv/Anime/Show/episode.mkv")
+
+        self.assertEqual(result, ["tv", "anime", "anime-music"])
+
+    def test_returnsMatches_forPathEqualToDirectory(self):
+        result = self.sut.getMatches("/media/movies")
+
+        self.assertEqual(result, ["movies"])
+
+    def test_returnsNoMatches_forPathSharingOnlyPrefixOfDirectoryName(self):
+        self.assertEqual(self.sut.getMatches("/media/tv2/episode.mkv"), [])
+        self.assertEqual(self.sut.getMatches("/media"), [])
+
+    def test_returnsTopMostDirectories_asRoots(self):
+        result = self.sut.getRoots()
+
+        self.assertEqual(result, ["/media/movies", "/media/tv"])
+
+    def test_returnsRootDirectory_asRoot(self):
+        self.sut.add("/", "root")
+
+        self.assertEqual(self.sut.getRoots(), ["/"])
+        self.assertEqual(self.sut.getMatches("/media/movies/movie.mkv"), ["root", "movies"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import os
 import tempfile
 import xbmc
+from resources.lib.library import MediaType
 from resources.lib.task_management import TaskManager
 from unittest.mock import Mock, patch
 
@@ -86,6 +87,25 @@ class WatcherTestCaseBase:
         if fullDirPath != fullNewDirPath:
             os.rename(fullDirPath, fullNewDirPath)
 
+    def getFullFileDirPath(self, filePath: str):
+        """
+        Returns full path of the directory for the filepath parameter. For
+        example, for "video/movie.mkv" filepath it's "<temp dir>/video".
+        """
+
+        dirPath = os.path.dirname(os.path.normpath(filePath))
+        return os.path.join(self.tempDirPath, dirPath) if len(dirPath) > 0 else self.tempDirPath
+
+    def getCleanPaths(self, mediaType: MediaType, filePath: str):
+        """
+        Returns directories, which library clean is expected to be limited to,
+        when the file from filepath parameter gets deleted or moved. Music library
+        clean can't be limited to a directory, so no directories are returned for
+        music.
+        """
+
+        return [self.getFullFileDirPath(filePath)] if mediaType == MediaType.video else []
+
     def _getSupportedMediaStub(self, mediaType: str):
         if mediaType == "video":
             return ".mkv|.mp4|"
@@ -1,6 +1,9 @@
+import os
 import unittest
+from unittest.mock import Mock
 import resources.lib.tasks as tasks
 from resources.lib.library import MediaSource, MediaType
+from resources.lib.library_index import LibraryIndex
 from resources.lib.watcher import EventHandler, Watcher
 from parameterized import parameterized
 from tests.support import Waiter
@@ -11,12 +14,14 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     @parameterized.expand(
         [
             (MediaType.video, "movie.mkv"),
+            (MediaType.video, "MOVIE.MKV"),
             (MediaType.music, "song.mp3"),
+            (MediaType.music, "SONG.MP3"),
         ]
     )
     def test_addsUpdateTask_whenFileIsCreated(self, mediaType, filePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.UpdateLibrary(mediaSource)
+        expected = tasks.UpdateLibrary(mediaSource, [self.getFullFileDirPath(filePath)])
 
         with Watcher(self.taskManagerMock) as sut:
             with Waiter(EventHandler, "on_created") as waiter:
@@ -74,7 +79,7 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_addsUpdateTask_whenFileInDirectoryIsCreated(self, mediaType, filePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.UpdateLibrary(mediaSource)
+        expected = tasks.UpdateLibrary(mediaSource, [self.getFullFileDirPath(filePath)])
         self.createFileDir(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -115,6 +120,45 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
 
         self.taskAddMock.assert_not_called()
 
+    def test_addsSingleUpdateTask_whenMultipleFilesInDirectoryAreCreated(self):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        expected = tasks.UpdateLibrary(mediaSource, [self.getFullFileDirPath("video/movie.mkv")])
+        self.createDir("video")
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([mediaSource])
+                for i in range(10):
+                    self.createFile("video/movie-%i.mkv" % i)
+                waiter.wait(times=10)
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+    @parameterized.expand(
+        [
+            (None, True),
+            (False, True),
+            (True, False),
+        ]
+    )
+    def test_consultsLibraryIndex_whenFileIsCreated(self, isInLibrary, expectUpdate):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        expected = tasks.UpdateLibrary(mediaSource, [self.tempDirPath])
+        libraryIndexMock = Mock(LibraryIndex)
+        libraryIndexMock.contains.return_value = isInLibrary
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([mediaSource], libraryIndex=libraryIndexMock)
+                self.createFile("movie.mkv")
+                waiter.wait()
+
+        libraryIndexMock.contains.assert_called_with(MediaType.video, os.path.join(self.tempDirPath, "movie.mkv"))
+        if expectUpdate:
+            self.taskAddMock.assert_called_once_with(expected)
+        else:
+            self.taskAddMock.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,12 @@
+import os
+import shutil
 import sys
+import tempfile
 import unittest
+from unittest.mock import Mock
 import resources.lib.tasks as tasks
 from resources.lib.library import MediaSource, MediaType
+from resources.lib.library_index import LibraryIndex
 from resources.lib.watcher import EventHandler, Watcher
 from parameterized import parameterized
 from tests.support import Waiter
@@ -10,6 +15,31 @@ from tests.test_watcher.support import WatcherTestCaseBase
 
 @unittest.skipIf(sys.platform.startswith("win"), "Unix-like OS specific tests.")
 class Watcher_DeleteEventOnReasonableOperatingSystems_TestCase(WatcherTestCaseBase, unittest.TestCase):
+    @parameterized.expand(
+        [
+            (None, True),
+            (True, True),
+            (False, False),
+        ]
+    )
+    def test_consultsLibraryIndex_whenFileIsDeleted(self, isInLibrary, expectClean):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        expected = tasks.CleanLibrary(mediaSource, [self.tempDirPath])
+        libraryIndexMock = Mock(LibraryIndex)
+        libraryIndexMock.contains.return_value = isInLibrary
+        self.createFile("movie.mkv")
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_deleted") as waiter:
+                sut.watch([mediaSource], libraryIndex=libraryIndexMock)
+                self.deleteFile("movie.mkv")
+                waiter.wait()
+
+        if expectClean:
+            self.taskAddMock.assert_called_once_with(expected)
+        else:
+            self.taskAddMock.assert_not_called()
+
     @parameterized.expand(
         [
             (MediaType.video, "movie.mkv"),
@@ -18,7 +48,7 @@ class Watcher_DeleteEventOnReasonableOperatingSystems_TestCase(WatcherTestCaseBa
     )
     def test_addsCleanTask_whenFileIsDeleted(self, mediaType, filePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -53,24 +83,83 @@ class Watcher_DeleteEventOnReasonableOperatingSystems_TestCase(WatcherTestCaseBa
 
     @parameterized.expand(
         [
-            (MediaType.video, "video"),
-            (MediaType.video, ".video"),
-            (MediaType.music, "music"),
-            (MediaType.music, ".music"),
+            (MediaType.video, "video", None),
+            (MediaType.video, "video", True),
+            (MediaType.music, "music", None),
+            (MediaType.music, "music", True),
         ]
     )
-    def test_doesNotAddAnyTasks_whenDirectoryIsDeleted(self, mediaType, dirPath):
+    def test_addsCleanTask_whenDirectoryIsDeleted(self, mediaType, dirPath, hasItems):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
+        cleanPaths = [os.path.join(self.tempDirPath, dirPath)] if mediaType == MediaType.video else []
+        expected = tasks.CleanLibrary(mediaSource, cleanPaths)
+        libraryIndexMock = Mock(LibraryIndex)
+        libraryIndexMock.hasItemsInDirectory.return_value = hasItems
         self.createDir(dirPath)
 
         with Watcher(self.taskManagerMock) as sut:
             with Waiter(EventHandler, "on_deleted") as waiter:
-                sut.watch([mediaSource])
+                sut.watch([mediaSource], libraryIndex=libraryIndexMock)
+                self.deleteDir(dirPath)
+                waiter.wait()
+
+        libraryIndexMock.hasItemsInDirectory.assert_called_once_with(
+            mediaType, os.path.join(self.tempDirPath, dirPath)
+        )
+        self.taskAddMock.assert_called_once_with(expected)
+
+    @parameterized.expand(
+        [
+            (MediaType.video, "video", False),
+            (MediaType.video, ".video", True),
+            (MediaType.music, "music", False),
+            (MediaType.music, ".music", True),
+        ]
+    )
+    def test_doesNotAddAnyTasks_whenDirectoryIsDeleted(self, mediaType, dirPath, hasItems):
+        mediaSource = MediaSource(self.tempDirPath, mediaType)
+        libraryIndexMock = Mock(LibraryIndex)
+        libraryIndexMock.hasItemsInDirectory.return_value = hasItems
+        self.createDir(dirPath)
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_deleted") as waiter:
+                sut.watch([mediaSource], libraryIndex=libraryIndexMock)
                 self.deleteDir(dirPath)
                 waiter.wait()
 
         self.taskAddMock.assert_not_called()
 
+    def test_addsSingleCleanTask_whenDirectoryTreeIsDeleted(self):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        expected = tasks.CleanLibrary(mediaSource, [os.path.join(self.tempDirPath, "show")])
+        for season in range(5):
+            os.makedirs(os.path.join(self.tempDirPath, "show", "season-%i" % season))
+            for episode in range(10):
+                self.createFile("show/season-%i/episode-%i.mkv" % (season, episode))
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_deleted") as waiter:
+                sut.watch([mediaSource])
+                shutil.rmtree(os.path.join(self.tempDirPath, "show"))
+                waiter.wait(times=56)
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+    def test_addsCleanTask_whenDirectoryIsMovedOut(self):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        expected = tasks.CleanLibrary(mediaSource, [os.path.join(self.tempDirPath, "show")])
+        self.createFile("show/episode.mkv")
+
+        with tempfile.TemporaryDirectory() as outsideDirPath:
+            with Watcher(self.taskManagerMock) as sut:
+                with Waiter(EventHandler, "on_deleted") as waiter:
+                    sut.watch([mediaSource])
+                    os.rename(os.path.join(self.tempDirPath, "show"), os.path.join(outsideDirPath, "show"))
+                    waiter.wait()
+
+        self.taskAddMock.assert_called_once_with(expected)
+
     @parameterized.expand(
         [
             (MediaType.video, "video/movie.mkv"),
@@ -79,7 +168,7 @@ class Watcher_DeleteEventOnReasonableOperatingSystems_TestCase(WatcherTestCaseBa
     )
     def test_addsCleanTask_whenFileInDirectoryIsDeleted(self, mediaType, filePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -150,7 +239,7 @@ class Watcher_DeleteEventOnWindows_TestCase(WatcherTestCaseBase, unittest.TestCa
     )
     def test_addsCleanTask_whenFileIsDeleted(self, mediaType, filePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -189,7 +278,7 @@ class Watcher_DeleteEventOnWindows_TestCase(WatcherTestCaseBase, unittest.TestCa
     )
     def test_addsCleanTask_whenDirectoryIsDeleted(self, mediaType, dirPath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, dirPath))
         self.createDir(dirPath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -228,7 +317,7 @@ class Watcher_DeleteEventOnWindows_TestCase(WatcherTestCaseBase, unittest.TestCa
     )
     def test_addsCleanTask_whenFileInDirectoryIsDeleted(self, mediaType, filePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
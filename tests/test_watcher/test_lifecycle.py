@@ -2,9 +2,11 @@ import os
 import threading
 import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, PropertyMock, patch
 import resources.lib.tasks as tasks
-from resources.lib.library import MediaSource, MediaType
+from resources.lib.library import MediaClassifier, MediaSource, MediaType
+from resources.lib.settings import Settings
+from resources.lib.snapshots import SnapshotStore
 from resources.lib.watcher import EventHandler, Watcher
 from tests.support import Waiter
 from tests.test_watcher.support import WatcherTestCaseBase
@@ -14,7 +16,7 @@ class Watcher_Start_TestCase(WatcherTestCaseBase, unittest.TestCase):
     def test_watchesForChangesInExistingMediaSources_whenBothExistingAndNonExistingMediaSourcesAdded(self):
         mediaSource1 = MediaSource(os.path.join(self.tempDirPath, "video"), MediaType.video)
         mediaSource2 = MediaSource(os.path.join(self.tempDirPath, "missing-dir"), MediaType.video)
-        expected = tasks.UpdateLibrary(mediaSource1)
+        expected = tasks.UpdateLibrary(mediaSource1, [mediaSource1.path])
         self.createDir("video")
 
         with Watcher(self.taskManagerMock) as sut:
@@ -25,6 +27,321 @@ class Watcher_Start_TestCase(WatcherTestCaseBase, unittest.TestCase):
 
         self.taskAddMock.assert_called_once_with(expected)
 
+    def test_watchesForChanges_whenNotWaitingForWatchesToBeInstalled(self):
+        mediaSource = MediaSource(os.path.join(self.tempDirPath, "video"), MediaType.video)
+        expected = tasks.UpdateLibrary(mediaSource, [mediaSource.path])
+        self.createDir("video")
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([mediaSource], wait=False)
+                while mediaSource.path not in sut.routers:
+                    time.sleep(0.01)
+                self.createFile("video/movie.mkv")
+                waiter.wait()
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+
+@patch.object(Watcher, "POLLING_INTERVAL", new_callable=PropertyMock, return_value=0.1)
+class Watcher_Backend_TestCase(WatcherTestCaseBase, unittest.TestCase):
+    @patch("resources.lib.watcher.getFileSystemType", return_value="nfs4")
+    def test_watchesForChangesWithPolling_whenMediaSourceIsOnNetworkFileSystem(self, *args):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        expected = tasks.UpdateLibrary(mediaSource, [mediaSource.path])
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([mediaSource])
+                self.createFile("movie.mkv")
+                waiter.wait()
+
+            self.assertEqual(len(sut.pollingObservers), 1)
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+    @patch("resources.lib.watcher.getFileSystemType", return_value="ext4")
+    def test_watchesForChangesWithNativeObserver_whenMediaSourceIsOnLocalFileSystem(self, *args):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([mediaSource])
+
+            self.assertEqual(len(sut.pollingObservers), 0)
+            self.assertEqual(len(sut.observer.emitters), 1)
+
+    @patch("resources.lib.watcher.getInotifyWatchLimit", return_value=10)
+    @patch("resources.lib.watcher.getFileSystemType", return_value="ext4")
+    def test_watchesForChangesWithPolling_whenNotEnoughInotifyWatchesAreLeft(self, *args):
+        mediaSource1 = MediaSource(os.path.join(self.tempDirPath, "movies"), MediaType.video)
+        mediaSource2 = MediaSource(os.path.join(self.tempDirPath, "tv"), MediaType.video)
+        expected = tasks.UpdateLibrary(
+            mediaSource2, [os.path.join(mediaSource2.path, "1", "2", "3", "4", "5", "6", "7", "8")]
+        )
+        # 5 watches for movies and 9 for tv, which is more than 80% of the limit
+        os.makedirs(os.path.join(mediaSource1.path, "1", "2", "3", "4"))
+        os.makedirs(os.path.join(mediaSource2.path, "1", "2", "3", "4", "5", "6", "7", "8"))
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([mediaSource1, mediaSource2])
+                self.createFile("tv/1/2/3/4/5/6/7/8/episode.mkv")
+                waiter.wait()
+
+            self.assertEqual(len(sut.observer.emitters), 1)
+            self.assertEqual(len(sut.pollingObservers), 1)
+            self.assertEqual(sut.inotifyWatches, {mediaSource1.path: 5})
+
+        self.taskAddMock.assert_called_once_with(
+            tasks.UpdateLibrary(
+                mediaSource2, [os.path.join(mediaSource2.path, "1", "2", "3", "4", "5", "6", "7", "8")]
+            )
+        )
+
+    @patch("resources.lib.watcher.getFileSystemType", return_value="nfs4")
+    def test_watchesForChangesInExistingMediaSources_whenNetworkMediaSourceDoesNotExist(self, *args):
+        mediaSource1 = MediaSource(os.path.join(self.tempDirPath, "video"), MediaType.video)
+        mediaSource2 = MediaSource(os.path.join(self.tempDirPath, "missing-dir"), MediaType.video)
+        self.createDir("video")
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([mediaSource1, mediaSource2])
+
+            self.assertEqual(len(sut.pollingObservers), 1)
+
+    @patch("resources.lib.watcher.getFileSystemType", return_value="nfs4")
+    def test_endsPollingThreads_afterClear(self, *args):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([mediaSource])
+            threadCount = threading.active_count()
+            sut.clear()
+
+            self.assertEqual(len(sut.pollingObservers), 0)
+            self.assertLess(threading.active_count(), threadCount)
+
+    @patch("resources.lib.watcher.getFileSystemType", return_value="nfs4")
+    def test_endsItsOwnThread_afterExitingTheWithContext(self, *args):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([mediaSource])
+
+        self.assertEqual(threading.active_count(), 1)
+
+
+class Watcher_NestedMediaSources_TestCase(WatcherTestCaseBase, unittest.TestCase):
+    def test_watchesTopMostDirectoryOnly_whenMediaSourcesAreNested(self):
+        mediaSource1 = MediaSource(self.tempDirPath, MediaType.video)
+        mediaSource2 = MediaSource(os.path.join(self.tempDirPath, "anime"), MediaType.video)
+        mediaSource3 = MediaSource(self.tempDirPath, MediaType.music)
+        self.createDir("anime")
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([mediaSource1, mediaSource2, mediaSource3, mediaSource1])
+
+            self.assertEqual(len(sut.observer.emitters), 1)
+
+    def test_addsUpdateTaskForEachMediaSource_whenFileInNestedMediaSourceIsCreated(self):
+        mediaSource1 = MediaSource(self.tempDirPath, MediaType.video)
+        mediaSource2 = MediaSource(os.path.join(self.tempDirPath, "anime"), MediaType.video)
+        self.createDir("anime")
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([mediaSource1, mediaSource2])
+                self.createFile("anime/episode.mkv")
+                waiter.wait(times=2)
+
+        self.assertEqual(
+            set(c.args[0].mediaSource for c in self.taskAddMock.call_args_list), {mediaSource1, mediaSource2}
+        )
+
+    def test_addsUpdateAndCleanTask_whenFileIsMovedBetweenNestedMediaSources(self):
+        mediaSource1 = MediaSource(self.tempDirPath, MediaType.video)
+        mediaSource2 = MediaSource(os.path.join(self.tempDirPath, "anime"), MediaType.video)
+        expected = [
+            tasks.UpdateLibrary(mediaSource1, [mediaSource2.path]),
+            tasks.CleanLibrary(mediaSource1, [self.tempDirPath]),
+            tasks.UpdateLibrary(mediaSource2, [mediaSource2.path]),
+        ]
+        self.createDir("anime")
+        self.createFile("episode.mkv")
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_moved") as movedWaiter, Waiter(EventHandler, "on_created") as createdWaiter:
+                sut.watch([mediaSource1, mediaSource2])
+                self.renamePath("episode.mkv", "anime/episode.mkv")
+                movedWaiter.wait()
+                createdWaiter.wait()
+
+        self.assertCountEqual([c.args[0] for c in self.taskAddMock.call_args_list], expected)
+
+
+class Watcher_Update_TestCase(WatcherTestCaseBase, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.videoSource = MediaSource(os.path.join(self.tempDirPath, "video"), MediaType.video)
+        self.musicSource = MediaSource(os.path.join(self.tempDirPath, "music"), MediaType.music)
+        self.createDir("video")
+        self.createDir("music")
+
+    def test_keepsWatchesOfMediaSourcesThatAreStillWatched(self):
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([self.videoSource, self.musicSource])
+            videoRouter = sut.routers[self.videoSource.path]
+            sut.update([self.videoSource])
+
+            self.assertEqual(list(sut.routers), [self.videoSource.path])
+            self.assertIs(sut.routers[self.videoSource.path], videoRouter)
+            self.assertEqual(len(sut.observer.emitters), 1)
+
+    def test_watchesAddedMediaSources(self):
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([self.videoSource])
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.update([self.videoSource, self.musicSource])
+                self.createFile("music/song.mp3")
+                waiter.wait()
+
+            self.assertEqual(len(sut.observer.emitters), 2)
+
+        self.taskAddMock.assert_called_once_with(tasks.UpdateLibrary(self.musicSource, [self.musicSource.path]))
+
+    def test_usesNewMediaClassifierInKeptMediaSources(self):
+        mediaClassifierMock = Mock(MediaClassifier)
+        mediaClassifierMock.isSupported.return_value = True
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([self.videoSource])
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.update([self.videoSource], mediaClassifierMock)
+                self.createFile("video/movie.xyz")
+                waiter.wait()
+
+        self.taskAddMock.assert_called_once_with(tasks.UpdateLibrary(self.videoSource, [self.videoSource.path]))
+
+    def test_doesNotWaitForInstalls_whenNotWaitingForUpdate(self):
+        installStarted = threading.Event()
+        installReleased = threading.Event()
+
+        def install(*args, **kwargs):
+            installStarted.set()
+            installReleased.wait(1)
+
+        with Watcher(self.taskManagerMock) as sut:
+            with patch.object(sut, "_install", install):
+                sut.watch([self.videoSource], wait=False)
+                self.assertTrue(installStarted.wait(1))
+                startTime = time.monotonic()
+                sut.update([self.videoSource, self.musicSource], wait=False)
+
+                self.assertLess(time.monotonic() - startTime, 0.5)
+                installReleased.set()
+
+    def test_removesTasksOfRemovedMediaSourcesOnly(self):
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([self.videoSource, self.musicSource])
+            sut.update([self.videoSource])
+
+        self.taskManagerMock.removeTasks.assert_called_once_with({self.musicSource})
+
+    def test_rewatchesTopMostDirectory_whenNestedMediaSourceIsAdded(self):
+        nestedSource = MediaSource(os.path.join(self.tempDirPath, "video", "anime"), MediaType.video)
+        self.createDir("video/anime")
+
+        with Watcher(self.taskManagerMock) as sut:
+            sut.watch([self.videoSource, self.musicSource])
+            musicRouter = sut.routers[self.musicSource.path]
+            sut.update([self.videoSource, nestedSource, self.musicSource])
+
+            self.assertIs(sut.routers[self.musicSource.path], musicRouter)
+            self.assertEqual(
+                sut.routers[self.videoSource.path].getMediaSources(), frozenset([self.videoSource, nestedSource])
+            )
+            self.assertEqual(len(sut.observer.emitters), 2)
+
+        self.taskManagerMock.removeTasks.assert_not_called()
+
+    @patch("resources.lib.watcher.getFileSystemType", return_value="nfs4")
+    def test_rewatchesPolledDirectories_whenPollingIntervalChanges(self, *args):
+        settingsMock = Mock(Settings)
+        settingsMock.getPollingInterval.return_value = 30
+
+        with Watcher(self.taskManagerMock, settingsMock) as sut:
+            sut.watch([self.videoSource])
+            pollingObserver = sut.pollingObservers[0]
+            settingsMock.getPollingInterval.return_value = 60
+            sut.update([self.videoSource])
+
+            self.assertEqual(len(sut.pollingObservers), 1)
+            self.assertIsNot(sut.pollingObservers[0], pollingObserver)
+            self.assertEqual(sut.routers[self.videoSource.path].pollingInterval, 60)
+
+
+class Watcher_Snapshots_TestCase(WatcherTestCaseBase, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.taskManagerMock.isIdle.return_value = True
+        self.snapshotStore = SnapshotStore(os.path.join(self.tempDirPath, ".snapshots"))
+        self.mediaSource = MediaSource(os.path.join(self.tempDirPath, "video"), MediaType.video)
+        self.createDir("video")
+
+    def test_storesSnapshot_afterExitingTheWithContext(self):
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.assertIsNotNone(self.snapshotStore.load(self.mediaSource))
+
+    def test_addsUpdateTask_whenFileCreatedWhileNotWatching(self):
+        expected = tasks.UpdateLibrary(self.mediaSource, [self.mediaSource.path])
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.createFile("video/movie.mkv")
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+    def test_addsCleanTask_whenFileDeletedWhileNotWatching(self):
+        expected = tasks.CleanLibrary(self.mediaSource, [self.mediaSource.path])
+        self.createFile("video/movie.mkv")
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.deleteFile("video/movie.mkv")
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+    def test_doesNotAddTasks_whenNothingChangedWhileNotWatching(self):
+        self.createFile("video/movie.mkv")
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.taskAddMock.assert_not_called()
+
+    def test_addsUpdateTaskAgain_whenTasksWereNotExecutedBeforeExitingTheWithContext(self):
+        expected = tasks.UpdateLibrary(self.mediaSource, [self.mediaSource.path])
+        self.taskManagerMock.isIdle.return_value = False
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            with Waiter(EventHandler, "on_created") as waiter:
+                sut.watch([self.mediaSource])
+                self.createFile("video/movie.mkv")
+                waiter.wait()
+
+        self.taskManagerMock.isIdle.return_value = True
+        with Watcher(self.taskManagerMock, snapshotStore=self.snapshotStore) as sut:
+            sut.watch([self.mediaSource])
+
+        self.assertEqual(self.taskAddMock.call_count, 2)
+        self.taskAddMock.assert_called_with(expected)
+
 
 class Watcher_Dispose_TestCase(WatcherTestCaseBase, unittest.TestCase):
     def test_doesNotWatchForChanges_afterClear(self):
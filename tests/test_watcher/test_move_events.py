@@ -1,9 +1,13 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import call
+from unittest.mock import Mock, call
 import resources.lib.tasks as tasks
-from resources.lib.library import MediaSource, MediaType
+from resources.lib.library import MediaClassifier, MediaSource, MediaType
+from resources.lib.library_index import LibraryIndex
 from resources.lib.watcher import EventHandler, Watcher
 from parameterized import parameterized
+from watchdog.events import DirCreatedEvent
 from tests.support import Waiter
 from tests.test_watcher.support import WatcherTestCaseBase
 
@@ -19,8 +23,8 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_addsUpdateAndCleanTask_whenFileIsRenamed(self, mediaType, filePath, newFilePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected1 = tasks.UpdateLibrary(mediaSource)
-        expected2 = tasks.CleanLibrary(mediaSource)
+        expected1 = tasks.UpdateLibrary(mediaSource, [self.getFullFileDirPath(newFilePath)])
+        expected2 = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -50,7 +54,7 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_addsUpdateTask_whenFileIsRenamed(self, mediaType, filePath, newFilePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.UpdateLibrary(mediaSource)
+        expected = tasks.UpdateLibrary(mediaSource, [self.getFullFileDirPath(newFilePath)])
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -61,6 +65,21 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
 
         self.taskAddMock.assert_called_once_with(expected)
 
+    def test_addsNoTasks_whenFileIsRenamedBackToNameInLibrary(self):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        # Kodi knows the original file only
+        libraryIndexMock = Mock(LibraryIndex)
+        libraryIndexMock.contains.side_effect = lambda _, path: os.path.basename(path) == "movie.mkv"
+        self.createFile("movie-renamed.mkv")
+
+        with Watcher(self.taskManagerMock) as sut:
+            with Waiter(EventHandler, "on_moved") as waiter:
+                sut.watch([mediaSource], libraryIndex=libraryIndexMock)
+                self.renamePath("movie-renamed.mkv", "movie.mkv")
+                waiter.wait()
+
+        self.taskAddMock.assert_not_called()
+
     @parameterized.expand(
         [
             (MediaType.video, "movie.mkv", ".movie.mkv"),
@@ -69,7 +88,7 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_addsCleanTask_whenFileIsRenamed(self, mediaType, filePath, newFilePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -126,11 +145,13 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_doesNotAddAnyTasks_whenEmptyDirectoryIsRenamed(self, mediaType, dirPath, newDirPath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
+        libraryIndexMock = Mock(LibraryIndex)
+        libraryIndexMock.hasItemsInDirectory.return_value = False
         self.createDir(dirPath)
 
         with Watcher(self.taskManagerMock) as sut:
             with Waiter(EventHandler, "on_moved") as waiter:
-                sut.watch([mediaSource])
+                sut.watch([mediaSource], libraryIndex=libraryIndexMock)
                 self.renamePath(dirPath, newDirPath)
                 waiter.wait()
 
@@ -146,7 +167,7 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_addsUpdateTask_whenDirectoryWithFileIsRenamed(self, mediaType, filePath, newFilePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.UpdateLibrary(mediaSource)
+        expected = tasks.UpdateLibrary(mediaSource, [self.getFullFileDirPath(newFilePath)])
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -165,7 +186,7 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
     )
     def test_addsCleanTask_whenDirectoryWithFileIsRenamed(self, mediaType, filePath, newFilePath):
         mediaSource = MediaSource(self.tempDirPath, mediaType)
-        expected = tasks.CleanLibrary(mediaSource)
+        expected = tasks.CleanLibrary(mediaSource, self.getCleanPaths(mediaType, filePath))
         self.createFile(filePath)
 
         with Watcher(self.taskManagerMock) as sut:
@@ -176,6 +197,65 @@ class WatcherTestCase(WatcherTestCaseBase, unittest.TestCase):
 
         self.taskAddMock.assert_called_once_with(expected)
 
+    ## Directory moved in from outside of the media source scenarios
+
+    @parameterized.expand(
+        [
+            (MediaType.video, "show/season-1/episode.mkv", "show"),
+            (MediaType.music, "artist/album/song.mp3", "artist"),
+        ]
+    )
+    def test_addsUpdateTask_whenDirectoryWithFileIsMovedIn(self, mediaType, filePath, dirPath):
+        mediaSource = MediaSource(self.tempDirPath, mediaType)
+        expected = tasks.UpdateLibrary(mediaSource, [os.path.join(self.tempDirPath, dirPath)])
+
+        with tempfile.TemporaryDirectory() as outsideDirPath:
+            os.makedirs(os.path.join(outsideDirPath, os.path.dirname(filePath)))
+            open(os.path.join(outsideDirPath, filePath), "wb").close()
+
+            with Watcher(self.taskManagerMock) as sut:
+                with Waiter(EventHandler, "on_created") as waiter:
+                    sut.watch([mediaSource])
+                    os.rename(os.path.join(outsideDirPath, dirPath), os.path.join(self.tempDirPath, dirPath))
+                    waiter.wait()
+
+        self.taskAddMock.assert_called_once_with(expected)
+
+    @parameterized.expand(
+        [
+            (MediaType.video, "show/season-1/episode.nfo", "show"),
+            (MediaType.video, "show/.season-1/episode.mkv", "show"),
+            (MediaType.video, ".show/season-1/episode.mkv", ".show"),
+            (MediaType.music, "artist/album/cover.jpg", "artist"),
+        ]
+    )
+    def test_doesNotAddAnyTasks_whenDirectoryWithoutMediaFilesIsMovedIn(self, mediaType, filePath, dirPath):
+        mediaSource = MediaSource(self.tempDirPath, mediaType)
+
+        with tempfile.TemporaryDirectory() as outsideDirPath:
+            os.makedirs(os.path.join(outsideDirPath, os.path.dirname(filePath)))
+            open(os.path.join(outsideDirPath, filePath), "wb").close()
+
+            with Watcher(self.taskManagerMock) as sut:
+                with Waiter(EventHandler, "on_created") as waiter:
+                    sut.watch([mediaSource])
+                    os.rename(os.path.join(outsideDirPath, dirPath), os.path.join(self.tempDirPath, dirPath))
+                    waiter.wait()
+
+        self.taskAddMock.assert_not_called()
+
+    def test_probesDirectoryForMediaFiles_whenDirectoryIsCreated(self):
+        mediaSource = MediaSource(self.tempDirPath, MediaType.video)
+        batcherMock = Mock()
+        sut = EventHandler(batcherMock, mediaSource, MediaClassifier())
+        os.makedirs(os.path.join(self.tempDirPath, "show", "season-1", "extras"))
+        self.createFile("show/season-1/extras/readme.txt")
+        self.createFile("show/season-1/episode.mkv")
+
+        sut.dispatch(DirCreatedEvent(os.path.join(self.tempDirPath, "show")))
+
+        batcherMock.addUpdate.assert_called_once_with(mediaSource, os.path.join(self.tempDirPath, "show"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock, PropertyMock, patch
+from resources.lib.scheduling import Scheduler
+from resources.lib.write_tracking import WriteTracker
+
+
+@patch.object(WriteTracker, "CHECK_INTERVAL", new_callable=PropertyMock, return_value=0.05)
+class WriteTracker_TestCase(unittest.TestCase):
+    def setUp(self):
+        self.callbackMock = Mock()
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.dirPath = os.path.join(self.tempDir.name, "Show", "Season 1")
+        os.makedirs(self.dirPath)
+        self.filePath = os.path.join(self.dirPath, "episode.mkv")
+        with open(self.filePath, "wb"):
+            pass
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.tempDir.cleanup()
+
+    def test_hasPendingWrites_inDirectoryAndItsParents(self, *args):
+        sut = WriteTracker(self.scheduler, self.callbackMock)
+
+        sut.track(self.filePath)
+
+        self.assertTrue(sut.hasPendingWrites(self.dirPath))
+        self.assertTrue(sut.hasPendingWrites(os.path.join(self.tempDir.name, "Show")))
+        self.assertFalse(sut.hasPendingWrites(os.path.join(self.tempDir.name, "Sho")))
+        self.assertFalse(sut.hasPendingWrites(os.path.join(self.dirPath, "Extras")))
+        self.assertEqual(sut.count(), 1)
+
+    def test_hasNoPendingWrites_whenFileIsCompleted(self, *args):
+        sut = WriteTracker(self.scheduler, self.callbackMock)
+
+        sut.track(self.filePath)
+        sut.complete(self.filePath)
+
+        self.assertFalse(sut.hasPendingWrites(self.dirPath))
+        self.callbackMock.assert_called_once_with()
+
+    def test_hasNoPendingWrites_whenFileIsDeleted(self, *args):
+        sut = WriteTracker(self.scheduler, self.callbackMock)
+
+        sut.track(self.filePath)
+        os.remove(self.filePath)
+        time.sleep(0.1)
+
+        self.assertFalse(sut.hasPendingWrites(self.dirPath))
+        self.callbackMock.assert_called_once_with()
+
+    def test_doesNotCallCallback_whenUntrackedFileIsCompleted(self, *args):
+        sut = WriteTracker(self.scheduler, self.callbackMock)
+
+        sut.complete(self.filePath)
+
+        self.callbackMock.assert_not_called()
+
+    def test_hasNoPendingWrites_afterClear(self, *args):
+        sut = WriteTracker(self.scheduler, self.callbackMock)
+
+        sut.track(self.filePath)
+        sut.clear()
+        time.sleep(0.1)
+
+        self.assertFalse(sut.hasPendingWrites(self.dirPath))
+        self.callbackMock.assert_not_called()
+
+    def test_canBeQueried_whileFilesAreChecked(self, *args):
+        sut = WriteTracker(self.scheduler, self.callbackMock)
+        sut.track(self.filePath)
+        checkStarted = threading.Event()
+        checkReleased = threading.Event()
+
+        def getFileState(path):
+            checkStarted.set()
+            checkReleased.wait(1)
+            return None
+
+        with patch("resources.lib.write_tracking._getFileState", getFileState):
+            self.assertTrue(checkStarted.wait(1))
+            # Would block until the check is done if it held the lock while checking files
+            self.assertTrue(sut.hasPendingWrites(self.dirPath))
+            checkReleased.set()
+            time.sleep(0.05)
+
+        self.assertFalse(sut.hasPendingWrites(self.dirPath))
+        self.callbackMock.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()